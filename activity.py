@@ -0,0 +1,150 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple
+from blueprint import BlueprintID
+from compiler import Wire, Netlist, compile_blueprint, generate_simulator, pack_vectors, unpack_vectors
+
+
+# Switching activity.
+# The activity counter runs a stream of input vectors through a compiled simulator whose
+# generated code also counts how many times every wire toggles. The patterns of a word
+# are consecutive states, so the toggles of a wire are the set bits of the word XOR the
+# same word shifted by one pattern (the last pattern of the previous call is shifted in
+# at the bottom), counted with int.bit_count. The counts are then summed per instance of
+# every sub-blueprint (over the wires driven by the gates inside it) and per BlueprintID,
+# which gives activity factors for power estimation.
+
+
+@dataclass
+class BlueprintActivity:
+    blueprint_id: BlueprintID
+    num_instances: int = 0
+    num_wires: int = 0 # wires driven inside all the instances
+    toggles: int = 0
+
+
+@dataclass
+class ActivityReport:
+    netlist: Netlist
+    num_patterns: int
+    wire_toggles: List[int] # toggles of every wire (indexed by wire)
+    instance_toggles: List[int] = field(default_factory=list) # toggles of the wires driven inside every instance
+    instance_wires: List[int] = field(default_factory=list)
+    by_blueprint: Dict[BlueprintID, BlueprintActivity] = field(default_factory=dict)
+
+    def __post_init__(self):
+        netlist = self.netlist
+        self.instance_toggles = [0] * len(netlist.instances)
+        self.instance_wires = [0] * len(netlist.instances)
+        for gate in netlist.gates:
+            toggles = sum(self.wire_toggles[wire] for wire in gate.outputs)
+            gate_activity = self.by_blueprint.setdefault(gate.kind, BlueprintActivity(gate.kind))
+            gate_activity.num_instances += 1
+            gate_activity.num_wires += len(gate.outputs)
+            gate_activity.toggles += toggles
+            instance = gate.instance
+            while instance is not None:
+                self.instance_toggles[instance] += toggles
+                self.instance_wires[instance] += len(gate.outputs)
+                instance = netlist.instances[instance].parent
+        for index, instance in enumerate(netlist.instances):
+            instance_activity = self.by_blueprint.setdefault(instance.blueprint_id, BlueprintActivity(instance.blueprint_id))
+            instance_activity.num_instances += 1
+            instance_activity.num_wires += self.instance_wires[index]
+            instance_activity.toggles += self.instance_toggles[index]
+
+    @property
+    def blueprint_id(self) -> BlueprintID:
+        return self.netlist.blueprint_id
+
+    @property
+    def num_transitions(self) -> int:
+        return max(self.num_patterns - 1, 0)
+
+    def wire_activity(self, wire: Wire) -> float:
+        """Fraction of the transitions in which the wire toggled
+        """
+        return self.wire_toggles[wire] / self.num_transitions if self.num_transitions else 0.0
+
+    def instance_activity(self, instance: int) -> float:
+        """Average activity factor of the wires driven inside an instance
+        """
+        wires = self.instance_wires[instance]
+        return self.instance_toggles[instance] / (wires * self.num_transitions) if wires and self.num_transitions else 0.0
+
+    def activity_factor(self, blueprint_id: BlueprintID) -> float:
+        """Average activity factor of the wires driven inside every instance of a blueprint
+        """
+        activity = self.by_blueprint.get(blueprint_id)
+        if activity is None or not activity.num_wires or not self.num_transitions:
+            return 0.0
+        return activity.toggles / (activity.num_wires * self.num_transitions)
+
+    def hottest_wires(self, count: int = 10) -> List[Tuple[str, int]]:
+        """Hierarchical names and toggle counts of the most active wires
+        """
+        wires = sorted(range(2, self.netlist.num_wires), key=lambda wire: -self.wire_toggles[wire])[:count]
+        return [(self.netlist.wire_name(wire), self.wire_toggles[wire]) for wire in wires]
+
+
+class ActivityCounter:
+    """A compiled blueprint that counts the toggles of every wire across a stream of
+    vectors. Successive calls continue the same stream, so one counter should only be
+    fed by one stream (and one thread) at a time.
+    """
+
+    def __init__(self, blueprint_id: BlueprintID, mode: str = 'debug'):
+        self.netlist = compile_blueprint(blueprint_id, mode).netlist
+        self._simulate = generate_simulator(self.netlist, count_activity=True)
+        self.reset()
+
+    @property
+    def blueprint_id(self) -> BlueprintID:
+        return self.netlist.blueprint_id
+
+    @property
+    def num_inputs(self) -> int:
+        return self.netlist.num_inputs
+
+    @property
+    def num_outputs(self) -> int:
+        return self.netlist.num_outputs
+
+    def reset(self):
+        """Clear the counts and start a new stream
+        """
+        self.toggles = [0] * self.netlist.num_wires
+        self._last = [0] * self.netlist.num_wires
+        self.num_patterns = 0
+
+    def evaluate_packed(self, inputs: List[int], count: int) -> List[int]:
+        """Evaluate the next count patterns of the stream, counting toggles
+        """
+        if len(inputs) != self.num_inputs:
+            raise ValueError(f'Incorrect number of inputs provided for evaluation of blueprint {self.blueprint_id} (expected {self.num_inputs}, got {len(inputs)})')
+        if count <= 0:
+            return [0] * self.num_outputs
+        mask = (1 << count) - 1
+        outputs, _ = self._simulate([word & mask for word in inputs], mask, self.toggles, self._last, self.num_patterns == 0)
+        self.num_patterns += count
+        return list(outputs)
+
+    def evaluate(self, inputs: List[bool]) -> List[bool]:
+        return [bool(word) for word in self.evaluate_packed([1 if value else 0 for value in inputs], 1)]
+
+    def evaluate_batch(self, vectors: List[List[bool]]) -> List[List[bool]]:
+        if not vectors:
+            return []
+        outputs = self.evaluate_packed(pack_vectors(vectors, self.num_inputs), len(vectors))
+        return unpack_vectors(outputs, len(vectors))
+
+    def report(self) -> ActivityReport:
+        return ActivityReport(self.netlist, self.num_patterns, list(self.toggles))
+
+
+def measure_activity(blueprint_id: BlueprintID, vectors: List[List[bool]], mode: str = 'debug') -> ActivityReport:
+    """Switching activity of a blueprint over a sequence of input vectors
+    """
+    counter = ActivityCounter(blueprint_id, mode)
+    counter.evaluate_batch(vectors)
+    return counter.report()
@@ -1,9 +1,9 @@
-from blueprint import Blueprint, register_blueprint, SinkPort, SourcePort
+from blueprint import define_blueprint, SinkPort, SourcePort
 
 
 # an half adder that takes two 1-bit inputs and produces a 2-bit output (sum and carry)
 # The sum is XOR(a, b) and the carry is AND(a, b)
-register_blueprint(Blueprint(
+define_blueprint(
     _id='HALF_ADDER',
     _node_list=['XOR', 'AND'], 
     num_inputs=2, 
@@ -18,7 +18,6 @@ register_blueprint(Blueprint(
                 SinkPort(1, 0): SourcePort(None, 0),
                 SinkPort(1, 1): SourcePort(None, 1)}
     )
-)
 
 # a full adder that takes two 1-bit inputs and a carry input and produces a 2-bit output (sum and carry)
 # Input is a, b, carry
@@ -28,7 +27,7 @@ register_blueprint(Blueprint(
 # S2,C2 = HALF_ADDER(S1, carry)
 # SUM = S2
 # CARRY = OR(C1, C2)
-register_blueprint(Blueprint(
+define_blueprint(
     _id='FULL_ADDER',
     _node_list=['HALF_ADDER', 'HALF_ADDER', 'OR'],
     num_inputs=3,
@@ -48,13 +47,12 @@ register_blueprint(Blueprint(
                 
                 }
     )
-)
 
 #2-bit Full Adder
 # an 2-bit adder that takes two 2-bit inputs and produces a 3-bit output (2b sum and 1b carry)
 # Input is a0, a1, b0, b1, carry
 
-register_blueprint(Blueprint(
+define_blueprint(
     _id='2BIT_FULL_ADDER',
     _node_list=['FULL_ADDER', 'FULL_ADDER'],
     num_inputs=5,
@@ -80,13 +78,13 @@ register_blueprint(Blueprint(
             SinkPort(0, 1): SourcePort(None, 2),
             SinkPort(1, 1): SourcePort(None, 3)
         }
-))
+)
 
 #4-bit Full Adder
 # an 4-bit adder that takes two 4-bit inputs and produces a 5-bit output (4b sum and 1b carry)
 # Input is a0, a1, a2, a3, b0, b1, b2, b3, carry
 
-register_blueprint(Blueprint(
+define_blueprint(
     _id='4BIT_FULL_ADDER',
     _node_list=['2BIT_FULL_ADDER', '2BIT_FULL_ADDER'],
     num_inputs=9,
@@ -119,7 +117,7 @@ register_blueprint(Blueprint(
         SinkPort(1, 3): SourcePort(None, 7)
 
     }
-))
+)
 
 # an 8-bit adder that takes two 8-bit inputs and produces a 9-bit output (8b sum and 1b carry)
 # Input is a0, a1...a7, b0, b1...b7, carry
@@ -130,7 +128,7 @@ register_blueprint(Blueprint(
 # S7,C8 = FULL_ADDER(a7, b7, C7)
 # SUM = S0, S1...S7
 # CARRY_OUT = C8
-register_blueprint(Blueprint(
+define_blueprint(
     _id='8BIT_FULL_ADDER',
     _node_list=['4BIT_FULL_ADDER', '4BIT_FULL_ADDER'],
     num_inputs=17,
@@ -174,11 +172,10 @@ register_blueprint(Blueprint(
         SinkPort(1, 7): SourcePort(None, 15)
     }
     )
-)
 
 # #8-bit Adder-Subtractor 
 # #Converts carry in to subtractor mode using 2's complement (XORing B inputs)
-register_blueprint(Blueprint(
+define_blueprint(
     _id='8BIT_FULL_ADDER-SUBTRACTOR',
     _node_list=['8BIT_FULL_ADDER', 'XOR', 'XOR', 'XOR', 'XOR', 'XOR', 'XOR', 'XOR', 'XOR'],
     num_inputs=17,
@@ -250,5 +247,4 @@ register_blueprint(Blueprint(
             SinkPort(None, 8): SourcePort(0, 8)
             
         }
-    )
-)
\ No newline at end of file
+    )
\ No newline at end of file
@@ -0,0 +1,68 @@
+from __future__ import annotations
+from typing import List
+from blueprint import Blueprint, register_blueprint_source
+from builder import BlueprintBuilder
+
+# 8-bit ALU, composed from the library blocks: the adder-subtractor, the bitwise AND, OR
+# and NOT, the two shifters, and two 2X4BIT_DECODERs (one enabled for each value of the
+# top op bit) turning the 3-bit op code into one select line per operation. Every unit
+# computes its result, each result is ANDed with its select line and the gated results
+# are ORed together; the ALU also outputs a carry (carry out of the adder-subtractor, or
+# the bit shifted out) and a zero flag.
+
+ALU_OPS = ['ADD', 'SUB', 'AND', 'OR', 'NOT', 'SHL', 'SHR', 'MOV'] # op code = index
+ALU_OP_CODES = {op: code for code, op in enumerate(ALU_OPS)}
+
+
+def _labels(prefix: str, count: int) -> List[str]:
+    return [f'{prefix}{bit}' for bit in range(count)]
+
+
+def build_alu() -> Blueprint:
+    # inputs: A0..A7, B0..B7, F0..F2 (op code); outputs: R0..R7, carry, zero
+    builder = BlueprintBuilder(19, 10, '8BIT_ALU', _labels('A', 8) + _labels('B', 8) + _labels('F', 3), _labels('R', 8) + ['C', 'Z'])
+    a, b = builder.input_bus(0, 8), builder.input_bus(8, 8)
+    f0, f1, f2 = builder.input_bus(16, 3)
+
+    # decoder inputs are (high bit, low bit, enable); output 3 - code is selected
+    not_f2 = builder.instantiate('NOT', [f2])[0]
+    low = builder.instantiate('2X4BIT_DECODER', [f1, f0, not_f2])
+    high = builder.instantiate('2X4BIT_DECODER', [f1, f0, f2])
+    select = [low[3 - code] for code in range(4)] + [high[3 - code] for code in range(4)]
+    select = dict(zip(ALU_OPS, select))
+
+    add_or_sub = builder.instantiate('OR', [select['ADD'], select['SUB']])[0]
+    sums = builder.instantiate('8BIT_FULL_ADDER-SUBTRACTOR', a + b + [select['SUB']])
+    left = builder.instantiate('8BIT_SHIFT_LEFT', a + [False])
+    right = builder.instantiate('8BIT_SHIFT_RIGHT', a + [False])
+    units = [
+        (add_or_sub, sums[:8]),
+        (select['AND'], builder.instantiate('8BIT_AND', a + b)),
+        (select['OR'], builder.instantiate('8BIT_OR', a + b)),
+        (select['NOT'], builder.instantiate('8BIT_NOT', a)),
+        (select['SHL'], left[:8]),
+        (select['SHR'], right[:8]),
+        (select['MOV'], b),
+    ]
+
+    result = None
+    for enable, word in units:
+        gated = builder.instantiate('8BIT_AND', word + [enable] * 8)
+        result = gated if result is None else builder.instantiate('8BIT_OR', result + gated)
+
+    carry = builder.instantiate('AND', [add_or_sub, sums[8]])[0]
+    for enable, shifted_out in ((select['SHL'], left[8]), (select['SHR'], right[8])):
+        carry = builder.instantiate('OR', [carry, builder.instantiate('AND', [enable, shifted_out])[0]])[0]
+
+    any_bit = result[0]
+    for bit in result[1:]:
+        any_bit = builder.instantiate('OR', [any_bit, bit])[0]
+    zero = builder.instantiate('NOT', [any_bit])[0]
+
+    builder.connect_bus(result, builder.output_bus(0, 8))
+    builder.connect(carry, builder.output(8))
+    builder.connect(zero, builder.output(9))
+    return builder.build(register=False)
+
+
+register_blueprint_source('8BIT_ALU', build_alu)
@@ -0,0 +1,125 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Dict
+from blueprint import Blueprint, BlueprintID, BlueprintRepository, SourcePort, SinkPort
+
+
+# Cost analytics for blueprints.
+# Everything here is computed bottom-up over the blueprint hierarchy and memoized per
+# BlueprintID, so a blueprint is only ever analysed once no matter how many times it
+# is instantiated. The fully expanded netlist is never built, which keeps these
+# numbers instant even for designs that expand to billions of gates.
+
+
+# Longest path (in embedded gates) from each source to a port. The key is the input
+# port of the blueprint the path starts at, or None for paths starting at a constant.
+PortDepths = Dict[int|None, int]
+
+
+@dataclass(frozen=True)
+class BlueprintStats:
+    blueprint_id: BlueprintID
+    nand_count: int # fully expanded number of NAND gates
+    gate_count: int # fully expanded number of embedded gates (NAND and any other embedded blueprint)
+    wire_count: int # fully expanded number of connections, counting every level of the hierarchy
+    max_depth: int # longest path through embedded gates from any input or constant to any output
+    hierarchy_depth: int # number of nesting levels below this blueprint (0 for embedded blueprints)
+    instance_counts: Dict[BlueprintID, int] # fully expanded number of instances of each sub-blueprint
+    output_depths: List[PortDepths] # for each output port, the longest path from each input port that reaches it
+
+
+_stats_cache: Dict[BlueprintID, BlueprintStats] = BlueprintRepository.register_derived_cache({})
+
+
+def _embedded_stats(blueprint: Blueprint) -> BlueprintStats:
+    # an embedded blueprint is a single gate: every output is one level away from every input
+    output_depths = [{port: 1 for port in range(blueprint.num_inputs)} for _ in range(blueprint.num_outputs)]
+    return BlueprintStats(
+        blueprint_id=blueprint.id,
+        nand_count=1 if blueprint.id == 'NAND' else 0,
+        gate_count=1,
+        wire_count=0,
+        max_depth=1 if blueprint.num_inputs > 0 else 0,
+        hierarchy_depth=0,
+        instance_counts={},
+        output_depths=output_depths)
+
+
+def _composite_stats(blueprint: Blueprint) -> BlueprintStats:
+    # all the sub-blueprints are already in the cache at this point
+    children = [_stats_cache[node_id] for node_id in blueprint._node_list]
+
+    nand_count = sum(child.nand_count for child in children)
+    gate_count = sum(child.gate_count for child in children)
+    wire_count = len(blueprint._connections) + sum(child.wire_count for child in children)
+    hierarchy_depth = 1 + max((child.hierarchy_depth for child in children), default=-1)
+
+    instance_counts: Dict[BlueprintID, int] = {}
+    for child in children:
+        instance_counts[child.blueprint_id] = instance_counts.get(child.blueprint_id, 0) + 1
+        for sub_id, count in child.instance_counts.items():
+            instance_counts[sub_id] = instance_counts.get(sub_id, 0) + count
+
+    # propagate path depths through the nodes in dependency order
+    node_output_depths: Dict[int, List[PortDepths]] = {}
+
+    def source_depths(source: SourcePort|bool) -> PortDepths:
+        if isinstance(source, bool):
+            return {None: 0}
+        if source.node is None:
+            return {source.port: 0}
+        return node_output_depths[source.node][source.port]
+
+    for node in blueprint.node_order():
+        child = children[node]
+        num_inputs = BlueprintRepository[blueprint._node_list[node]].num_inputs
+        input_depths = [source_depths(blueprint._connections[SinkPort(node, port)]) for port in range(num_inputs)]
+        outputs: List[PortDepths] = []
+        for child_output in child.output_depths:
+            depths: PortDepths = {}
+            for child_input, child_depth in child_output.items():
+                # paths from a constant inside the child start at the constant itself
+                for origin, depth in (input_depths[child_input].items() if child_input is not None else [(None, 0)]):
+                    if depths.get(origin, -1) < depth + child_depth:
+                        depths[origin] = depth + child_depth
+            outputs.append(depths)
+        node_output_depths[node] = outputs
+
+    output_depths = [dict(source_depths(blueprint._connections[SinkPort(None, port)])) for port in range(blueprint.num_outputs)]
+    max_depth = max((depth for depths in output_depths for depth in depths.values()), default=0)
+
+    return BlueprintStats(
+        blueprint_id=blueprint.id,
+        nand_count=nand_count,
+        gate_count=gate_count,
+        wire_count=wire_count,
+        max_depth=max_depth,
+        hierarchy_depth=hierarchy_depth,
+        instance_counts=instance_counts,
+        output_depths=output_depths)
+
+
+def stats(blueprint_id: BlueprintID) -> BlueprintStats:
+    """Report the fully expanded cost of a blueprint (NAND and gate counts, wire count,
+    logic depth and the number of instances of each sub-blueprint)
+    """
+    return BlueprintRepository.cached(_stats_cache, blueprint_id, lambda: _compute_stats(blueprint_id))
+
+
+def _compute_stats(blueprint_id: BlueprintID) -> BlueprintStats:
+    # post-order walk over the hierarchy with an explicit stack so that only blueprints
+    # that are not cached yet get analysed, each exactly once
+    stack = [(blueprint_id, False)]
+    while stack:
+        current_id, children_done = stack.pop()
+        if current_id in _stats_cache:
+            continue
+        blueprint = BlueprintRepository[current_id]
+        if blueprint.is_embedded:
+            _stats_cache[current_id] = _embedded_stats(blueprint)
+        elif children_done:
+            _stats_cache[current_id] = _composite_stats(blueprint)
+        else:
+            stack.append((current_id, True))
+            stack.extend((node_id, False) for node_id in set(blueprint._node_list) if node_id not in _stats_cache)
+    return _stats_cache[blueprint_id]
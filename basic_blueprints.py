@@ -1,7 +1,7 @@
-from blueprint import Blueprint, register_blueprint, SinkPort, SourcePort
+from blueprint import define_blueprint, SinkPort, SourcePort
 
 # NOT Blueprint (using NAND)
-register_blueprint(Blueprint(
+define_blueprint(
     _id='NOT',
     _node_list=['NAND'], 
     _connections=
@@ -11,10 +11,10 @@ register_blueprint(Blueprint(
     num_inputs=1, 
     num_outputs=1,
     input_labels=[],
-    output_labels=[],))
+    output_labels=[],)
 
 # AND Blueprint (using NAND)
-register_blueprint(Blueprint(
+define_blueprint(
     _id='AND',
     _node_list=['NAND', 'NAND'], 
     num_inputs=2, 
@@ -28,11 +28,10 @@ register_blueprint(Blueprint(
                 SinkPort(0, 0): SourcePort(None, 0),
                 SinkPort(0, 1): SourcePort(None, 1)}
     )
-)
  
 # OR Blueprint (using NAND and NOT)
 # OR(a, b) = NAND(NOT(a), NOT(b))
-register_blueprint(Blueprint(
+define_blueprint(
     _id='OR',
     _node_list=['NOT', 'NOT', 'NAND'], 
     num_inputs=2, 
@@ -46,11 +45,10 @@ register_blueprint(Blueprint(
                 SinkPort(0, 0): SourcePort(None, 0),
                 SinkPort(1, 0): SourcePort(None, 1)}
     )
-)
 
 # XOR Blueprint (using NAND, NOT, AND, OR)
 # XOR(a, b) = OR(AND(a, NOT(b)), AND(NOT(a), b))
-register_blueprint(Blueprint(
+define_blueprint(
     _id='XOR',
     _node_list=['NOT', 'AND', 'NOT', 'AND', 'OR'], 
     num_inputs=2, 
@@ -67,5 +65,4 @@ register_blueprint(Blueprint(
                 SinkPort(1, 1): SourcePort(None, 1),
                 SinkPort(2, 0): SourcePort(None, 1),
                 SinkPort(0, 0): SourcePort(None, 0)}
-    )
-)
\ No newline at end of file
+    )
\ No newline at end of file
@@ -1,8 +1,8 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List, Tuple, NamedTuple, Dict, Union
-from prettytable import PrettyTable
-import itertools, json
+from dataclasses import dataclass, field
+from typing import List, Tuple, NamedTuple, Dict, Union, Callable, Set
+import json, importlib, threading, hashlib
+from collections import OrderedDict
 
 
 
@@ -58,8 +58,12 @@ class Blueprint:
             raise ValueError(f'Error in blueprint {self.id}: Invalid connections to blueprint outputs (expected these ports: {list(range(self.num_outputs))}, got {blueprint_connected_output_ports})')
 
         # For each internal node, check that all input ports are connected
+        connected_ports: Dict[NodeIndex, List[int]] = {}
+        for sink in self._connections:
+            if sink.node is not None:
+                connected_ports.setdefault(sink.node, []).append(sink.port)
         for node_index, node_id in enumerate(self._node_list):
-            node_inputs = sorted([s.port for s in self._connections if s.node == node_index])
+            node_inputs = sorted(connected_ports.get(node_index, []))
             expected_node_inputs = list(range(BlueprintRepository[node_id].num_inputs))
             if node_inputs != expected_node_inputs:
                 raise ValueError(f'Error in blueprint {self.id}: Invalid connections to node {node_id}:\nNode index: {node_index}\nExpected inputs: {expected_node_inputs}\nConnection inputs: {node_inputs}')
@@ -90,34 +94,183 @@ class Blueprint:
             elif not isinstance(source, bool):
                 raise ValueError(f'Error in blueprint {self.id}: Invalid source type {source} for sink {sink}')
 
-        # do a cycle check by evaluating the blueprint with a dummy input
+        # check for cycles on the structure alone: evaluating the blueprint would clock
+        # any memories embedded in it
         try:
-            self.evaluate([False] * self.num_inputs)
+            self.node_order()
         except ValueError as e:
             raise ValueError(f'Error in blueprint {self.id}: {e}')
         
 
     
 
+    @classmethod
+    def trusted(cls, **fields) -> Blueprint:
+        """Construct a blueprint without validating it, for callers that already
+        guarantee it is valid (like BlueprintBuilder, which checks every connection as it
+        is made)
+        """
+        blueprint = cls.__new__(cls)
+        blueprint._id = None
+        for name, value in fields.items():
+            setattr(blueprint, name, value)
+        return blueprint
+
     @classmethod
     def from_json(cls, json_file: str) -> Blueprint:
         """TODO: Implement this"""
         return cls(_node_list=[], _connections=[], num_inputs=0, num_outputs=0)
 
+    _id_lock = threading.RLock() # guards the id counter and the assignment of generated ids
+
     @classmethod
     def next_id(cls) -> BlueprintID:
-        try:
-            cls._next_id += 1
-        except AttributeError:
-            cls._next_id = 0
-        return cls._next_id
+        with Blueprint._id_lock:
+            try:
+                cls._next_id += 1
+            except AttributeError:
+                cls._next_id = 0
+            return cls._next_id
 
     @property
     def id(self) -> BlueprintID:
         if self._id is None: # we will allow custom ids to be set; if not, generate one
-            self._id = f'{self.__class__.next_id():04d}'
+            with Blueprint._id_lock:
+                if self._id is None:
+                    self._id = f'{self.__class__.next_id():04d}'
         return self._id
 
+    @property
+    def is_embedded(self) -> bool:
+        """Embedded blueprints (like NAND) override evaluate natively instead of
+        being built out of other blueprints
+        """
+        return type(self).evaluate is not Blueprint.evaluate
+
+    @property
+    def is_stateful(self) -> bool:
+        """Stateful blueprints (like RAMs) keep values from one evaluation to the next, so
+        they must be evaluated every time even if no output depends on them, and cannot be
+        replaced by their truth table. Embedded blueprints declare it with a stateful
+        attribute; other blueprints are stateful if any of their nodes is.
+        """
+        if self.is_embedded:
+            return getattr(self, 'stateful', False)
+        return self.evaluation_plan().stateful
+
+    def structural_hash(self) -> str:
+        """Canonical hash of the blueprint's structure: its interface, the structural
+        hashes of its nodes and its wiring, whatever its id, labels or the order of its
+        connections. The behavior of an embedded blueprint is code, so its hash is made
+        of its class, its id and how many times that id has been (re)built.
+        """
+        if self.is_embedded:
+            text = f'embedded {type(self).__module__}.{type(self).__qualname__} {self.id} {BlueprintRepository.version(self.id)}'
+        else:
+            def source_key(source: Union[SourcePort, bool]) -> str:
+                if isinstance(source, bool):
+                    return str(int(source))
+                return f'i{source.port}' if source.node is None else f'{source.node}.{source.port}'
+
+            wiring = sorted((-1 if sink.node is None else sink.node, sink.port, source_key(source)) for sink, source in self._connections.items())
+            text = json.dumps([self.num_inputs, self.num_outputs, [BlueprintRepository.structural_hash(node_id) for node_id in self._node_list], wiring])
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def node_order(self) -> List[NodeIndex]:
+        """Return the internal nodes in an order where every node comes after the
+        nodes that feed its inputs
+        """
+        # count the internal nodes feeding each node and remember who each node feeds
+        pending = [0] * len(self._node_list)
+        fanout: Dict[NodeIndex, List[NodeIndex]] = {}
+        for sink, source in self._connections.items():
+            if sink.node is not None and isinstance(source, SourcePort) and source.node is not None:
+                pending[sink.node] += 1
+                fanout.setdefault(source.node, []).append(sink.node)
+
+        order = [node for node, count in enumerate(pending) if count == 0]
+        for node in order:
+            for sink_node in fanout.get(node, []):
+                pending[sink_node] -= 1
+                if pending[sink_node] == 0:
+                    order.append(sink_node)
+
+        if len(order) != len(self._node_list):
+            cycle_node = min(node for node, count in enumerate(pending) if count > 0)
+            raise ValueError(f'Cycle detected at node {cycle_node}')
+        return order
+
+    def evaluation_plan(self) -> EvaluationPlan:
+        """Return the precomputed evaluation order of this blueprint's nodes (built on
+        first use)
+        """
+        plan = self.__dict__.get('_evaluation_plan')
+        if plan is None:
+            with BlueprintRepository.lock:
+                plan = self.__dict__.get('_evaluation_plan')
+                if plan is None:
+                    plan = self._build_evaluation_plan()
+                    self.__dict__['_evaluation_plan'] = plan
+        return plan
+
+    def _build_evaluation_plan(self) -> EvaluationPlan:
+        # gather the sources of every node's inputs and of the blueprint outputs
+        node_sources: Dict[NodeIndex|None, Dict[int, Union[SourcePort, bool]]] = {}
+        for sink, source in self._connections.items():
+            node_sources.setdefault(sink.node, {})[sink.port] = source
+
+        def source_nodes(node: NodeIndex|None) -> List[NodeIndex]:
+            sources = node_sources.get(node, {})
+            return [sources[port].node for port in sorted(sources)
+                    if isinstance(sources[port], SourcePort) and sources[port].node is not None]
+
+        # depth-first search from the blueprint outputs (and stateful nodes) with an
+        # explicit stack. Only the nodes the outputs depend on get scheduled (like the
+        # lazy evaluation this replaces), each after all the nodes feeding it. Meeting a
+        # node that is still on the stack means there is a cycle.
+        stateful_nodes = [node for node, node_id in enumerate(self._node_list) if BlueprintRepository[node_id].is_stateful]
+        order: List[NodeIndex] = []
+        done = set()
+        on_stack = set()
+        stack = [(None, iter(source_nodes(None) + stateful_nodes))]
+        while stack:
+            node, pending = stack[-1]
+            source_node = next(pending, None)
+            if source_node is None:
+                stack.pop()
+                if node is not None:
+                    on_stack.discard(node)
+                    done.add(node)
+                    order.append(node)
+            elif source_node in on_stack:
+                raise ValueError(f'Cycle detected at node {source_node}')
+            elif source_node not in done:
+                on_stack.add(source_node)
+                stack.append((source_node, iter(source_nodes(source_node))))
+
+        # give every value a slot: the two constants, the blueprint inputs, then the
+        # outputs of each scheduled node
+        output_offsets: Dict[NodeIndex, int] = {}
+        num_slots = 2 + self.num_inputs
+        for node in order:
+            output_offsets[node] = num_slots
+            num_slots += BlueprintRepository[self._node_list[node]].num_outputs
+
+        def slots_of(node: NodeIndex|None) -> List[int]:
+            sources = node_sources.get(node, {})
+            slots = [0] * len(sources)
+            for port, source in sources.items():
+                if isinstance(source, bool):
+                    slots[port] = 1 if source else 0
+                elif source.node is None:
+                    slots[port] = 2 + source.port
+                else:
+                    slots[port] = output_offsets[source.node] + source.port
+            return slots
+
+        steps = [PlanStep(self._node_list[node], slots_of(node), output_offsets[node]) for node in order]
+        return EvaluationPlan(num_slots, steps, slots_of(None), bool(stateful_nodes))
+
     def evaluate(self, inputs: List[bool]) -> List[bool]:
         """Evaluate the blueprint ouputs given the inputs
         """
@@ -125,87 +278,428 @@ class Blueprint:
         if len(inputs) != self.num_inputs:
             raise ValueError(f'Incorrect number of inputs provided for evaluation of blueprint {self.id} (expected {self.num_inputs}, got {len(inputs)})')
 
-        # cache the internal outputs as they get evaluated; also treat the
-        # blueprint's input values as outputs of a None node
-        internal_outputs: Dict[NodeIndex, List[bool]] = {None: inputs}
-
-        # this is not necessary for calculating the result but allows us to detect
-        # cycles in the blueprint
-        visited_nodes = set()
-
-        def evaluate_inputs(node: NodeIndex|None) -> List[bool]:
-            """Evaluate the inputs of a node, including node None representing
-            the outputs of the blueprint itself
-            """
-            sinks = [sink for sink in self._connections if sink.node == node]
-            inputs: List[bool] = [None] * len(sinks)
-            
-            for sink in sinks:
-                source = self._connections[sink]
-                if isinstance(source, bool):
-                    inputs[sink.port] = source
-                else:
-                    if source.node not in internal_outputs:
-                        if source.node in visited_nodes:
-                            raise ValueError(f'Cycle detected at node {source.node}')
-                        visited_nodes.add(source.node)
-                        # If we don't have the source node's output yet, evaluate it.
-                        # First, evaluate the source node's inputs.
-                        source_node_inputs = evaluate_inputs(source.node)
-                        # Then evaluate the source node itself and cache the output.
-                        internal_outputs[source.node] = BlueprintRepository[self._node_list[source.node]].evaluate(source_node_inputs)
-                    inputs[sink.port] = internal_outputs[source.node][source.port]
-            return inputs
-
-        return evaluate_inputs(None)
-
-
-BlueprintRepository: Dict[BlueprintID, Blueprint] = {}
-def register_blueprint(blueprint: Blueprint):
-    BlueprintRepository[blueprint.id] = blueprint
+        # only the blueprint registered under the id can use code derived from that id
+        if TIERING_ENABLED and dict.get(BlueprintRepository, self._id) is self:
+            tier = _execution_tiers.get(self._id)
+            if tier is None:
+                tier = BlueprintRepository.cached(_execution_tiers, self._id, lambda: ExecutionTier(self._id))
+            tier.calls += 1
+            if tier.promote_at is not None and tier.calls >= tier.promote_at:
+                self._promote(tier)
+            if tier.evaluator is not None:
+                return tier.evaluator(inputs)
+
+        # Sub-blueprints are evaluated with an explicit stack of frames instead of
+        # recursive calls, so neither deep hierarchies nor long chains inside a
+        # blueprint are limited by the interpreter's recursion limit. Each frame is
+        # [plan, slot values, index of the next step].
+        plan = self.evaluation_plan()
+        stack = [[plan, plan.initial_values(inputs), 0]]
+        while True:
+            frame = stack[-1]
+            plan, values, step_index = frame
+
+            if step_index == len(plan.steps):
+                outputs = [values[slot] for slot in plan.output_slots]
+                stack.pop()
+                if not stack:
+                    return outputs
+                parent = stack[-1]
+                parent_plan, parent_values, parent_step_index = parent
+                output_offset = parent_plan.steps[parent_step_index].output_offset
+                parent_values[output_offset:output_offset + len(outputs)] = outputs
+                parent[2] += 1
+                continue
+
+            step = plan.steps[step_index]
+            node_blueprint = BlueprintRepository[step.blueprint_id]
+            node_inputs = [values[slot] for slot in step.input_slots]
+            if node_blueprint.is_embedded:
+                node_outputs = node_blueprint.evaluate(node_inputs)
+                values[step.output_offset:step.output_offset + len(node_outputs)] = node_outputs
+                frame[2] += 1
+            else:
+                node_plan = node_blueprint.evaluation_plan()
+                stack.append([node_plan, node_plan.initial_values(node_inputs), 0])
+
+    def _promote(self, tier: ExecutionTier):
+        from compiler import compile_blueprint # these modules depend on this one
+        from truth_table import truth_table
+
+        with BlueprintRepository.lock:
+            if tier.tier == 'interpreted' and tier.calls >= COMPILE_THRESHOLD:
+                tier.enter('compiled', compile_blueprint(self.id).evaluate)
+            if tier.tier == 'compiled' and tier.calls >= LUT_THRESHOLD:
+                tier.enter('lut', truth_table(self.id).lookup)
+            if tier.tier == 'interpreted':
+                tier.promote_at = COMPILE_THRESHOLD
+            elif tier.tier == 'compiled' and self.num_inputs <= LUT_MAX_INPUTS and not self.is_stateful:
+                tier.promote_at = LUT_THRESHOLD
+            else:
+                tier.promote_at = None
+
+    def evaluate_words(self, inputs: List[int], mask: int) -> List[int]:
+        """Evaluate many input patterns at once: bit k of every input word is the k-th
+        pattern, and bit k of every output word is its result. mask has a 1 for every
+        pattern in use.
 
+        This evaluates the patterns one by one; embedded blueprints override it with
+        a real bit-parallel version.
+        """
+        outputs = [0] * self.num_outputs
+        for bit in range(mask.bit_length()):
+            if not (mask >> bit) & 1:
+                continue
+            results = self.evaluate([bool((word >> bit) & 1) for word in inputs])
+            for port, value in enumerate(results):
+                if value:
+                    outputs[port] |= 1 << bit
+        return outputs
+
+
+# One node of an evaluation plan: which blueprint to evaluate, which slots hold its
+# inputs and where its outputs get stored
+class PlanStep(NamedTuple):
+    blueprint_id: BlueprintID
+    input_slots: List[int]
+    output_offset: int
+
+
+# Precomputed evaluation order of a blueprint. All values are kept in one flat list
+# of slots: slot 0 and 1 hold the constants False and True, followed by the blueprint
+# inputs and then the outputs of each step.
+class EvaluationPlan(NamedTuple):
+    num_slots: int
+    steps: List[PlanStep]
+    output_slots: List[int]
+    stateful: bool = False # some node keeps state between evaluations
+
+    def initial_values(self, inputs: List[bool]) -> List[bool]:
+        values = [None] * self.num_slots
+        values[0] = False
+        values[1] = True
+        values[2:2 + len(inputs)] = inputs
+        return values
+
+
+# Adaptive tiered execution.
+# Blueprint.evaluate counts the calls of every registered (non-embedded) blueprint and
+# moves it to a faster tier as it gets hot: it starts interpreted (walking the evaluation
+# plans), switches to the flattened, compiled code after COMPILE_THRESHOLD calls, and to
+# a lookup in its truth table after LUT_THRESHOLD calls, if it has at most LUT_MAX_INPUTS
+# inputs and no state. The tiers live in a derived cache, so replacing a blueprint or one
+# of its dependencies starts it over from the interpreted tier. Only the calls of
+# Blueprint.evaluate are counted (not the sub-blueprints evaluated inside an
+# interpreted call), and concurrent calls may be undercounted.
+TIERING_ENABLED = True
+COMPILE_THRESHOLD = 64
+LUT_THRESHOLD = 1024
+LUT_MAX_INPUTS = 12
+
+TIERS = ['interpreted', 'compiled', 'lut']
 
-def make_truth_table(blueprint_name: str):
 
-    print(f'{blueprint_name} Truth Table:')
-    
-    input_chars = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z"]
-    output_chars = input_chars[::-1]
+@dataclass
+class ExecutionTier:
+    blueprint_id: BlueprintID
+    tier: str = 'interpreted'
+    calls: int = 0
+    transitions: List[Tuple[str, int]] = field(default_factory=list) # (tier entered, number of calls at that point)
+    evaluator: Callable[[List[bool]], List[bool]]|None = None # evaluate of the current tier, None when interpreted
+    promote_at: int|None = field(default_factory=lambda: COMPILE_THRESHOLD) # number of calls at which to look for a faster tier
+
+    def enter(self, tier: str, evaluator: Callable[[List[bool]], List[bool]]):
+        self.tier = tier
+        self.evaluator = evaluator
+        self.transitions.append((tier, self.calls))
+
+
+# Blueprints are loaded lazily. Library modules only register a definition source (a
+# function building the blueprint) for each BlueprintID, and the repository builds and
+# validates a blueprint the first time it is asked for it. Validation looks up every
+# sub-blueprint, so that pulls in exactly the transitive dependencies and nothing else.
+# If an id has no source yet, the library modules are imported one at a time until one
+# of them defines it.
+BlueprintSource = Callable[[], Blueprint]
+
+# Concurrency model: built blueprints and everything derived from them (evaluation plans,
+# netlists, compiled code, stats, truth tables) are never modified once published, so
+# any number of threads can evaluate them at once; every evaluation keeps its values in
+# its own local frames. All the changes to the repository (building, registering,
+# unloading, invalidating) and the filling of derived caches happen under the
+# repository's reentrant lock, so readers see either the old or the new state of an
+# entry. Objects holding simulation state (stateful blueprints like memories, waveform
+# recorders, partitioned simulators) are meant to be driven by one thread at a time.
+#
+# Expensive derived artifacts (compiled code, truth tables) are also content addressed:
+# they are kept in caches keyed by structural hash, so blueprints with the same structure
+# under different names (or re-imported copies) are only compiled once. Their entries
+# never go stale (a changed definition gets a new hash), but every re-registration adds
+# one, so these caches only keep the most recently used ones.
+
+LIBRARY_MODULES = ['embedded_blueprints', 'basic_blueprints', 'adder_blueprints', 'shift_left_blueprints',
+                   'shift_right_blueprints', 'uncategorized_blueprints', 'synthesized_blueprints',
+                   'native_blueprints', 'memory_blueprints', 'alu_blueprints']
+
+
+class StructuralCache(OrderedDict):
+    """Cache keyed by structural hash keeping its max_entries most recently used entries
+    """
 
-    blueprint = BlueprintRepository.get(blueprint_name)
+    def __init__(self, max_entries: int = 256):
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.RLock() # lookups reorder the entries, even outside the repository lock
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self:
+                return default
+            self.move_to_end(key)
+            return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.max_entries:
+                self.popitem(last=False)
+
+
+class LazyBlueprintRepository(dict):
+    """Dictionary of the blueprints built so far, which builds missing ones from their
+    registered definition sources on access
+    """
 
-    if blueprint is None:
-        print(f"Error: Blueprint '{blueprint_name}' not found.")
-        return
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.RLock()
+        self.sources: Dict[BlueprintID, BlueprintSource] = {}
+        self._imported_modules = set()
+        self._building = []
+        # reverse dependency index of the built blueprints: id -> ids of the blueprints using it as a node
+        self._dependents: Dict[BlueprintID, Set[BlueprintID]] = {}
+        # dependencies that are not nodes (like the native primitive standing in for a blueprint)
+        self._extra_dependents: Dict[BlueprintID, Set[BlueprintID]] = {}
+        # bumped every time a blueprint is (re)built, replaced or changed in place
+        self._versions: Dict[BlueprintID, int] = {}
+        # caches of things derived from blueprints (stats, netlists, compiled code, ...), keyed by BlueprintID
+        self._derived_caches: List[Dict[BlueprintID, object]] = []
+        self._structural_hashes: Dict[BlueprintID, str] = self.register_derived_cache({})
+
+    def __setitem__(self, blueprint_id: BlueprintID, blueprint: Blueprint):
+        with self.lock:
+            old = dict.get(self, blueprint_id)
+            if old is not None and self._dependents.get(blueprint_id) and \
+                    (old.num_inputs, old.num_outputs) != (blueprint.num_inputs, blueprint.num_outputs):
+                raise ValueError(f'Error in blueprint {blueprint_id}: Cannot replace a blueprint with {old.num_inputs} inputs and {old.num_outputs} outputs '
+                                 f'by one with {blueprint.num_inputs} inputs and {blueprint.num_outputs} outputs, it is used by {sorted(self._dependents[blueprint_id])}')
+            if old is not None:
+                self._unlink(blueprint_id, old)
+            super().__setitem__(blueprint_id, blueprint)
+            for node_id in set(blueprint._node_list):
+                self._dependents.setdefault(node_id, set()).add(blueprint_id)
+            self._versions[blueprint_id] = self._versions.get(blueprint_id, 0) + 1
+            if old is not None:
+                self.invalidate(blueprint_id)
+
+    def _unlink(self, blueprint_id: BlueprintID, blueprint: Blueprint):
+        for node_id in set(blueprint._node_list):
+            self._dependents.get(node_id, set()).discard(blueprint_id)
+
+    def unload(self, blueprint_id: BlueprintID):
+        """Drop a built blueprint (it gets rebuilt from its source on next access) and
+        everything derived from it
+        """
+        with self.lock:
+            old = dict.pop(self, blueprint_id, None)
+            if old is not None:
+                self._unlink(blueprint_id, old)
+                self._versions[blueprint_id] = self._versions.get(blueprint_id, 0) + 1
+                self.invalidate(blueprint_id)
+
+    def version(self, blueprint_id: BlueprintID) -> int:
+        """Number of times the blueprint has been built, replaced or changed (0 if never built)
+        """
+        return self._versions.get(blueprint_id, 0)
 
-    num_inputs = blueprint.num_inputs
-    num_outputs = blueprint.num_outputs
+    def contents_changed(self, blueprint_id: BlueprintID):
+        """Record that a built embedded blueprint behaves differently without having been
+        replaced (like a ROM loaded with a new image): its version, and so its structural
+        hash, changes and everything derived from it is dropped
+        """
+        with self.lock:
+            self._versions[blueprint_id] = self._versions.get(blueprint_id, 0) + 1
+            self.invalidate(blueprint_id)
 
-    table = PrettyTable()
+    def dependents(self, blueprint_id: BlueprintID) -> Set[BlueprintID]:
+        """The built blueprints using this one, directly or through other blueprints
+        """
+        found = set()
+        pending = [blueprint_id]
+        while pending:
+            current = pending.pop()
+            for dependent_id in self._dependents.get(current, set()) | self._extra_dependents.get(current, set()):
+                if dependent_id not in found:
+                    found.add(dependent_id)
+                    pending.append(dependent_id)
+        return found
+
+    def add_dependency(self, blueprint_id: BlueprintID, dependency_id: BlueprintID):
+        """Have what is derived from a blueprint invalidated whenever another blueprint,
+        which is not one of its nodes, gets replaced
+        """
+        with self.lock:
+            self._extra_dependents.setdefault(dependency_id, set()).add(blueprint_id)
 
-    if num_inputs == len(blueprint.input_labels):
-        input_vars = blueprint.input_labels
-    else:
-        input_vars = input_chars[:num_inputs]
-    
-    if num_outputs == len(blueprint.output_labels):
-        output_vars = blueprint.output_labels
-    else:
-        output_vars = output_chars[:num_outputs] 
+    def register_derived_cache(self, cache: Dict[BlueprintID, object]) -> Dict[BlueprintID, object]:
+        """Have the entries of a cache keyed by BlueprintID dropped whenever the blueprint
+        or any blueprint it depends on gets replaced
+        """
+        with self.lock:
+            self._derived_caches.append(cache)
+            return cache
 
+    def cached(self, cache: Dict[BlueprintID, object], blueprint_id: BlueprintID, compute: Callable[[], object]) -> object:
+        """Return the entry of a derived cache, computing it under the lock if it is missing
+        """
+        value = cache.get(blueprint_id)
+        if value is None:
+            with self.lock:
+                if blueprint_id not in cache:
+                    cache[blueprint_id] = compute()
+                value = cache[blueprint_id]
+        return value
+
+    def structural_hash(self, blueprint_id: BlueprintID) -> str:
+        """Canonical structural hash of a blueprint (see Blueprint.structural_hash)
+        """
+        return self.cached(self._structural_hashes, blueprint_id, lambda: self[blueprint_id].structural_hash())
 
-    table.field_names = input_vars + output_vars
+    def cached_by_structure(self, cache: Dict[str, object], blueprint_id: BlueprintID, compute: Callable[[], object]) -> object:
+        """Return the entry of a cache keyed by structural hash (a StructuralCache), so
+        that structurally identical blueprints share it. A changed definition gets a new
+        hash, so entries never go stale and such caches are not registered for
+        invalidation; old entries are evicted once the cache is full.
+        """
+        return self.cached(cache, self.structural_hash(blueprint_id), compute)
 
-    
-    combinations = list(itertools.product([False, True], repeat=num_inputs))
+    def invalidate(self, blueprint_id: BlueprintID):
+        """Drop everything derived from a blueprint and from the blueprints depending on it
+        """
+        with self.lock:
+            affected = self.dependents(blueprint_id) | {blueprint_id}
+            for cache in self._derived_caches:
+                for affected_id in affected:
+                    cache.pop(affected_id, None)
+            for affected_id in affected:
+                blueprint = dict.get(self, affected_id)
+                if blueprint is not None:
+                    blueprint.__dict__.pop('_evaluation_plan', None)
+
+    def _import_library_module(self, module_name: str):
+        with self.lock:
+            if module_name not in self._imported_modules:
+                self._imported_modules.add(module_name)
+                importlib.import_module(module_name)
+
+    def _find_source(self, blueprint_id: BlueprintID) -> BlueprintSource|None:
+        for module_name in LIBRARY_MODULES:
+            if blueprint_id in self.sources:
+                break
+            self._import_library_module(module_name)
+        return self.sources.get(blueprint_id)
+
+    def __missing__(self, blueprint_id: BlueprintID) -> Blueprint:
+        with self.lock:
+            if super().__contains__(blueprint_id): # built by another thread in the meantime
+                return super().__getitem__(blueprint_id)
+            source = self._find_source(blueprint_id)
+            if source is None:
+                raise KeyError(blueprint_id)
+            if blueprint_id in self._building:
+                raise ValueError(f'Error in blueprint {blueprint_id}: Circular dependency ({" -> ".join(self._building + [blueprint_id])})')
+            self._building.append(blueprint_id)
+            try:
+                blueprint = source()
+            finally:
+                self._building.pop()
+            self[blueprint_id] = blueprint
+            return blueprint
+
+    def __contains__(self, blueprint_id: BlueprintID) -> bool:
+        return super().__contains__(blueprint_id) or self._find_source(blueprint_id) is not None
+
+    def get(self, blueprint_id: BlueprintID, default: Blueprint = None) -> Blueprint|None:
+        try:
+            return self[blueprint_id]
+        except KeyError:
+            return default
+
+    def is_loaded(self, blueprint_id: BlueprintID) -> bool:
+        return super().__contains__(blueprint_id)
+
+    def available(self) -> List[BlueprintID]:
+        """All the blueprints that can be loaded, without building any of them
+        """
+        with self.lock:
+            for module_name in LIBRARY_MODULES:
+                self._import_library_module(module_name)
+            return sorted(set(self.sources) | set(self.keys()))
+
+
+BlueprintRepository: LazyBlueprintRepository = LazyBlueprintRepository()
+
+_execution_tiers: Dict[BlueprintID, ExecutionTier] = BlueprintRepository.register_derived_cache({})
+
+
+def execution_tier(blueprint_id: BlueprintID) -> ExecutionTier|None:
+    """Current execution tier of a blueprint, with its call count and transitions
+    (None if it has not been evaluated since it was last built or invalidated)
+    """
+    return _execution_tiers.get(blueprint_id)
+
+
+def execution_tiers() -> Dict[BlueprintID, ExecutionTier]:
+    return dict(_execution_tiers)
+
+
+def register_blueprint(blueprint: Blueprint):
+    BlueprintRepository[blueprint.id] = blueprint
+
+
+def register_blueprint_source(blueprint_id: BlueprintID, source: BlueprintSource):
+    """Register a function building a blueprint; it only gets called when the blueprint
+    is first needed
+    """
+    with BlueprintRepository.lock:
+        BlueprintRepository.sources[blueprint_id] = source
+        BlueprintRepository.unload(blueprint_id)
 
-    for combination in combinations:
-        row = [int(value) for value in combination]  
-        outputs = blueprint.evaluate(combination)
-        row.extend(int(output) for output in outputs) 
-        table.add_row(row)
 
-    print(table)
+def define_blueprint(**fields):
+    """Lazily register a blueprint given the fields it would be constructed with
+    """
+    register_blueprint_source(fields['_id'], lambda: Blueprint(**fields))
+
+
+def make_truth_table(blueprint_name: str, print_table: bool = True):
+    """Compute the truth table of a blueprint (see truth_table.TruthTable) and print it
+    unless print_table is False
+    """
+    from truth_table import truth_table # truth_table depends on this module
+
+    blueprint = BlueprintRepository.get(blueprint_name)
+
+    if blueprint is None:
+        print(f"Error: Blueprint '{blueprint_name}' not found.")
+        return None
+
+    table = truth_table(blueprint_name)
+    if print_table:
+        print(f'{blueprint_name} Truth Table:')
+        print(table.to_pretty_table())
+    return table
 
 
 def json_export_blueprint(blueprint: Blueprint, file_name: str):
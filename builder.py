@@ -0,0 +1,184 @@
+from __future__ import annotations
+from typing import List, Dict, Union
+from blueprint import Blueprint, BlueprintID, BlueprintRepository, NodeIndex, SourcePort, SinkPort, register_blueprint
+
+
+# Programmatic blueprint construction.
+# The builder checks every connection when it is made (port ranges, a single driver per
+# sink, no cycles), so build() can create the blueprint without the validation pass. The
+# cycle check keeps the nodes in a topological order that is updated incrementally
+# (Pearce-Kelly): connecting a node to one later in the order costs nothing, and only
+# an edge going backwards in the order searches the nodes between its two ends, then
+# shuffles just those into a valid order again (or reports the cycle it found).
+
+Source = Union[SourcePort, bool]
+
+
+class BlueprintBuilder:
+    """Build a blueprint one node and one connection at a time
+    """
+
+    def __init__(self, num_inputs: int, num_outputs: int, blueprint_id: BlueprintID = None,
+                 input_labels: List[str] = None, output_labels: List[str] = None):
+        self.num_inputs = num_inputs
+        self.num_outputs = num_outputs
+        self.blueprint_id = blueprint_id
+        self.input_labels = input_labels if input_labels is not None else []
+        self.output_labels = output_labels if output_labels is not None else []
+        self._node_list: List[BlueprintID] = []
+        self._connections: Dict[SinkPort, Source] = {}
+        self._node_ports: List[tuple] = [] # (number of inputs, number of outputs) of every node
+        self._unconnected = num_outputs # sinks that still have no source
+
+        # incremental topological order: position of each node, node at each position
+        self._position: List[int] = []
+        self._order: List[NodeIndex] = []
+        self._fanout: List[List[NodeIndex]] = []
+        self._fanin: List[List[NodeIndex]] = []
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(f'Error in blueprint {self.blueprint_id}: {message}')
+
+    def add_node(self, blueprint_id: BlueprintID) -> NodeIndex:
+        """Add an instance of a blueprint and return its node index
+        """
+        blueprint = BlueprintRepository[blueprint_id]
+        node = len(self._node_list)
+        self._node_list.append(blueprint_id)
+        self._node_ports.append((blueprint.num_inputs, blueprint.num_outputs))
+        self._unconnected += blueprint.num_inputs
+        self._position.append(node)
+        self._order.append(node)
+        self._fanout.append([])
+        self._fanin.append([])
+        return node
+
+    def input(self, port: int) -> SourcePort:
+        return SourcePort(None, port)
+
+    def output(self, port: int) -> SinkPort:
+        return SinkPort(None, port)
+
+    def input_bus(self, start: int, width: int) -> List[SourcePort]:
+        """Consecutive blueprint inputs, as sources
+        """
+        return [SourcePort(None, port) for port in range(start, start + width)]
+
+    def output_bus(self, start: int, width: int) -> List[SinkPort]:
+        """Consecutive blueprint outputs, as sinks
+        """
+        return [SinkPort(None, port) for port in range(start, start + width)]
+
+    def node_inputs(self, node: NodeIndex) -> List[SinkPort]:
+        return [SinkPort(node, port) for port in range(self._node_ports[node][0])]
+
+    def node_outputs(self, node: NodeIndex) -> List[SourcePort]:
+        return [SourcePort(node, port) for port in range(self._node_ports[node][1])]
+
+    def connect(self, source: Source, sink: SinkPort):
+        """Connect a source (blueprint input, node output or constant) to a sink (node
+        input or blueprint output)
+        """
+        if sink.node is None:
+            if not 0 <= sink.port < self.num_outputs:
+                raise self._error(f'Invalid sink port. Expected blueprint output port < {self.num_outputs}, got {sink.port}')
+        elif not 0 <= sink.node < len(self._node_list) or not 0 <= sink.port < self._node_ports[sink.node][0]:
+            raise self._error(f'Invalid sink port {sink}')
+        if sink in self._connections:
+            raise self._error(f'Sink {sink} is already connected to {self._connections[sink]}')
+
+        if isinstance(source, SourcePort):
+            if source.node is None:
+                if not 0 <= source.port < self.num_inputs:
+                    raise self._error(f'Invalid source port. Expected blueprint input port < {self.num_inputs}, got {source.port}')
+            elif not 0 <= source.node < len(self._node_list) or not 0 <= source.port < self._node_ports[source.node][1]:
+                raise self._error(f'Invalid source port {source}')
+            elif sink.node is not None:
+                self._add_edge(source.node, sink.node)
+        elif not isinstance(source, bool):
+            raise self._error(f'Invalid source type {source} for sink {sink}')
+
+        self._connections[sink] = source
+        self._unconnected -= 1
+
+    def connect_bus(self, sources: List[Source], sinks: List[SinkPort]):
+        if len(sources) != len(sinks):
+            raise self._error(f'Cannot connect a bus of {len(sources)} sources to {len(sinks)} sinks')
+        for source, sink in zip(sources, sinks):
+            self.connect(source, sink)
+
+    def instantiate(self, blueprint_id: BlueprintID, bus_map: Union[List[Source], Dict[int, Source]]) -> List[SourcePort]:
+        """Add a node and connect its inputs, given in order or as {input port: source};
+        returns the node's outputs
+        """
+        node = self.add_node(blueprint_id)
+        items = bus_map.items() if isinstance(bus_map, dict) else enumerate(bus_map)
+        for port, source in items:
+            self.connect(source, SinkPort(node, port))
+        return self.node_outputs(node)
+
+    def _add_edge(self, source: NodeIndex, sink: NodeIndex):
+        self._fanout[source].append(sink)
+        self._fanin[sink].append(source)
+        lower, upper = self._position[sink], self._position[source]
+        if lower > upper:
+            return # already in order
+        if source == sink:
+            self._remove_edge(source, sink)
+            raise self._error(f'Cycle detected at node {sink}')
+
+        # nodes reachable from the sink without going past the source in the order...
+        forward = self._search(sink, self._fanout, lambda position: position <= upper)
+        if source in forward:
+            self._remove_edge(source, sink)
+            raise self._error(f'Cycle detected at node {sink}')
+        # ...and nodes reaching the source without going before the sink
+        backward = self._search(source, self._fanin, lambda position: position >= lower)
+
+        # reuse the positions of both groups: the backward group first, then the forward one
+        moved = sorted(backward, key=self._position.__getitem__) + sorted(forward, key=self._position.__getitem__)
+        positions = sorted(self._position[node] for node in moved)
+        for position, node in zip(positions, moved):
+            self._position[node] = position
+            self._order[position] = node
+
+    def _remove_edge(self, source: NodeIndex, sink: NodeIndex):
+        self._fanout[source].pop()
+        self._fanin[sink].pop()
+
+    def _search(self, start: NodeIndex, edges: List[List[NodeIndex]], in_range) -> set:
+        found = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for next_node in edges[node]:
+                if next_node not in found and in_range(self._position[next_node]):
+                    found.add(next_node)
+                    stack.append(next_node)
+        return found
+
+    def node_order(self) -> List[NodeIndex]:
+        """The nodes in an order where every node comes after the nodes feeding it
+        """
+        return list(self._order)
+
+    def build(self, register: bool = True) -> Blueprint:
+        """Create (and by default register) the blueprint. Every connection has already
+        been checked, so this only makes sure that nothing was left unconnected.
+        """
+        if self._unconnected:
+            missing = [SinkPort(None, port) for port in range(self.num_outputs) if SinkPort(None, port) not in self._connections]
+            missing += [sink for node in range(len(self._node_list)) for sink in self.node_inputs(node) if sink not in self._connections]
+            raise self._error(f'Unconnected sinks: {missing[:10]}{" ..." if len(missing) > 10 else ""}')
+        blueprint = Blueprint.trusted(
+            _node_list=list(self._node_list), # copies: the builder can still be used afterwards
+            _connections=dict(self._connections),
+            num_inputs=self.num_inputs,
+            num_outputs=self.num_outputs,
+            input_labels=list(self.input_labels),
+            output_labels=list(self.output_labels),
+            _id=self.blueprint_id,
+        )
+        if register:
+            register_blueprint(blueprint)
+        return blueprint
@@ -0,0 +1,419 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import List, Tuple, NamedTuple, Dict, Callable
+import random
+from concurrent.futures import ThreadPoolExecutor
+from blueprint import Blueprint, BlueprintID, BlueprintRepository, NodeIndex, SourcePort, SinkPort, StructuralCache
+from native_blueprints import NATIVE_REPLACEMENTS
+
+
+# The compiler turns a hierarchical blueprint into a flat netlist of embedded gates.
+# Every signal of the flattened circuit is a numbered wire. Wires 0 and 1 always hold
+# the constants False and True, followed by one wire per input of the blueprint, and
+# then one wire per output port of every gate. Connections inside the hierarchy that
+# just pass a signal along (blueprint ports, constants) do not create new wires.
+Wire = int
+CONST_FALSE: Wire = 0
+CONST_TRUE: Wire = 1
+
+
+# A gate is an instance of an embedded blueprint (like NAND) in the flattened netlist
+class Gate(NamedTuple):
+    kind: BlueprintID
+    inputs: Tuple[Wire, ...]
+    outputs: Tuple[Wire, ...]
+    instance: int # index (in Netlist.instances) of the blueprint instance the gate belongs to
+    node: NodeIndex # node index of the gate inside that blueprint
+
+
+# An instance of a (non-embedded) blueprint somewhere in the hierarchy. Instance 0 is
+# the flattened blueprint itself.
+class Instance(NamedTuple):
+    blueprint_id: BlueprintID
+    parent: int|None
+    node: NodeIndex|None
+    inputs: Tuple[Wire, ...]
+    outputs: Tuple[Wire, ...]
+
+
+@dataclass(frozen=True)
+class Netlist:
+    blueprint_id: BlueprintID
+    num_inputs: int
+    num_outputs: int
+    num_wires: int
+    gates: List[Gate] # sorted so that every gate comes after the gates driving its inputs
+    outputs: Tuple[Wire, ...]
+    instances: List[Instance] = field(default_factory=list)
+
+    @property
+    def inputs(self) -> Tuple[Wire, ...]:
+        return tuple(range(2, 2 + self.num_inputs))
+
+    def evaluate(self, inputs: List[bool]) -> List[bool]:
+        """Evaluate the flattened circuit one gate at a time (mostly useful to check
+        the netlist against the blueprint it came from)
+        """
+        if len(inputs) != self.num_inputs:
+            raise ValueError(f'Incorrect number of inputs provided for evaluation of netlist {self.blueprint_id} (expected {self.num_inputs}, got {len(inputs)})')
+
+        values: List[bool] = [False] * self.num_wires
+        values[CONST_TRUE] = True
+        values[2:2 + self.num_inputs] = [bool(value) for value in inputs]
+        for gate in self.gates:
+            results = BlueprintRepository[gate.kind].evaluate([values[wire] for wire in gate.inputs])
+            for wire, value in zip(gate.outputs, results):
+                values[wire] = value
+        return [values[wire] for wire in self.outputs]
+
+    def driver(self, wire: Wire) -> int|None:
+        """Return the index of the gate driving a wire (None for constants and inputs)
+        """
+        if '_drivers' not in self.__dict__:
+            drivers: List[int|None] = [None] * self.num_wires
+            for index, gate in enumerate(self.gates):
+                for output in gate.outputs:
+                    drivers[output] = index
+            self.__dict__['_drivers'] = drivers
+        return self.__dict__['_drivers'][wire]
+
+    def instance_path(self, instance: int) -> str:
+        """Hierarchical name of an instance, like 8BIT_FULL_ADDER/1:4BIT_FULL_ADDER/0:2BIT_FULL_ADDER
+        """
+        segments = []
+        while self.instances[instance].parent is not None:
+            segments.append(f'{self.instances[instance].node}:{self.instances[instance].blueprint_id}')
+            instance = self.instances[instance].parent
+        segments.append(self.instances[instance].blueprint_id)
+        return '/'.join(reversed(segments))
+
+    def wire_name(self, wire: Wire) -> str:
+        """Hierarchical name of a wire, using port labels where the blueprints have them
+        """
+        if wire == CONST_FALSE or wire == CONST_TRUE:
+            return str(wire)
+        top = BlueprintRepository[self.blueprint_id]
+        if wire < 2 + self.num_inputs:
+            return f'{self.blueprint_id}.{_port_label(top.input_labels, top.num_inputs, wire - 2, "in")}'
+        gate = self.gates[self.driver(wire)]
+        kind = BlueprintRepository[gate.kind]
+        port = _port_label(kind.output_labels, kind.num_outputs, gate.outputs.index(wire), 'out')
+        return f'{self.instance_path(gate.instance)}/{gate.node}:{gate.kind}.{port}'
+
+    def resolve(self, name: str) -> Wire:
+        """Find the wire behind a hierarchical port name, like the ones wire_name returns.
+        The name is an instance path followed by a port: an input or output label, or
+        inN / outN (for example 8BIT_FULL_ADDER/1:4BIT_FULL_ADDER.Cout).
+        """
+        path, _, port_name = name.rpartition('.')
+        segments = path.split('/')
+        if not path or segments[0] != self.blueprint_id:
+            raise ValueError(f'Error in netlist {self.blueprint_id}: Invalid port name {name}')
+
+        if '_children' not in self.__dict__:
+            # (parent instance, node index) -> the instance or gate at that node
+            children: Dict[Tuple[int, NodeIndex], Tuple[int|None, Instance|Gate]] = {}
+            for index, instance in enumerate(self.instances):
+                if instance.parent is not None:
+                    children[(instance.parent, instance.node)] = (index, instance)
+            for gate in self.gates:
+                children[(gate.instance, gate.node)] = (None, gate)
+            self.__dict__['_children'] = children
+
+        # walk down the hierarchy one node at a time
+        current_index, current = 0, self.instances[0]
+        for segment in segments[1:]:
+            node, _, blueprint_id = segment.partition(':')
+            child_index, child = None, None
+            if node.isdigit() and current_index is not None: # gates have no children
+                child_index, child = self.__dict__['_children'].get((current_index, int(node)), (None, None))
+            if child is None or (blueprint_id and blueprint_id != (child.kind if isinstance(child, Gate) else child.blueprint_id)):
+                raise ValueError(f'Error in netlist {self.blueprint_id}: Invalid port name {name} (no node {segment})')
+            current_index, current = child_index, child
+
+        blueprint = BlueprintRepository[current.kind if isinstance(current, Gate) else current.blueprint_id]
+        for direction, labels, wires in (('in', blueprint.input_labels, current.inputs), ('out', blueprint.output_labels, current.outputs)):
+            for port, wire in enumerate(wires):
+                if port_name == _port_label(labels, len(wires), port, direction) or port_name == f'{direction}{port}':
+                    return wire
+        raise ValueError(f'Error in netlist {self.blueprint_id}: Invalid port name {name} (no port {port_name})')
+
+
+def _port_label(labels: List[str], count: int, port: int, prefix: str) -> str:
+    # only trust the labels if there is exactly one per port (like make_truth_table does)
+    return labels[port] if len(labels) == count else f'{prefix}{port}'
+
+
+# State of one blueprint instance while it is being flattened
+@dataclass
+class _FlattenFrame:
+    blueprint: Blueprint
+    instance: int
+    inputs: List[Wire]
+    order: List[NodeIndex]
+    position: int = 0
+    node_outputs: Dict[NodeIndex, Tuple[Wire, ...]] = field(default_factory=dict)
+
+    def resolve(self, source: SourcePort|bool) -> Wire:
+        if isinstance(source, bool):
+            return CONST_TRUE if source else CONST_FALSE
+        if source.node is None:
+            return self.inputs[source.port]
+        return self.node_outputs[source.node][source.port]
+
+
+def flatten(blueprint_id: BlueprintID, substitutions: Dict[BlueprintID, BlueprintID] = None) -> Netlist:
+    """Expand a blueprint down to its embedded gates. Blueprints found in substitutions
+    are not expanded but become a single gate of the embedded blueprint they map to.
+    """
+    substitutions = substitutions or {}
+    top = BlueprintRepository[blueprint_id]
+    top_inputs = list(range(2, 2 + top.num_inputs))
+    next_wire = 2 + top.num_inputs
+    gates: List[Gate] = []
+    instances: List[Instance] = [Instance(blueprint_id, None, None, tuple(top_inputs), ())]
+
+    if top.is_embedded or blueprint_id in substitutions:
+        outputs = tuple(range(next_wire, next_wire + top.num_outputs))
+        gates.append(Gate(substitutions.get(blueprint_id, blueprint_id), tuple(top_inputs), outputs, 0, 0))
+        instances[0] = instances[0]._replace(outputs=outputs)
+        return Netlist(blueprint_id, top.num_inputs, top.num_outputs, next_wire + top.num_outputs, gates, outputs, instances)
+
+    # the same sub-blueprint is usually instantiated many times, so only sort it once
+    node_orders: Dict[BlueprintID, List[NodeIndex]] = {}
+
+    def node_order(blueprint: Blueprint) -> List[NodeIndex]:
+        if blueprint.id not in node_orders:
+            node_orders[blueprint.id] = blueprint.node_order()
+        return node_orders[blueprint.id]
+
+    # walk the hierarchy with an explicit stack so deep hierarchies cannot exhaust the
+    # interpreter's recursion limit
+    stack = [_FlattenFrame(top, 0, top_inputs, node_order(top))]
+    while stack:
+        frame = stack[-1]
+        connections = frame.blueprint._connections
+
+        if frame.position == len(frame.order):
+            outputs = tuple(frame.resolve(connections[SinkPort(None, port)]) for port in range(frame.blueprint.num_outputs))
+            instances[frame.instance] = instances[frame.instance]._replace(outputs=outputs)
+            stack.pop()
+            if stack:
+                parent = stack[-1]
+                parent.node_outputs[parent.order[parent.position]] = outputs
+                parent.position += 1
+            continue
+
+        node = frame.order[frame.position]
+        child_id = frame.blueprint._node_list[node]
+        child = BlueprintRepository[child_id]
+        child_inputs = [frame.resolve(connections[SinkPort(node, port)]) for port in range(child.num_inputs)]
+
+        if child.is_embedded or child_id in substitutions:
+            outputs = tuple(range(next_wire, next_wire + child.num_outputs))
+            next_wire += child.num_outputs
+            gates.append(Gate(substitutions.get(child_id, child_id), tuple(child_inputs), outputs, frame.instance, node))
+            frame.node_outputs[node] = outputs
+            frame.position += 1
+        else:
+            instances.append(Instance(child_id, frame.instance, node, tuple(child_inputs), ()))
+            stack.append(_FlattenFrame(child, len(instances) - 1, child_inputs, node_order(child)))
+
+    return Netlist(blueprint_id, top.num_inputs, top.num_outputs, next_wire, gates, instances[0].outputs, instances)
+
+
+def generate_simulator(netlist: Netlist, observed: List[Wire] = (), count_activity: bool = False) -> Callable[..., Tuple[Tuple[int, ...], Tuple[int, ...]]]:
+    """Generate a Python function evaluating the netlist on whole words of patterns.
+
+    The function takes the input words and the pattern mask, and returns the output
+    words and the words of the observed wires. NAND gates are inlined as a single
+    bitwise expression, and so are the gates giving their own source (native primitives,
+    see native_blueprints); any other embedded gate calls its blueprint's evaluate_words.
+
+    With count_activity, the patterns are consecutive states and the function takes
+    three more arguments: a list of toggle counts and a list of last values (one entry
+    per wire), and a flag telling whether this is the first call. Every wire's toggles
+    are counted in place, as the popcount of the word XOR the word shifted by one
+    pattern (with the last value of the previous call shifted in).
+    """
+    arguments = 'inputs, m, c, l, first' if count_activity else 'inputs, m'
+    lines = [f'def simulate({arguments}):', '    w0 = 0', '    w1 = m']
+    if netlist.num_inputs:
+        lines.append(f'    {", ".join(f"w{wire}" for wire in netlist.inputs)}, = inputs')
+
+    namespace = {}
+    for index, gate in enumerate(netlist.gates):
+        if gate.kind == 'NAND':
+            a, b = gate.inputs
+            lines.append(f'    w{gate.outputs[0]} = m ^ (w{a} & w{b})')
+        elif getattr(BlueprintRepository[gate.kind], 'inline', None) is not None:
+            source = BlueprintRepository[gate.kind].inline([f'w{wire}' for wire in gate.inputs], [f'w{wire}' for wire in gate.outputs], f't{index}_')
+            lines.extend(f'    {line}' for line in source)
+        else:
+            namespace[f'g{index}'] = BlueprintRepository[gate.kind].evaluate_words
+            outputs = ''.join(f'w{wire}, ' for wire in gate.outputs)
+            inputs = ', '.join(f'w{wire}' for wire in gate.inputs)
+            lines.append(f'    {outputs}= g{index}([{inputs}], m)' if gate.outputs else f'    g{index}([{inputs}], m)')
+
+    if count_activity:
+        counted = range(2, netlist.num_wires)
+        lines.append('    top = m.bit_length() - 1')
+        lines.append('    if first:')
+        lines.extend(f'        l[{wire}] = w{wire} & 1' for wire in counted)
+        for wire in counted:
+            lines.append(f'    c[{wire}] += (w{wire} ^ (((w{wire} << 1) | l[{wire}]) & m)).bit_count()')
+            lines.append(f'    l[{wire}] = w{wire} >> top')
+
+    outputs = ''.join(f'w{wire}, ' for wire in netlist.outputs)
+    observed = ''.join(f'w{wire}, ' for wire in observed)
+    lines.append(f'    return ({outputs}), ({observed})')
+
+    exec(compile('\n'.join(lines), f'<compiled {netlist.blueprint_id}>', 'exec'), namespace)
+    return namespace['simulate']
+
+
+class CompiledBlueprint:
+    """A blueprint flattened to its embedded gates and compiled into one Python function
+    that evaluates a whole word of input patterns per call (bit k of every word is the
+    k-th pattern).
+
+    A compiled blueprint is an immutable snapshot: the generated function keeps every wire
+    in its own local variables, so any number of threads can evaluate it at the same time.
+    """
+
+    def __init__(self, netlist: Netlist, simulate: Callable = None):
+        self.netlist = netlist
+        self._simulate = simulate if simulate is not None else generate_simulator(netlist)
+
+    @property
+    def blueprint_id(self) -> BlueprintID:
+        return self.netlist.blueprint_id
+
+    @property
+    def num_inputs(self) -> int:
+        return self.netlist.num_inputs
+
+    @property
+    def num_outputs(self) -> int:
+        return self.netlist.num_outputs
+
+    def evaluate_packed(self, inputs: List[int], count: int) -> List[int]:
+        """Evaluate count patterns at once (Blueprint.evaluate_words takes the mask of
+        the patterns instead)
+        """
+        if len(inputs) != self.num_inputs:
+            raise ValueError(f'Incorrect number of inputs provided for evaluation of blueprint {self.blueprint_id} (expected {self.num_inputs}, got {len(inputs)})')
+        mask = (1 << count) - 1
+        outputs, _ = self._simulate([word & mask for word in inputs], mask)
+        return list(outputs)
+
+    def evaluate(self, inputs: List[bool]) -> List[bool]:
+        return [bool(word) for word in self.evaluate_packed([1 if value else 0 for value in inputs], 1)]
+
+    def evaluate_batch(self, vectors: List[List[bool]]) -> List[List[bool]]:
+        """Evaluate a list of input vectors, all in one pass
+        """
+        if not vectors:
+            return []
+        outputs = self.evaluate_packed(pack_vectors(vectors, self.num_inputs), len(vectors))
+        return unpack_vectors(outputs, len(vectors))
+
+    def evaluate_batch_parallel(self, vectors: List[List[bool]], max_workers: int = None, chunk_size: int = 4096) -> List[List[bool]]:
+        """Evaluate a list of input vectors in chunks spread over a pool of threads. The
+        chunks run on separate cores on free-threaded Python builds; with the GIL this
+        is no faster than evaluate_batch.
+        """
+        chunks = [vectors[start:start + chunk_size] for start in range(0, len(vectors), chunk_size)]
+        with ThreadPoolExecutor(max_workers) as pool:
+            return [outputs for chunk in pool.map(self.evaluate_batch, chunks) for outputs in chunk]
+
+
+def pack_vectors(vectors: List[List[bool]], num_ports: int) -> List[int]:
+    """Turn a list of vectors into one word per port (bit k of each word comes from vector k)
+    """
+    return [int(''.join('1' if vector[port] else '0' for vector in reversed(vectors)), 2) for port in range(num_ports)]
+
+
+def unpack_vectors(words: List[int], count: int) -> List[List[bool]]:
+    """Turn one word per port back into a list of count vectors
+    """
+    columns = [format(word, f'0{count}b')[::-1] for word in words]
+    return [[column[index] == '1' for column in columns] for index in range(count)]
+
+
+_compiled_cache: Dict[BlueprintID, CompiledBlueprint] = BlueprintRepository.register_derived_cache({})
+_fast_compiled_cache: Dict[BlueprintID, CompiledBlueprint] = BlueprintRepository.register_derived_cache({})
+
+# the generated functions, shared by structurally identical blueprints (keyed by
+# structural hash, and in fast mode by the structural hashes of the natives substituted).
+# Only the function is shared: every blueprint gets its own netlist, so the instances
+# and wires are named after its own sub-blueprints.
+_shared_simulators: Dict[object, Callable] = StructuralCache()
+_shared_fast_simulators: Dict[object, Callable] = StructuralCache()
+
+# result of the equivalence check of each gate-level blueprint with its native replacement
+_verified_replacements: Dict[BlueprintID, bool] = BlueprintRepository.register_derived_cache({})
+
+# blueprints with more inputs than this are checked on random patterns instead of their full truth table
+EXHAUSTIVE_CHECK_INPUTS = 17
+
+
+def verify_replacement(blueprint_id: BlueprintID, native_id: BlueprintID, num_random_patterns: int = 1 << 12) -> bool:
+    """Check that a native primitive behaves exactly like a gate-level blueprint, both
+    through its word function and through its inlined source
+    """
+    from truth_table import input_pattern # truth_table depends on this module
+
+    blueprint, native = BlueprintRepository[blueprint_id], BlueprintRepository[native_id]
+    if (blueprint.num_inputs, blueprint.num_outputs) != (native.num_inputs, native.num_outputs):
+        return False
+    if blueprint.num_inputs <= EXHAUSTIVE_CHECK_INPUTS:
+        width = 1 << blueprint.num_inputs
+        inputs = [input_pattern(blueprint.num_inputs, port) for port in range(blueprint.num_inputs)]
+    else:
+        width = num_random_patterns
+        inputs = [random.getrandbits(width) for _ in range(blueprint.num_inputs)]
+    expected = CompiledBlueprint(flatten(blueprint_id)).evaluate_packed(inputs, width)
+    return CompiledBlueprint(flatten(native_id)).evaluate_packed(inputs, width) == expected and \
+           native.evaluate_words(inputs, (1 << width) - 1) == expected
+
+
+def native_substitutions() -> Dict[BlueprintID, BlueprintID]:
+    """The gate-level blueprints that can be replaced by a native primitive, each
+    checked once (and again after it or one of its dependencies is re-registered)
+    """
+    substitutions = {}
+    for blueprint_id, native_id in NATIVE_REPLACEMENTS.items():
+        def verify() -> bool:
+            if blueprint_id not in BlueprintRepository:
+                return False
+            # re-registering the native primitive invalidates the check (and fast compilations)
+            BlueprintRepository.add_dependency(blueprint_id, native_id)
+            return verify_replacement(blueprint_id, native_id)
+        if BlueprintRepository.cached(_verified_replacements, blueprint_id, verify):
+            substitutions[blueprint_id] = native_id
+    return substitutions
+
+
+def compile_blueprint(blueprint_id: BlueprintID, mode: str = 'debug') -> CompiledBlueprint:
+    """Flatten and compile a blueprint (cached per BlueprintID and mode). Structurally
+    identical blueprints share the same compiled code.
+
+    In 'debug' mode the blueprint is expanded down to its NAND gates, so every internal
+    wire exists and can be traced or faulted. In 'fast' mode every sub-blueprint with a
+    verified native replacement becomes a single native gate.
+    """
+    if mode == 'debug':
+        cache, shared_cache, substitutions = _compiled_cache, _shared_simulators, None
+    elif mode == 'fast':
+        cache, shared_cache, substitutions = _fast_compiled_cache, _shared_fast_simulators, native_substitutions()
+    else:
+        raise ValueError(f'Unknown compilation mode {mode} (expected debug or fast)')
+
+    def compile_once() -> CompiledBlueprint:
+        key = BlueprintRepository.structural_hash(blueprint_id)
+        if substitutions:
+            key = (key, tuple(sorted((gate_id, BlueprintRepository.structural_hash(native_id)) for gate_id, native_id in substitutions.items())))
+        netlist = flatten(blueprint_id, substitutions)
+        return CompiledBlueprint(netlist, BlueprintRepository.cached(shared_cache, key, lambda: generate_simulator(netlist)))
+    return BlueprintRepository.cached(cache, blueprint_id, compile_once)
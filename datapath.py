@@ -0,0 +1,254 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, NamedTuple
+import time
+from blueprint import BlueprintID
+from compiler import compile_blueprint, CompiledBlueprint
+from alu_blueprints import ALU_OPS, ALU_OP_CODES
+
+
+# 8-bit datapath around the 8BIT_ALU blueprint (see alu_blueprints).
+# The executor holds the registers, the program counter and the flags, and runs a
+# program with every ALU operation going through the compiled ALU. A pure-Python model
+# of the same instruction set cross-checks the results.
+
+JUMPS = ['JMP', 'JZ', 'JNZ', 'JC', 'JNC']
+
+NUM_REGISTERS = 8
+WORD_MASK = 0xff
+
+
+def reference_alu(op: str, a: int, b: int) -> Tuple[int, bool, bool]:
+    """Pure-Python model of the ALU: returns the result, the carry and the zero flag
+    """
+    if op == 'ADD':
+        total = a + b
+        result, carry = total & WORD_MASK, total > WORD_MASK
+    elif op == 'SUB': # a + NOT(b) + 1, the carry is set when there is no borrow
+        total = a + (~b & WORD_MASK) + 1
+        result, carry = total & WORD_MASK, total > WORD_MASK
+    elif op == 'AND':
+        result, carry = a & b, False
+    elif op == 'OR':
+        result, carry = a | b, False
+    elif op == 'NOT':
+        result, carry = ~a & WORD_MASK, False
+    elif op == 'SHL':
+        result, carry = (a << 1) & WORD_MASK, bool(a & 0x80)
+    elif op == 'SHR':
+        result, carry = a >> 1, bool(a & 1)
+    elif op == 'MOV':
+        result, carry = b, False
+    else:
+        raise ValueError(f'Unknown ALU operation {op}')
+    return result, carry, result == 0
+
+
+# Instruction set: the ALU operations take registers (op rd, rs, rt; NOT, SHL and SHR
+# only use rs, MOV only rt), LI loads an immediate through the ALU (as a MOV), the jumps
+# go to imm (JMP always, the others on the zero or carry flag), HALT stops.
+class Instruction(NamedTuple):
+    op: str
+    rd: int = 0
+    rs: int = 0
+    rt: int = 0
+    imm: int = 0
+
+
+def assemble(source: str) -> List[Instruction]:
+    """Assemble one instruction per line, like 'ADD r1, r2, r3', 'LI r0, 5', 'JNZ loop'
+    or 'loop:' (labels are jump targets; ';' starts a comment)
+    """
+    lines = [line.split(';')[0].strip() for line in source.splitlines()]
+    labels: Dict[str, int] = {}
+    statements: List[Tuple[int, str]] = []
+    for number, line in enumerate(lines, 1):
+        while ':' in line:
+            label, line = line.split(':', 1)
+            labels[label.strip()] = len(statements)
+            line = line.strip()
+        if line:
+            statements.append((number, line))
+
+    def register(operand: str, number: int) -> int:
+        if not (operand.lower().startswith('r') and operand[1:].isdigit() and int(operand[1:]) < NUM_REGISTERS):
+            raise ValueError(f'Error in program line {number}: invalid register {operand}')
+        return int(operand[1:])
+
+    def immediate(operand: str, number: int) -> int:
+        if operand in labels:
+            return labels[operand]
+        try:
+            return int(operand, 0)
+        except ValueError:
+            raise ValueError(f'Error in program line {number}: invalid immediate or unknown label {operand}') from None
+
+    program = []
+    for number, line in statements:
+        op, _, rest = line.partition(' ')
+        op = op.upper()
+        operands = [operand.strip() for operand in rest.split(',')] if rest.strip() else []
+        expected = {'NOT': 2, 'SHL': 2, 'SHR': 2, 'MOV': 2, 'LI': 2, 'HALT': 0}.get(op, 1 if op in JUMPS else 3)
+        if op not in ALU_OP_CODES and op not in JUMPS and op not in ('LI', 'HALT'):
+            raise ValueError(f'Error in program line {number}: unknown instruction {op}')
+        if len(operands) != expected:
+            raise ValueError(f'Error in program line {number}: {op} takes {expected} operands, got {len(operands)}')
+        if op in ('NOT', 'SHL', 'SHR'):
+            program.append(Instruction(op, register(operands[0], number), register(operands[1], number)))
+        elif op == 'MOV':
+            program.append(Instruction(op, register(operands[0], number), rt=register(operands[1], number)))
+        elif op == 'LI':
+            program.append(Instruction(op, register(operands[0], number), imm=immediate(operands[1], number) & WORD_MASK))
+        elif op in JUMPS:
+            program.append(Instruction(op, imm=immediate(operands[0], number)))
+        elif op == 'HALT':
+            program.append(Instruction(op))
+        else:
+            program.append(Instruction(op, *(register(operand, number) for operand in operands)))
+    return program
+
+
+class Machine:
+    """Architectural state and instruction sequencing, with a pluggable ALU
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.registers = [0] * NUM_REGISTERS
+        self.pc = 0
+        self.carry = False
+        self.zero = False
+        self.halted = False
+
+    def alu(self, op: str, a: int, b: int) -> Tuple[int, bool, bool]:
+        return reference_alu(op, a, b)
+
+    def step(self, instruction: Instruction) -> bool:
+        """Execute one instruction; returns whether it went through the ALU
+        """
+        op = instruction.op
+        self.pc += 1
+        if op in JUMPS:
+            taken = {'JMP': True, 'JZ': self.zero, 'JNZ': not self.zero, 'JC': self.carry, 'JNC': not self.carry}[op]
+            if taken:
+                self.pc = instruction.imm
+            return False
+        if op == 'HALT':
+            self.halted = True
+            return False
+        registers = self.registers
+        if op == 'LI':
+            op, b = 'MOV', instruction.imm
+        else:
+            b = registers[instruction.rt]
+        registers[instruction.rd], self.carry, self.zero = self.alu(op, registers[instruction.rs], b)
+        return True
+
+    def run(self, program: List[Instruction], max_steps: int = 1 << 20) -> int:
+        """Run until HALT, the end of the program or max_steps; returns the number of
+        instructions executed
+        """
+        steps = 0
+        while not self.halted and 0 <= self.pc < len(program) and steps < max_steps:
+            self.step(program[self.pc])
+            steps += 1
+        return steps
+
+
+def run_reference(program: List[Instruction], max_steps: int = 1 << 20) -> Machine:
+    """Run a program on the pure-Python model and return the final state
+    """
+    machine = Machine()
+    machine.run(program, max_steps)
+    return machine
+
+
+@dataclass
+class ExecutionReport:
+    num_instructions: int = 0
+    num_alu_operations: int = 0
+    seconds: float = 0.0
+    registers: List[int] = field(default_factory=list)
+    # ALU operations whose result differs from the reference model: (pc, instruction, expected, got)
+    mismatches: List[tuple] = field(default_factory=list)
+
+    @property
+    def instructions_per_second(self) -> float:
+        return self.num_instructions / self.seconds if self.seconds else 0.0
+
+
+class DatapathExecutor(Machine):
+    """Run programs with every ALU operation evaluated by the compiled 8BIT_ALU
+    blueprint, optionally cross-checked against the reference model
+    """
+
+    def __init__(self, mode: str = 'fast', check: bool = False, max_reported_mismatches: int = 100, alu_id: BlueprintID = '8BIT_ALU'):
+        self.compiled: CompiledBlueprint = compile_blueprint(alu_id, mode)
+        self.check = check
+        self.max_reported_mismatches = max_reported_mismatches
+        # operand bits (little-endian) of every byte and of every op code
+        self._byte_bits = [[(value >> bit) & 1 for bit in range(8)] for value in range(256)]
+        self._op_bits = {op: [(code >> bit) & 1 for bit in range(3)] for op, code in ALU_OP_CODES.items()}
+        self._report = ExecutionReport()
+        super().__init__()
+
+    def alu(self, op: str, a: int, b: int) -> Tuple[int, bool, bool]:
+        outputs = self.compiled.evaluate_packed(self._byte_bits[a] + self._byte_bits[b] + self._op_bits[op], 1)
+        result = 0
+        for bit in range(8):
+            result |= outputs[bit] << bit
+        values = (result, bool(outputs[8]), bool(outputs[9]))
+        if self.check:
+            expected = reference_alu(op, a, b)
+            if values != expected and len(self._report.mismatches) < self.max_reported_mismatches:
+                self._report.mismatches.append((self.pc - 1, op, expected, values))
+        return values
+
+    def execute(self, program: List[Instruction], max_steps: int = 1 << 20) -> ExecutionReport:
+        """Run a program from the reset state and report the instruction throughput
+        """
+        self.reset()
+        report = self._report = ExecutionReport()
+        started = time.perf_counter()
+        while not self.halted and 0 <= self.pc < len(program) and report.num_instructions < max_steps:
+            if self.step(program[self.pc]):
+                report.num_alu_operations += 1
+            report.num_instructions += 1
+        report.seconds = time.perf_counter() - started
+        report.registers = list(self.registers)
+        return report
+
+
+# Multiplies r1 by r2 into r3 by shifts and adds, over and over (r0 counts the rounds)
+BENCHMARK_PROGRAM = '''
+    LI r0, 0
+round:
+    LI r1, 13
+    LI r2, 11
+    LI r3, 0
+step:
+    SHR r2, r2
+    JNC skip
+    ADD r3, r3, r1
+skip:
+    SHL r1, r1
+    MOV r4, r2
+    JNZ step
+    LI r5, 1
+    ADD r0, r0, r5
+    JNZ round
+    HALT
+'''
+
+
+def benchmark(mode: str = 'fast', check: bool = True, max_steps: int = 1 << 20) -> ExecutionReport:
+    """Run the benchmark program on the datapath; the final registers must match the reference model
+    """
+    program = assemble(BENCHMARK_PROGRAM)
+    report = DatapathExecutor(mode, check).execute(program, max_steps)
+    reference = run_reference(program, max_steps)
+    if reference.registers != report.registers:
+        report.mismatches.append((None, 'registers', reference.registers, report.registers))
+    return report
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from typing import List, Tuple, NamedTuple, Dict, Union
-from blueprint import Blueprint, BlueprintID, NodeIndex, SourcePort, SinkPort, Connection, register_blueprint
+from blueprint import Blueprint, BlueprintID, NodeIndex, SourcePort, SinkPort, Connection, register_blueprint_source
 
 
 # NAND Blueprint
@@ -18,4 +18,7 @@ class NAND_Blueprint(Blueprint):
     def evaluate(self, inputs: List[bool]) -> List[bool]:
         return [not (inputs[0] and inputs[1])]
 
-register_blueprint(NAND_Blueprint())
\ No newline at end of file
+    def evaluate_words(self, inputs: List[int], mask: int) -> List[int]:
+        return [mask ^ (inputs[0] & inputs[1])]
+
+register_blueprint_source('NAND', NAND_Blueprint)
\ No newline at end of file
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import List, Tuple, NamedTuple, Dict, Iterable
+import heapq
+from blueprint import BlueprintID, BlueprintRepository
+from compiler import Wire, CONST_FALSE, CONST_TRUE, Netlist, compile_blueprint, generate_simulator, pack_vectors
+
+
+# Stuck-at fault simulation.
+# Faults are placed on every wire of the flattened netlist (blueprint inputs and gate
+# outputs). The test vectors are simulated bit-parallel: every bit of a word is one
+# test pattern, so a whole block of patterns goes through the circuit at once. Each
+# fault is then injected on its own (parallel-pattern single-fault propagation) and only
+# the gates in the fan-out cone of the faulty wire are re-evaluated, stopping as soon as
+# the faulty values die out. Faults are dropped once they are detected.
+
+
+class Fault(NamedTuple):
+    wire: Wire
+    stuck_at: bool
+
+
+@dataclass
+class FaultReport:
+    netlist: Netlist
+    faults: List[Fault] # collapsed fault list
+    detected: List[Fault]
+    undetected: List[Fault]
+    num_vectors: int
+    equivalent: Dict[Fault, Fault] = field(default_factory=dict) # faults removed by collapsing, and the fault they are equivalent to
+
+    @property
+    def coverage(self) -> float:
+        return len(self.detected) / len(self.faults) if self.faults else 1.0
+
+    def fault_name(self, fault: Fault) -> str:
+        return f'{self.netlist.wire_name(fault.wire)} stuck-at-{int(fault.stuck_at)}'
+
+    def summary(self) -> str:
+        lines = [f'{self.netlist.blueprint_id}: {len(self.detected)}/{len(self.faults)} faults detected '
+                 f'({self.coverage:.2%} coverage) by {self.num_vectors} vectors']
+        lines.extend(f'  undetected: {self.fault_name(fault)}' for fault in self.undetected)
+        return '\n'.join(lines)
+
+
+def _readers(netlist: Netlist) -> List[List[int]]:
+    # indexes of the gates reading each wire
+    readers: List[List[int]] = [[] for _ in range(netlist.num_wires)]
+    for index, gate in enumerate(netlist.gates):
+        for wire in set(gate.inputs):
+            readers[wire].append(index)
+    return readers
+
+
+def collapse_faults(netlist: Netlist) -> Tuple[List[Fault], Dict[Fault, Fault]]:
+    """List the stuck-at faults of a netlist with structurally equivalent faults removed.
+
+    A wire whose only reader is a NAND gate (and that is not an output of the blueprint)
+    stuck at 0 is indistinguishable from the gate output stuck at 1. If the NAND is used
+    as an inverter, the wire stuck at 1 is also the same as the output stuck at 0.
+    """
+    readers = _readers(netlist)
+    primary_outputs = set(netlist.outputs)
+    equivalent: Dict[Fault, Fault] = {}
+
+    for gate in netlist.gates:
+        if gate.kind != 'NAND':
+            continue
+        output = gate.outputs[0]
+        inverter = CONST_TRUE in gate.inputs or gate.inputs[0] == gate.inputs[1]
+        for wire in set(gate.inputs):
+            if wire in (CONST_FALSE, CONST_TRUE) or wire in primary_outputs or len(readers[wire]) != 1:
+                continue
+            if CONST_FALSE in gate.inputs:
+                continue # the output is constant, nothing on the input can be seen
+            equivalent[Fault(wire, False)] = Fault(output, True)
+            if inverter:
+                equivalent[Fault(wire, True)] = Fault(output, False)
+
+    # an output fault can itself be equivalent to a fault further on: point every fault
+    # at the last one of its chain, the representative kept in the fault list
+    for fault, representative in equivalent.items():
+        while representative in equivalent:
+            representative = equivalent[representative]
+        equivalent[fault] = representative
+
+    wires = list(netlist.inputs) + [wire for gate in netlist.gates for wire in gate.outputs]
+    faults = [Fault(wire, value) for wire in wires for value in (False, True) if Fault(wire, value) not in equivalent]
+    return faults, equivalent
+
+
+def fault_coverage(blueprint_id: BlueprintID, vectors: Iterable[List[bool]], block_size: int = 4096) -> FaultReport:
+    """Simulate every (collapsed) stuck-at fault of a blueprint against a set of test
+    vectors and report which ones the vectors detect. Blueprints with state (like RAMs)
+    are not supported: every fault re-evaluates gates on the same patterns.
+    """
+    compiled = compile_blueprint(blueprint_id)
+    netlist = compiled.netlist
+    gates = netlist.gates
+    embedded = {gate.kind: BlueprintRepository[gate.kind] for gate in gates}
+    stateful = sorted(kind for kind, blueprint in embedded.items() if blueprint.is_stateful)
+    if stateful:
+        raise ValueError(f'Error in fault simulation of {blueprint_id}: stateful gates {stateful} cannot be fault simulated')
+    faults, equivalent = collapse_faults(netlist)
+    readers = _readers(netlist)
+    # good-machine values of every wire, from the compiled code observing all of them
+    simulate_all_wires = generate_simulator(netlist, range(netlist.num_wires))
+
+    remaining = list(faults)
+    detected: List[Fault] = []
+    num_vectors = 0
+
+    def blocks() -> Iterable[List[List[bool]]]:
+        block = []
+        for vector in vectors:
+            block.append(vector)
+            if len(block) == block_size:
+                yield block
+                block = []
+        if block:
+            yield block
+
+    for block in blocks():
+        num_vectors += len(block)
+        mask = (1 << len(block)) - 1
+        _, good = simulate_all_wires(pack_vectors(block, netlist.num_inputs), mask)
+
+        still_undetected = []
+        for fault in remaining:
+            stuck_word = mask if fault.stuck_at else 0
+            if good[fault.wire] == stuck_word:
+                still_undetected.append(fault) # never activated by this block
+                continue
+
+            # propagate the difference through the fan-out cone in topological order
+            faulty: Dict[Wire, int] = {fault.wire: stuck_word}
+            queue = list(readers[fault.wire])
+            heapq.heapify(queue)
+            queued = set(queue)
+            while queue:
+                index = heapq.heappop(queue)
+                gate = gates[index]
+                inputs = [faulty.get(wire, good[wire]) for wire in gate.inputs]
+                if gate.kind == 'NAND':
+                    results = [mask ^ (inputs[0] & inputs[1])]
+                else:
+                    results = embedded[gate.kind].evaluate_words(inputs, mask)
+                for wire, value in zip(gate.outputs, results):
+                    if wire == fault.wire or value == good[wire]:
+                        continue
+                    faulty[wire] = value
+                    for reader in readers[wire]:
+                        if reader not in queued:
+                            queued.add(reader)
+                            heapq.heappush(queue, reader)
+
+            if any(faulty.get(wire, good[wire]) != good[wire] for wire in netlist.outputs):
+                detected.append(fault)
+            else:
+                still_undetected.append(fault)
+        remaining = still_undetected
+
+    return FaultReport(netlist, faults, detected, remaining, num_vectors, equivalent)
+
@@ -1,5 +1,8 @@
 
 from blueprint import BlueprintRepository, make_truth_table, json_export_blueprint, json_import_blueprint, register_blueprint
+from vectors import run_vectors
+from datapath import benchmark
+import argparse
 
 import embedded_blueprints
 import basic_blueprints
@@ -18,7 +21,49 @@ def list_loaded_blueprints():
 
 
 
+def run_vectors_command(args):
+    report = run_vectors(args.blueprint, args.input, args.output, args.expected, args.chunk_size)
+    print(f'{report.num_vectors} vectors through {report.blueprint_id} in {report.seconds:.3f}s ({report.vectors_per_second:.0f} vectors/s)')
+    if args.expected is not None:
+        print(f'{report.num_mismatches} mismatches')
+        for index in report.mismatches:
+            print(f'->vector {index}')
+        if report.num_mismatches:
+            raise SystemExit(1)
+
+
+def datapath_benchmark_command(args):
+    report = benchmark(args.mode)
+    print(f'{report.num_instructions} instructions ({report.num_alu_operations} ALU operations) in {report.seconds:.3f}s '
+          f'({report.instructions_per_second:.0f} instructions/s)')
+    print(f'{len(report.mismatches)} mismatches with the reference model')
+    for mismatch in report.mismatches:
+        print(f'->{mismatch}')
+    if report.mismatches:
+        raise SystemExit(1)
+
+
 def main():
+    parser = argparse.ArgumentParser(description='Logic simulator')
+    commands = parser.add_subparsers(dest='command')
+    vectors_parser = commands.add_parser('run-vectors', help='evaluate a packed test vector file')
+    vectors_parser.add_argument('blueprint')
+    vectors_parser.add_argument('input', help='packed input vectors')
+    vectors_parser.add_argument('output', nargs='?', help='packed output vectors (optional in compare-only mode)')
+    vectors_parser.add_argument('--expected', help='packed expected outputs to compare against')
+    vectors_parser.add_argument('--chunk-size', type=int, default=1 << 16, help='vectors evaluated per chunk')
+    datapath_parser = commands.add_parser('datapath-benchmark', help='run a program through the compiled 8-bit ALU')
+    datapath_parser.add_argument('--mode', choices=['debug', 'fast'], default='fast', help='compilation mode of the ALU')
+    args = parser.parse_args()
+
+    if args.command == 'run-vectors':
+        if args.output is None and args.expected is None:
+            parser.error('run-vectors needs an output file, --expected, or both')
+        run_vectors_command(args)
+        return
+    if args.command == 'datapath-benchmark':
+        datapath_benchmark_command(args)
+        return
     
     json_export_blueprint(BlueprintRepository["AND"], "AND_BLUEPRINT.json")
     register_blueprint(json_import_blueprint("AND_BLUEPRINT.json"))
@@ -0,0 +1,174 @@
+from dataclasses import dataclass
+from typing import List, Union
+import mmap
+from blueprint import Blueprint, BlueprintID, BlueprintRepository, SinkPort, register_blueprint_source
+
+
+# Behavioral memories.
+# RAMs, ROMs and register files are embedded blueprints keeping their contents in a
+# bytearray (or a memory mapped file), one little-endian word of ceil(word_bits / 8)
+# bytes per address, so an access costs the same whatever the size of the memory.
+# Addresses and data words are given as bits on consecutive ports, least significant
+# bit first (like the operands of the adders).
+#
+# Every call of evaluate is one clock cycle: the outputs are the words stored at the
+# read addresses at the start of the cycle, then the write (if enabled) takes place.
+# The patterns of evaluate_words are therefore consecutive cycles, applied in bit order.
+# There is one storage per BlueprintID: every node using the same memory id shares its
+# contents, so define one id per physical memory.
+
+
+def bits_to_int(bits: List[bool]) -> int:
+    value = 0
+    for bit, on in enumerate(bits):
+        if on:
+            value |= 1 << bit
+    return value
+
+
+def int_to_bits(value: int, count: int) -> List[bool]:
+    return [bool((value >> bit) & 1) for bit in range(count)]
+
+
+def _labels(prefix: str, count: int) -> List[str]:
+    return [f'{prefix}{bit}' for bit in range(count)]
+
+
+@dataclass
+class Memory_Blueprint(Blueprint):
+    stateful = True
+
+    def __init__(self, blueprint_id: BlueprintID, address_bits: int, word_bits: int, input_labels: List[str], output_labels: List[str],
+                 path: str = None, image: Union[bytes, str] = None):
+        self.address_bits = address_bits
+        self.word_bits = word_bits
+        self.word_size = (word_bits + 7) // 8
+        self.num_words = 1 << address_bits
+        size = self.num_words * self.word_size
+        if path is not None: # contents kept in (and persisted to) a file
+            with open(path, 'ab') as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            with open(path, 'r+b') as f: # the mapping keeps its own handle on the file
+                self.storage = mmap.mmap(f.fileno(), size)
+        else:
+            self.storage = bytearray(size)
+        if image is not None:
+            self.load(image)
+        # connections contain dummy connections to pass the validation check
+        super().__init__(_node_list=[], _connections={SinkPort(None, port): False for port in range(len(output_labels))},
+                         num_inputs=len(input_labels), num_outputs=len(output_labels),
+                         input_labels=input_labels, output_labels=output_labels, _id=blueprint_id)
+
+    def read(self, address: int) -> int:
+        offset = address * self.word_size
+        return int.from_bytes(self.storage[offset:offset + self.word_size], 'little')
+
+    def write(self, address: int, value: int):
+        offset = address * self.word_size
+        self.storage[offset:offset + self.word_size] = (value & ((1 << self.word_bits) - 1)).to_bytes(self.word_size, 'little')
+        if not self.stateful:
+            self._contents_changed()
+
+    def load(self, image: Union[bytes, str], address: int = 0):
+        """Copy a binary image (bytes, or the path of a file) into the memory, starting at address
+        """
+        if isinstance(image, str):
+            with open(image, 'rb') as f:
+                image = f.read()
+        offset = address * self.word_size
+        if offset + len(image) > len(self.storage):
+            raise ValueError(f'Error in blueprint {self.id}: image of {len(image)} bytes does not fit at address {address} '
+                             f'({self.num_words} words of {self.word_size} bytes)')
+        self.storage[offset:offset + len(image)] = image
+        self._contents_changed()
+
+    def dump(self) -> bytes:
+        return bytes(self.storage)
+
+    def clear(self):
+        self.storage[:] = bytes(len(self.storage))
+        self._contents_changed()
+
+    def _contents_changed(self):
+        # a ROM is used as a plain function (tabulated, promoted to a lookup table,
+        # folded by specialize), so what was derived from its old contents is dropped
+        if not self.stateful and self._id is not None and BlueprintRepository.is_loaded(self._id) and BlueprintRepository[self._id] is self:
+            BlueprintRepository.contents_changed(self._id)
+
+    def flush(self):
+        if isinstance(self.storage, mmap.mmap):
+            self.storage.flush()
+
+    def close(self):
+        """Write a file-backed memory back to its file and release the mapping (the
+        memory cannot be used afterwards)
+        """
+        if isinstance(self.storage, mmap.mmap) and not self.storage.closed:
+            self.storage.flush()
+            self.storage.close()
+
+
+@dataclass
+class RAM_Blueprint(Memory_Blueprint):
+    # inputs: address, data, write enable; outputs: data read
+    def __init__(self, blueprint_id: BlueprintID, address_bits: int, word_bits: int, path: str = None, image: Union[bytes, str] = None):
+        super().__init__(blueprint_id, address_bits, word_bits, _labels('A', address_bits) + _labels('D', word_bits) + ['WE'],
+                         _labels('Q', word_bits), path, image)
+
+    def evaluate(self, inputs: List[bool]) -> List[bool]:
+        address = bits_to_int(inputs[:self.address_bits])
+        outputs = int_to_bits(self.read(address), self.word_bits)
+        if inputs[-1]:
+            self.write(address, bits_to_int(inputs[self.address_bits:self.address_bits + self.word_bits]))
+        return outputs
+
+
+@dataclass
+class ROM_Blueprint(Memory_Blueprint):
+    # inputs: address; outputs: data. The contents only change through load, write or
+    # clear, which drop what was derived from them, so a ROM is a plain function.
+    stateful = False
+
+    def __init__(self, blueprint_id: BlueprintID, address_bits: int, word_bits: int, image: Union[bytes, str] = None, path: str = None):
+        super().__init__(blueprint_id, address_bits, word_bits, _labels('A', address_bits), _labels('Q', word_bits), path, image)
+
+    def evaluate(self, inputs: List[bool]) -> List[bool]:
+        return int_to_bits(self.read(bits_to_int(inputs)), self.word_bits)
+
+
+@dataclass
+class RegisterFile_Blueprint(Memory_Blueprint):
+    # inputs: read address A, read address B, write address, write data, write enable;
+    # outputs: data of register A, data of register B
+    def __init__(self, blueprint_id: BlueprintID, address_bits: int, word_bits: int, path: str = None):
+        super().__init__(blueprint_id, address_bits, word_bits,
+                         _labels('RA', address_bits) + _labels('RB', address_bits) + _labels('WA', address_bits) + _labels('D', word_bits) + ['WE'],
+                         _labels('A', word_bits) + _labels('B', word_bits), path)
+
+    def evaluate(self, inputs: List[bool]) -> List[bool]:
+        n = self.address_bits
+        outputs = int_to_bits(self.read(bits_to_int(inputs[:n])), self.word_bits) + \
+                  int_to_bits(self.read(bits_to_int(inputs[n:2 * n])), self.word_bits)
+        if inputs[-1]:
+            self.write(bits_to_int(inputs[2 * n:3 * n]), bits_to_int(inputs[3 * n:3 * n + self.word_bits]))
+        return outputs
+
+
+def define_ram(blueprint_id: BlueprintID, address_bits: int, word_bits: int, path: str = None, image: Union[bytes, str] = None):
+    register_blueprint_source(blueprint_id, lambda: RAM_Blueprint(blueprint_id, address_bits, word_bits, path, image))
+
+
+def define_rom(blueprint_id: BlueprintID, address_bits: int, word_bits: int, image: Union[bytes, str] = None, path: str = None):
+    register_blueprint_source(blueprint_id, lambda: ROM_Blueprint(blueprint_id, address_bits, word_bits, image, path))
+
+
+def define_register_file(blueprint_id: BlueprintID, address_bits: int, word_bits: int, path: str = None):
+    register_blueprint_source(blueprint_id, lambda: RegisterFile_Blueprint(blueprint_id, address_bits, word_bits, path))
+
+
+# 256 bytes of RAM
+define_ram('RAM_256X8', 8, 8)
+
+# 8 registers of 8 bits
+define_register_file('REGISTER_FILE_8X8', 3, 8)
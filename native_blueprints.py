@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+from typing import List, Dict, Callable
+from blueprint import Blueprint, BlueprintID, SinkPort, register_blueprint_source
+
+
+# Native primitives.
+# Embedded blueprints computing common blocks directly with bitwise operations on whole
+# words of patterns, instead of going through their NAND gates. Each one names the
+# gate-level blueprint it can stand in for; the compiler's fast mode substitutes it for
+# that blueprint once their truth tables have been checked to be identical (see
+# compiler.native_substitutions). Ports are in the same order as the gate-level blueprints.
+#
+# Besides its word function, a native primitive gives the Python source of the same
+# computation, which the compiler inlines into the generated code: a function call per
+# gate would cost more than the NAND gates it replaces.
+
+WordFunction = Callable[[List[int], int], List[int]]
+# names of the input words, names of the output words, prefix for temporary variables ->
+# statements computing the outputs (the pattern mask is m)
+InlineFunction = Callable[[List[str], List[str], str], List[str]]
+
+# gate-level BlueprintID -> BlueprintID of the native primitive replacing it
+NATIVE_REPLACEMENTS: Dict[BlueprintID, BlueprintID] = {}
+
+
+@dataclass
+class Native_Blueprint(Blueprint):
+    def __init__(self, blueprint_id: BlueprintID, num_inputs: int, num_outputs: int, words: WordFunction, replaces: BlueprintID = None,
+                 inline: InlineFunction = None):
+        self.words = words
+        self.replaces = replaces
+        self.inline = inline
+        # connections contain dummy connections to pass the validation check
+        super().__init__(_node_list=[], _connections={SinkPort(None, port): False for port in range(num_outputs)},
+                         num_inputs=num_inputs, num_outputs=num_outputs, input_labels=[], output_labels=[], _id=blueprint_id)
+
+    def evaluate(self, inputs: List[bool]) -> List[bool]:
+        return [bool(word) for word in self.words([1 if value else 0 for value in inputs], 1)]
+
+    def evaluate_words(self, inputs: List[int], mask: int) -> List[int]:
+        return self.words(inputs, mask)
+
+
+def define_native(blueprint_id: BlueprintID, num_inputs: int, num_outputs: int, words: WordFunction, replaces: BlueprintID = None,
+                  inline: InlineFunction = None):
+    """Lazily register a native primitive, optionally as a replacement for a gate-level blueprint
+    """
+    register_blueprint_source(blueprint_id, lambda: Native_Blueprint(blueprint_id, num_inputs, num_outputs, words, replaces, inline))
+    if replaces is not None:
+        NATIVE_REPLACEMENTS[replaces] = blueprint_id
+
+
+def expressions(function: Callable[[List[str]], List[str]]) -> InlineFunction:
+    # primitives whose outputs are plain expressions of the inputs
+    return lambda inputs, outputs, prefix: [f'{output} = {expression}' for output, expression in zip(outputs, function(inputs))]
+
+
+def ripple_add(a: List[int], b: List[int], carry: int) -> List[int]:
+    """Add two little-endian numbers bit-parallel; returns the sum bits followed by the carry out
+    """
+    outputs = []
+    for a_bit, b_bit in zip(a, b):
+        half = a_bit ^ b_bit
+        outputs.append(half ^ carry)
+        carry = (a_bit & b_bit) | (carry & half)
+    outputs.append(carry)
+    return outputs
+
+
+def ripple_add_source(a: List[str], b: List[str], carry: str, outputs: List[str], prefix: str) -> List[str]:
+    """Statements of ripple_add, with the sum bits and the carry out assigned to outputs
+    """
+    lines = []
+    for bit, (a_bit, b_bit) in enumerate(zip(a, b)):
+        half, next_carry = f'{prefix}h{bit}', f'{prefix}c{bit}'
+        lines.append(f'{half} = {a_bit} ^ {b_bit}')
+        lines.append(f'{outputs[bit]} = {half} ^ {carry}')
+        lines.append(f'{next_carry} = ({a_bit} & {b_bit}) | ({carry} & {half})')
+        carry = next_carry
+    lines.append(f'{outputs[len(a)]} = {carry}')
+    return lines
+
+
+def adder(bits: int) -> WordFunction:
+    # inputs a0..an-1, b0..bn-1, carry in; outputs s0..sn-1, carry out
+    return lambda inputs, m: ripple_add(inputs[:bits], inputs[bits:2 * bits], inputs[2 * bits])
+
+
+def adder_source(bits: int) -> InlineFunction:
+    return lambda inputs, outputs, prefix: ripple_add_source(inputs[:bits], inputs[bits:2 * bits], inputs[2 * bits], outputs, prefix)
+
+
+def adder_subtractor(bits: int) -> WordFunction:
+    # a - b is a + NOT(b) + 1, selected by the last input
+    def words(inputs: List[int], m: int) -> List[int]:
+        subtract = inputs[2 * bits]
+        return ripple_add(inputs[:bits], [b ^ subtract for b in inputs[bits:2 * bits]], subtract)
+    return words
+
+
+def adder_subtractor_source(bits: int) -> InlineFunction:
+    def source(inputs: List[str], outputs: List[str], prefix: str) -> List[str]:
+        subtract = inputs[2 * bits]
+        b = [f'{prefix}b{bit}' for bit in range(bits)]
+        lines = [f'{b_bit} = {word} ^ {subtract}' for b_bit, word in zip(b, inputs[bits:2 * bits])]
+        return lines + ripple_add_source(inputs[:bits], b, subtract, outputs, prefix)
+    return source
+
+
+def bitwise(bits: int, operation: Callable[[int, int, int], int]) -> WordFunction:
+    return lambda inputs, m: [operation(inputs[bit], inputs[bits + bit], m) for bit in range(bits)]
+
+
+def bitwise_source(bits: int, operator: str) -> InlineFunction:
+    return expressions(lambda inputs: [f'{inputs[bit]} {operator} {inputs[bits + bit]}' for bit in range(bits)])
+
+
+define_native('NATIVE_NOT', 1, 1, lambda inputs, m: [m ^ inputs[0]], replaces='NOT',
+              inline=expressions(lambda inputs: [f'm ^ {inputs[0]}']))
+define_native('NATIVE_AND', 2, 1, lambda inputs, m: [inputs[0] & inputs[1]], replaces='AND', inline=bitwise_source(1, '&'))
+define_native('NATIVE_OR', 2, 1, lambda inputs, m: [inputs[0] | inputs[1]], replaces='OR', inline=bitwise_source(1, '|'))
+define_native('NATIVE_XOR', 2, 1, lambda inputs, m: [inputs[0] ^ inputs[1]], replaces='XOR', inline=bitwise_source(1, '^'))
+define_native('NATIVE_HALF_ADDER', 2, 2, lambda inputs, m: [inputs[0] ^ inputs[1], inputs[0] & inputs[1]], replaces='HALF_ADDER',
+              inline=expressions(lambda inputs: [f'{inputs[0]} ^ {inputs[1]}', f'{inputs[0]} & {inputs[1]}']))
+define_native('NATIVE_FULL_ADDER', 3, 2, adder(1), replaces='FULL_ADDER', inline=adder_source(1))
+define_native('NATIVE_2BIT_FULL_ADDER', 5, 3, adder(2), replaces='2BIT_FULL_ADDER', inline=adder_source(2))
+define_native('NATIVE_4BIT_FULL_ADDER', 9, 5, adder(4), replaces='4BIT_FULL_ADDER', inline=adder_source(4))
+define_native('NATIVE_8BIT_FULL_ADDER', 17, 9, adder(8), replaces='8BIT_FULL_ADDER', inline=adder_source(8))
+define_native('NATIVE_8BIT_FULL_ADDER-SUBTRACTOR', 17, 9, adder_subtractor(8), replaces='8BIT_FULL_ADDER-SUBTRACTOR',
+              inline=adder_subtractor_source(8))
+define_native('NATIVE_8BIT_AND', 16, 8, bitwise(8, lambda a, b, m: a & b), replaces='8BIT_AND', inline=bitwise_source(8, '&'))
+define_native('NATIVE_8BIT_OR', 16, 8, bitwise(8, lambda a, b, m: a | b), replaces='8BIT_OR', inline=bitwise_source(8, '|'))
+define_native('NATIVE_8BIT_NOT', 8, 8, lambda inputs, m: [m ^ word for word in inputs], replaces='8BIT_NOT',
+              inline=expressions(lambda inputs: [f'm ^ {word}' for word in inputs]))
@@ -0,0 +1,309 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Dict, Tuple
+from multiprocessing import shared_memory
+import multiprocessing, os, threading, time, traceback
+from blueprint import BlueprintID, BlueprintRepository
+from compiler import Wire, CONST_FALSE, CONST_TRUE, Netlist, compile_blueprint
+
+
+# Partitioned simulation of a single large circuit.
+# The flattened netlist is split into one region per worker process, trying to cut as
+# few wires as possible. Each gate then gets a band: a gate reading a wire produced in
+# another region has to wait for the band after the one that produced it, while gates
+# reading wires of their own region can run in the same band. Every step, the workers
+# evaluate their gates band by band; wires crossing regions are exchanged through
+# shared memory and all the processes meet at a barrier between bands. Fewer cut wires
+# means fewer bands and less traffic, which is what the partitioner optimizes.
+
+
+@dataclass
+class Partition:
+    parts: List[int] # region of each gate
+    bands: List[int] # band of each gate
+    num_parts: int
+    num_bands: int
+    cut_wires: List[Wire] # wires read outside the region producing them
+
+    @property
+    def part_sizes(self) -> List[int]:
+        sizes = [0] * self.num_parts
+        for part in self.parts:
+            sizes[part] += 1
+        return sizes
+
+
+def _gate_graph(netlist: Netlist) -> Tuple[List[int|None], List[List[int]]]:
+    drivers: List[int|None] = [None] * netlist.num_wires
+    readers: List[List[int]] = [[] for _ in range(netlist.num_wires)]
+    for index, gate in enumerate(netlist.gates):
+        for wire in gate.outputs:
+            drivers[wire] = index
+        for wire in set(gate.inputs):
+            readers[wire].append(index)
+    return drivers, readers
+
+
+def partition_netlist(netlist: Netlist, num_parts: int, passes: int = 4, imbalance: float = 0.05) -> Partition:
+    """Split the gates of a netlist into num_parts balanced regions with few cut wires
+    """
+    gates = netlist.gates
+    num_parts = max(1, min(num_parts, len(gates)))
+    drivers, readers = _gate_graph(netlist)
+
+    # Initial regions: list the gates output cone by output cone (depth-first from each
+    # output), so gates feeding the same outputs end up next to each other, then cut
+    # that list into equal slices.
+    order: List[int] = []
+    seen = set()
+    roots = [drivers[wire] for wire in netlist.outputs if drivers[wire] is not None]
+    roots += [index for index in range(len(gates) - 1, -1, -1)] # gates not feeding any output
+    for root in roots:
+        if root in seen:
+            continue
+        seen.add(root)
+        stack = [(root, iter(gates[root].inputs))]
+        while stack:
+            index, pending = stack[-1]
+            wire = next(pending, None)
+            if wire is None:
+                stack.pop()
+                order.append(index)
+            elif drivers[wire] is not None and drivers[wire] not in seen:
+                seen.add(drivers[wire])
+                stack.append((drivers[wire], iter(gates[drivers[wire]].inputs)))
+
+    parts = [0] * len(gates)
+    for position, index in enumerate(order):
+        parts[index] = position * num_parts // len(gates)
+
+    # Refinement: greedily move gates to the region most of their neighbours are in,
+    # as long as the regions stay balanced
+    sizes = [0] * num_parts
+    for part in parts:
+        sizes[part] += 1
+    limit = int(len(gates) / num_parts * (1 + imbalance)) + 1
+    for _ in range(passes):
+        moved = 0
+        for index, gate in enumerate(gates):
+            neighbours = [drivers[wire] for wire in gate.inputs if drivers[wire] is not None]
+            neighbours += [reader for wire in gate.outputs for reader in readers[wire]]
+            if not neighbours:
+                continue
+            counts: Dict[int, int] = {}
+            for neighbour in neighbours:
+                counts[parts[neighbour]] = counts.get(parts[neighbour], 0) + 1
+            current = parts[index]
+            best = max(counts, key=lambda part: (counts[part], part == current))
+            if best != current and counts[best] > counts.get(current, 0) and sizes[best] < limit:
+                sizes[current] -= 1
+                sizes[best] += 1
+                parts[index] = best
+                moved += 1
+        if not moved:
+            break
+
+    # bands, following the (topological) gate order
+    bands = [0] * len(gates)
+    for index, gate in enumerate(gates):
+        band = 0
+        for wire in gate.inputs:
+            driver = drivers[wire]
+            if driver is not None:
+                band = max(band, bands[driver] + (parts[driver] != parts[index]))
+        bands[index] = band
+
+    cut_wires = sorted({wire for index, gate in enumerate(gates) for wire in gate.inputs
+                        if drivers[wire] is not None and parts[drivers[wire]] != parts[index]})
+    return Partition(parts, bands, num_parts, max(bands, default=-1) + 1, cut_wires)
+
+
+# Shared memory layout: a header (word size in bytes, stop flag), then one slot per
+# blueprint input, then one slot per exchanged wire (cut wires and blueprint outputs)
+_HEADER_SIZE = 16
+
+# seconds a process waits at a barrier during a step before giving up on the others
+BARRIER_TIMEOUT = 60.0
+
+
+def _generate_band_functions(netlist: Netlist, partition: Partition, part: int, slots: Dict[Wire, int], slot_size: int) -> str:
+    """Python source of one function per band for the gates of one region. The functions
+    keep the wire values of the region in the list v between bands.
+    """
+    drivers, _ = _gate_graph(netlist)
+    exported = set(slots)
+    loaded = {CONST_FALSE, CONST_TRUE}
+    lines = []
+    namespace_lines = []
+    for band in range(partition.num_bands):
+        lines.append(f'def band{band}(v, buf, m):')
+        lines.append('    v[1] = m')
+        body = []
+        for index, gate in enumerate(netlist.gates):
+            if partition.parts[index] != part or partition.bands[index] != band:
+                continue
+            for wire in gate.inputs:
+                if wire not in loaded and (drivers[wire] is None or partition.parts[drivers[wire]] != part):
+                    offset = _HEADER_SIZE + slots[wire] * slot_size
+                    body.append(f'    v[{wire}] = int.from_bytes(buf[{offset}:{offset + slot_size}], "little")')
+                    loaded.add(wire)
+            if gate.kind == 'NAND':
+                body.append(f'    v[{gate.outputs[0]}] = m ^ (v[{gate.inputs[0]}] & v[{gate.inputs[1]}])')
+            else:
+                namespace_lines.append(f'g{index} = BlueprintRepository[{gate.kind!r}].evaluate_words')
+                targets = ''.join(f'v[{wire}], ' for wire in gate.outputs)
+                sources = ', '.join(f'v[{wire}]' for wire in gate.inputs)
+                body.append(f'    {targets}= g{index}([{sources}], m)')
+            for wire in gate.outputs:
+                loaded.add(wire)
+                if wire in exported:
+                    offset = _HEADER_SIZE + slots[wire] * slot_size
+                    body.append(f'    buf[{offset}:{offset + slot_size}] = v[{wire}].to_bytes({slot_size}, "little")')
+        lines.extend(body or ['    pass'])
+    lines.append(f'bands = [{", ".join(f"band{band}" for band in range(partition.num_bands))}]')
+    return '\n'.join(['from blueprint import BlueprintRepository'] + namespace_lines + lines)
+
+
+def _worker(part: int, source: str, num_wires: int, shm_name: str, barrier, errors):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        namespace = {}
+        exec(compile(source, '<partition>', 'exec'), namespace)
+        bands = namespace['bands']
+        values = [0] * num_wires
+        buf = shm.buf
+        while True:
+            barrier.wait() # a step starts (or the simulator stops); no timeout, the parent may be idle
+            if buf[8]:
+                return
+            width = int.from_bytes(buf[0:8], 'little')
+            mask = (1 << width) - 1
+            for band in bands:
+                band(values, buf, mask)
+                barrier.wait(BARRIER_TIMEOUT)
+    except threading.BrokenBarrierError:
+        pass # another process failed or timed out, and reports it
+    except BaseException:
+        errors.put((part, traceback.format_exc()))
+        barrier.abort()
+    finally:
+        buf = None
+        shm.close()
+
+
+class PartitionedSimulator:
+    """Simulate one flattened blueprint with its gates split over several worker processes.
+    Every worker evaluates its gates in its own process, so blueprints with state (like
+    RAMs) are not supported. If a worker fails or a step does not complete within
+    BARRIER_TIMEOUT seconds, the step raises a RuntimeError and the simulator is closed.
+    """
+
+    def __init__(self, blueprint_id: BlueprintID, num_workers: int = None, word_bits: int = 64):
+        self.netlist = compile_blueprint(blueprint_id).netlist
+        stateful = sorted({gate.kind for gate in self.netlist.gates if BlueprintRepository[gate.kind].is_stateful})
+        if stateful:
+            raise ValueError(f'Error in partitioned simulation of {blueprint_id}: stateful gates {stateful} would keep their state in the worker processes')
+        self.partition = partition_netlist(self.netlist, num_workers or os.cpu_count() or 1)
+        self.word_bits = word_bits
+        slot_size = (word_bits + 7) // 8
+
+        # blueprint inputs first, then every wire that needs to leave its region
+        exchanged = list(self.partition.cut_wires)
+        exchanged += [wire for wire in self.netlist.outputs if wire >= 2 + self.netlist.num_inputs and wire not in exchanged]
+        self._slots: Dict[Wire, int] = {wire: slot for slot, wire in enumerate(self.netlist.inputs)}
+        for wire in exchanged:
+            if wire not in self._slots:
+                self._slots[wire] = len(self._slots)
+        self._slot_size = slot_size
+
+        self._shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + len(self._slots) * slot_size)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self._barrier = context.Barrier(self.partition.num_parts + 1)
+        self._errors = context.SimpleQueue()
+        self._workers = []
+        for part in range(self.partition.num_parts):
+            source = _generate_band_functions(self.netlist, self.partition, part, self._slots, slot_size)
+            worker = context.Process(target=_worker, args=(part, source, self.netlist.num_wires, self._shm.name, self._barrier, self._errors), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def __enter__(self) -> PartitionedSimulator:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def evaluate_packed(self, inputs: List[int], count: int) -> List[int]:
+        """Evaluate up to word_bits patterns at once (bit k of every word is one pattern)
+        """
+        if len(inputs) != self.netlist.num_inputs:
+            raise ValueError(f'Incorrect number of inputs provided for evaluation of blueprint {self.netlist.blueprint_id} (expected {self.netlist.num_inputs}, got {len(inputs)})')
+        if count > self.word_bits:
+            raise ValueError(f'Cannot evaluate {count} patterns at once with {self.word_bits}-bit words')
+        if not self._workers:
+            raise RuntimeError(f'Error in partitioned simulation of {self.netlist.blueprint_id}: the simulator is closed')
+        mask = (1 << count) - 1
+        buf = self._shm.buf
+        buf[0:8] = count.to_bytes(8, 'little')
+        for wire, word in zip(self.netlist.inputs, inputs):
+            offset = _HEADER_SIZE + self._slots[wire] * self._slot_size
+            buf[offset:offset + self._slot_size] = (word & mask).to_bytes(self._slot_size, 'little')
+
+        try:
+            self._barrier.wait(BARRIER_TIMEOUT) # start the step
+            for _ in range(self.partition.num_bands):
+                self._barrier.wait(BARRIER_TIMEOUT)
+        except threading.BrokenBarrierError:
+            self._fail()
+
+        outputs = []
+        for wire in self.netlist.outputs:
+            if wire == CONST_FALSE:
+                outputs.append(0)
+            elif wire == CONST_TRUE:
+                outputs.append(mask)
+            else:
+                offset = _HEADER_SIZE + self._slots[wire] * self._slot_size
+                outputs.append(int.from_bytes(buf[offset:offset + self._slot_size], 'little'))
+        return outputs
+
+    def evaluate(self, inputs: List[bool]) -> List[bool]:
+        return [bool(word) for word in self.evaluate_packed([1 if value else 0 for value in inputs], 1)]
+
+    def _fail(self):
+        # wait a little for a failing worker to report, then stop everything
+        failures = []
+        for _ in range(int(BARRIER_TIMEOUT * 10)):
+            if not self._errors.empty() or not any(worker.is_alive() for worker in self._workers):
+                break
+            time.sleep(0.1)
+        while not self._errors.empty():
+            failures.append(self._errors.get())
+        self._stop(terminate=True)
+        if failures:
+            part, error = failures[0]
+            raise RuntimeError(f'Error in partitioned simulation of {self.netlist.blueprint_id}: worker {part} failed\n{error}')
+        raise RuntimeError(f'Error in partitioned simulation of {self.netlist.blueprint_id}: a step did not complete within {BARRIER_TIMEOUT}s')
+
+    def _stop(self, terminate: bool):
+        if not self._workers:
+            return
+        if terminate:
+            for worker in self._workers:
+                worker.terminate()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        self._shm.close()
+        self._shm.unlink()
+
+    def close(self):
+        if self._workers:
+            self._shm.buf[8] = 1
+            try:
+                self._barrier.wait(BARRIER_TIMEOUT)
+            except threading.BrokenBarrierError:
+                self._stop(terminate=True)
+            else:
+                self._stop(terminate=False)
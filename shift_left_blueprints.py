@@ -1,7 +1,7 @@
-from blueprint import Blueprint, register_blueprint, SinkPort, SourcePort
+from blueprint import define_blueprint, SinkPort, SourcePort
 
 
-register_blueprint(Blueprint(
+define_blueprint(
     _id='2BIT_SHIFT_LEFT',
     _node_list = [],
     num_inputs = 3,
@@ -12,4 +12,4 @@ register_blueprint(Blueprint(
             {SinkPort(None, 0): SourcePort(None, 2),
                 SinkPort(None, 1): SourcePort(None, 0),
                 SinkPort(None, 2): SourcePort(None, 1),} 
-))
\ No newline at end of file
+)
\ No newline at end of file
@@ -1,8 +1,8 @@
-from blueprint import Blueprint, register_blueprint, SinkPort, SourcePort
+from blueprint import define_blueprint, SinkPort, SourcePort
 
 
 
-register_blueprint(Blueprint(
+define_blueprint(
     _id='2BIT_SHIFT_RIGHT',
     _node_list = [],
     num_inputs = 3,
@@ -15,5 +15,5 @@ register_blueprint(Blueprint(
                 SinkPort(None, 1): SourcePort(None, 2),
                 SinkPort(None, 2): SourcePort(None, 0),}
                 
-))
+)
 
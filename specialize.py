@@ -0,0 +1,123 @@
+from __future__ import annotations
+from typing import List, Tuple, Dict
+from blueprint import Blueprint, BlueprintID, BlueprintRepository, SourcePort, SinkPort, register_blueprint
+from compiler import Wire, CONST_FALSE, CONST_TRUE, flatten
+
+
+# Partial evaluation of blueprints.
+# The blueprint is flattened down to its embedded gates, constants are pushed through
+# the gates (folding away inverter pairs on the way), and everything that does not feed
+# one of the requested outputs is dropped. The result is a regular blueprint made out of
+# the remaining embedded gates, so it goes through the same evaluate and compile paths
+# as any hand written one.
+
+
+def specialize(blueprint_id: BlueprintID, fixed_inputs: Dict[int, bool] = None, outputs: List[int] = None, specialized_id: BlueprintID = None) -> Blueprint:
+    """Build and register a copy of a blueprint with some inputs held constant and only
+    some of the outputs kept
+
+    The specialized blueprint takes the inputs that are not fixed (in their original
+    order) and produces the requested outputs (in the requested order).
+    """
+    blueprint = BlueprintRepository[blueprint_id]
+    fixed_inputs = dict(fixed_inputs or {})
+    outputs = list(range(blueprint.num_outputs)) if outputs is None else list(outputs)
+
+    for port in fixed_inputs:
+        if not 0 <= port < blueprint.num_inputs:
+            raise ValueError(f'Error in blueprint {blueprint_id}: Invalid fixed input port {port} (expected < {blueprint.num_inputs})')
+    for port in outputs:
+        if not 0 <= port < blueprint.num_outputs:
+            raise ValueError(f'Error in blueprint {blueprint_id}: Invalid output port {port} (expected < {blueprint.num_outputs})')
+
+    if specialized_id is None:
+        fixed = ','.join(f'{port}={int(value)}' for port, value in sorted(fixed_inputs.items()))
+        specialized_id = f'{blueprint_id}{{{fixed}}}[{",".join(str(port) for port in outputs)}]'
+
+    netlist = flatten(blueprint_id)
+
+    # alias[w] is the wire carrying the same value as w; constants alias to wires 0 and 1
+    alias: List[Wire] = list(range(netlist.num_wires))
+    for port, value in fixed_inputs.items():
+        alias[netlist.inputs[port]] = CONST_TRUE if value else CONST_FALSE
+    # inverse_of[w] is the wire that w is the inverse of, if w is the output of a NOT-like NAND
+    inverse_of: Dict[Wire, Wire] = {}
+    nand_outputs: Dict[Tuple[Wire, Wire], Wire] = {}
+    constants = (CONST_FALSE, CONST_TRUE)
+
+    kept_gates = []
+    for gate in netlist.gates:
+        inputs = tuple(alias[wire] for wire in gate.inputs)
+
+        if gate.kind == 'NAND':
+            a, b = inputs
+            if CONST_FALSE in inputs:
+                alias[gate.outputs[0]] = CONST_TRUE
+                continue
+            if a == CONST_TRUE and b == CONST_TRUE:
+                alias[gate.outputs[0]] = CONST_FALSE
+                continue
+            if a == CONST_TRUE or b == CONST_TRUE or a == b:
+                # the gate is an inverter; an inverter of an inverter is just a wire
+                inverted = b if a == CONST_TRUE else a
+                if inverted in inverse_of:
+                    alias[gate.outputs[0]] = inverse_of[inverted]
+                    continue
+                inverse_of[gate.outputs[0]] = inverted
+                a, b = inverted, CONST_TRUE
+            # two NANDs of the same wires carry the same value
+            key = (min(a, b), max(a, b))
+            if key in nand_outputs:
+                alias[gate.outputs[0]] = nand_outputs[key]
+                continue
+            nand_outputs[key] = gate.outputs[0]
+        elif all(wire in constants for wire in inputs) and not BlueprintRepository[gate.kind].is_stateful:
+            results = BlueprintRepository[gate.kind].evaluate([wire == CONST_TRUE for wire in inputs])
+            for wire, value in zip(gate.outputs, results):
+                alias[wire] = CONST_TRUE if value else CONST_FALSE
+            continue
+
+        kept_gates.append(gate._replace(inputs=inputs))
+
+    # keep only the gates in the fan-in cones of the requested outputs (and of stateful
+    # gates, which have to see every cycle)
+    output_wires = [alias[netlist.outputs[port]] for port in outputs]
+    needed = set(output_wires)
+    live_gates = []
+    for gate in reversed(kept_gates):
+        if any(wire in needed for wire in gate.outputs) or BlueprintRepository[gate.kind].is_stateful:
+            needed.update(gate.inputs)
+            live_gates.append(gate)
+    live_gates.reverse()
+
+    # rebuild a blueprint out of the surviving gates
+    free_inputs = [port for port in range(blueprint.num_inputs) if port not in fixed_inputs]
+    input_ports = {netlist.inputs[port]: index for index, port in enumerate(free_inputs)}
+    gate_outputs = {wire: SourcePort(node, port) for node, gate in enumerate(live_gates) for port, wire in enumerate(gate.outputs)}
+
+    def source_of(wire: Wire) -> SourcePort|bool:
+        if wire in constants:
+            return wire == CONST_TRUE
+        if wire in input_ports:
+            return SourcePort(None, input_ports[wire])
+        return gate_outputs[wire]
+
+    connections: Dict[SinkPort, SourcePort|bool] = {}
+    for node, gate in enumerate(live_gates):
+        for port, wire in enumerate(gate.inputs):
+            connections[SinkPort(node, port)] = source_of(wire)
+    for port, wire in enumerate(output_wires):
+        connections[SinkPort(None, port)] = source_of(wire)
+
+    labelled_inputs = len(blueprint.input_labels) == blueprint.num_inputs
+    labelled_outputs = len(blueprint.output_labels) == blueprint.num_outputs
+    specialized = Blueprint(
+        _id=specialized_id,
+        _node_list=[gate.kind for gate in live_gates],
+        _connections=connections,
+        num_inputs=len(free_inputs),
+        num_outputs=len(outputs),
+        input_labels=[blueprint.input_labels[port] for port in free_inputs] if labelled_inputs else [],
+        output_labels=[blueprint.output_labels[port] for port in outputs] if labelled_outputs else [])
+    register_blueprint(specialized)
+    return specialized
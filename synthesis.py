@@ -0,0 +1,168 @@
+from __future__ import annotations
+from typing import List, Dict, Tuple, Union, Callable
+from blueprint import Blueprint, BlueprintID, SinkPort, SourcePort, register_blueprint
+from truth_table import TruthTable
+
+
+# Logic synthesis.
+# Every output is minimized into a sum of products with Quine-McCluskey: the prime
+# implicants are found for all outputs together (a cube is tagged with the outputs it
+# implies, so cubes shared by several outputs survive), then each output is covered
+# greedily, starting from its essential primes and preferring cubes already used by
+# other outputs. The result is wired out of NOT, AND and OR blueprints, with each
+# product term and each pair of literals built only once.
+#
+# A cube is a pair (value, dashes) of row numbers: dashes has the bits of the inputs
+# the cube does not depend on, value the values of the others. Like in truth tables,
+# input 0 is the most significant bit of a row number.
+
+Cube = Tuple[int, int]
+
+
+def _prime_implicants(tags: Dict[int, int], num_inputs: int) -> Dict[Cube, int]:
+    # tags: row -> bit mask of the outputs that are 1 on that row
+    current: Dict[Cube, int] = {(row, 0): tag for row, tag in tags.items() if tag}
+    primes: Dict[Cube, int] = {}
+    while current:
+        merged: Dict[Cube, int] = {}
+        covered = set() # cubes contained in a bigger cube implying the same outputs
+        for (value, dashes), tag in current.items():
+            for position in range(num_inputs):
+                bit = 1 << position
+                if (value | dashes) & bit:
+                    continue
+                other = current.get((value | bit, dashes))
+                if other is None or not tag & other:
+                    continue
+                merged[(value, dashes | bit)] = tag & other
+                if tag & other == tag:
+                    covered.add((value, dashes))
+                if tag & other == other:
+                    covered.add((value | bit, dashes))
+        primes.update((cube, tag) for cube, tag in current.items() if cube not in covered)
+        current = merged
+    return primes
+
+
+def _rows_of(cube: Cube) -> List[int]:
+    value, dashes = cube
+    rows = [value]
+    position = 0
+    while dashes >> position:
+        if (dashes >> position) & 1:
+            rows += [row | (1 << position) for row in rows]
+        position += 1
+    return rows
+
+
+def minimize(table: TruthTable) -> List[List[Cube]]:
+    """Sum-of-products cover of every output of a truth table (an empty list is a
+    constant 0, a cube with every input as a dash a constant 1)
+    """
+    words = table.words()
+    tags: Dict[int, int] = {}
+    for port, word in enumerate(words):
+        bits = format(word, 'b')[::-1]
+        row = bits.find('1')
+        while row != -1:
+            tags[row] = tags.get(row, 0) | (1 << port)
+            row = bits.find('1', row + 1)
+    primes = _prime_implicants(tags, table.num_inputs)
+    rows_of = {cube: set(_rows_of(cube)) for cube in primes}
+
+    used = set()
+    covers = []
+    for port in range(table.num_outputs):
+        candidates = [cube for cube, tag in primes.items() if (tag >> port) & 1]
+        uncovered = {row for row, tag in tags.items() if (tag >> port) & 1}
+        cover = []
+
+        # essential primes: the only candidate covering some row
+        covering: Dict[int, List[Cube]] = {}
+        for cube in candidates:
+            for row in rows_of[cube]:
+                covering.setdefault(row, []).append(cube)
+        for row in sorted(uncovered):
+            if len(covering[row]) == 1 and covering[row][0] not in cover:
+                cover.append(covering[row][0])
+        for cube in cover:
+            uncovered -= rows_of[cube]
+
+        while uncovered:
+            cube = max(candidates, key=lambda cube: (len(rows_of[cube] & uncovered), cube in used, bin(cube[1]).count('1')))
+            cover.append(cube)
+            uncovered -= rows_of[cube]
+        used.update(cover)
+        covers.append(sorted(cover))
+    return covers
+
+
+class _NetworkBuilder:
+    # Builds nodes and connections, reusing identical gates
+    def __init__(self):
+        self.node_list: List[BlueprintID] = []
+        self.connections: Dict[SinkPort, Union[SourcePort, bool]] = {}
+        self.gates: Dict[Tuple, SourcePort] = {}
+
+    def gate(self, kind: BlueprintID, *sources: Union[SourcePort, bool]) -> SourcePort:
+        key = (kind,) + sources
+        if key not in self.gates:
+            node = len(self.node_list)
+            self.node_list.append(kind)
+            for port, source in enumerate(sources):
+                self.connections[SinkPort(node, port)] = source
+            self.gates[key] = SourcePort(node, 0)
+        return self.gates[key]
+
+    def tree(self, kind: BlueprintID, sources: List[Union[SourcePort, bool]]) -> Union[SourcePort, bool]:
+        # balanced tree of 2-input gates
+        while len(sources) > 1:
+            sources = [self.gate(kind, *sources[index:index + 2]) if index + 1 < len(sources) else sources[index]
+                       for index in range(0, len(sources), 2)]
+        return sources[0]
+
+
+def synthesize(specification: Union[TruthTable, Callable[[List[bool]], List[bool]]], num_inputs: int = None, num_outputs: int = None,
+               blueprint_id: BlueprintID = None, input_labels: List[str] = None, output_labels: List[str] = None,
+               register: bool = True) -> Blueprint:
+    """Build a minimized blueprint out of NOT, AND and OR nodes from a truth table or
+    from a Python function taking and returning lists of bools. Minimization is exact
+    two-level Quine-McCluskey, so this is meant for blocks of up to a dozen inputs.
+    """
+    if isinstance(specification, TruthTable):
+        table = specification
+    else:
+        if num_inputs is None or num_outputs is None:
+            raise ValueError('num_inputs and num_outputs are needed to synthesize a blueprint from a function')
+        table = TruthTable.from_function(specification, num_inputs, num_outputs)
+    everything = (1 << table.num_inputs) - 1
+
+    builder = _NetworkBuilder()
+
+    def literal(port: int, value: bool) -> SourcePort:
+        source = SourcePort(None, port)
+        return source if value else builder.gate('NOT', source)
+
+    for output, cover in enumerate(minimize(table)):
+        products = []
+        for value, dashes in cover:
+            if dashes == everything:
+                products = [True]
+                break
+            literals = [literal(port, bool((value >> (table.num_inputs - 1 - port)) & 1)) for port in range(table.num_inputs)
+                        if not (dashes >> (table.num_inputs - 1 - port)) & 1]
+            products.append(builder.tree('AND', literals))
+        builder.connections[SinkPort(None, output)] = builder.tree('OR', products) if products else False
+
+    blueprint = Blueprint(
+        _node_list=builder.node_list,
+        _connections=builder.connections,
+        num_inputs=table.num_inputs,
+        num_outputs=table.num_outputs,
+        input_labels=input_labels if input_labels is not None else [],
+        output_labels=output_labels if output_labels is not None else [],
+        _id=blueprint_id,
+    )
+    if register:
+        register_blueprint(blueprint)
+    return blueprint
@@ -0,0 +1,22 @@
+from blueprint import register_blueprint_source
+from synthesis import synthesize
+
+# Blueprints synthesized from a description of their behavior instead of hand wiring
+
+
+#3x8-bit decoder
+#takes a 3-bit input and an enable bit and produces an 8-bit output
+def decoder_3x8(inputs):
+    value = inputs[0] + 2 * inputs[1] + 4 * inputs[2]
+    return [bool(inputs[3]) and value == output for output in range(8)]
+
+register_blueprint_source('3X8BIT_DECODER', lambda: synthesize(decoder_3x8, 4, 8, '3X8BIT_DECODER', register=False))
+
+#4-bit comparator
+#takes two 4-bit inputs and produces a 3-bit output (A<B, A=B, A>B)
+def comparator_4bit(inputs):
+    a = sum(inputs[bit] << bit for bit in range(4))
+    b = sum(inputs[4 + bit] << bit for bit in range(4))
+    return [a < b, a == b, a > b]
+
+register_blueprint_source('4BIT_COMPARATOR', lambda: synthesize(comparator_4bit, 8, 3, '4BIT_COMPARATOR', register=False))
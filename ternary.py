@@ -0,0 +1,173 @@
+from __future__ import annotations
+from typing import List, Tuple, Dict, Callable
+import itertools
+from blueprint import Blueprint, BlueprintID, BlueprintRepository, StructuralCache
+from compiler import Netlist, compile_blueprint
+
+
+# Three-valued (0, 1, X) simulation.
+# A value is encoded on two bit planes: the "one" plane has a bit set when the value can
+# be 1 and the "zero" plane when it can be 0, so 1 is (1, 0), 0 is (0, 1) and X, the
+# unknown value, is (1, 1). Like the two-valued compiled simulation, bit k of every word
+# is pattern k, so a whole batch of ternary vectors goes through in one pass, and a
+# single pattern with X inputs covers every way of filling them in at once.
+#
+# NAND propagates X pessimistically: its output can be 1 if either input can be 0, and
+# can be 0 only if both inputs can be 1. Other embedded gates are evaluated exactly on
+# the patterns where their inputs are known; with unknown inputs they try every
+# completion of the X inputs (up to MAX_ENUMERATED_UNKNOWNS of them) and give X where
+# the results disagree. Stateful gates are never evaluated on unknown inputs.
+
+X = None # the unknown value, in vectors of inputs and outputs
+
+MAX_ENUMERATED_UNKNOWNS = 8
+
+
+def encode(value: bool|None) -> Tuple[int, int]:
+    if value is None:
+        return 1, 1
+    return (1, 0) if value else (0, 1)
+
+
+def decode(one: int, zero: int) -> bool|None:
+    if one and zero:
+        return X
+    if not one and not zero:
+        raise ValueError('Invalid ternary value: neither 0 nor 1')
+    return bool(one)
+
+
+def pack_ternary_vectors(vectors: List[List[bool|None]], num_ports: int) -> Tuple[List[int], List[int]]:
+    """Turn a list of ternary vectors into the one and zero planes, one word per port
+    """
+    ones, zeros = [0] * num_ports, [0] * num_ports
+    for index, vector in enumerate(vectors):
+        for port in range(num_ports):
+            one, zero = encode(vector[port])
+            ones[port] |= one << index
+            zeros[port] |= zero << index
+    return ones, zeros
+
+
+def unpack_ternary_vectors(ones: List[int], zeros: List[int], count: int) -> List[List[bool|None]]:
+    return [[decode((one >> index) & 1, (zero >> index) & 1) for one, zero in zip(ones, zeros)] for index in range(count)]
+
+
+def evaluate_gate_ternary(blueprint: Blueprint, ones: List[int], zeros: List[int], mask: int) -> Tuple[List[int], List[int]]:
+    """Ternary evaluation of an embedded blueprint, exact whenever possible
+    """
+    unknown = 0
+    for one, zero in zip(ones, zeros):
+        unknown |= one & zero
+    known = mask & ~unknown
+
+    # known patterns: a plain two-valued evaluation (only for the patterns in the mask)
+    values = blueprint.evaluate_words(ones, known) if known else [0] * blueprint.num_outputs
+    out_ones = [value & known for value in values]
+    out_zeros = [known & ~value for value in values]
+
+    bit = 0
+    while unknown >> bit:
+        if not (unknown >> bit) & 1:
+            bit += 1
+            continue
+        inputs = [decode((one >> bit) & 1, (zero >> bit) & 1) for one, zero in zip(ones, zeros)]
+        unknown_ports = [port for port, value in enumerate(inputs) if value is X]
+        if blueprint.is_stateful or len(unknown_ports) > MAX_ENUMERATED_UNKNOWNS:
+            results = [{False, True}] * blueprint.num_outputs
+        else:
+            results = [set() for _ in range(blueprint.num_outputs)]
+            for completion in itertools.product([False, True], repeat=len(unknown_ports)):
+                for port, value in zip(unknown_ports, completion):
+                    inputs[port] = value
+                for output, value in enumerate(blueprint.evaluate(inputs)):
+                    results[output].add(value)
+        for output, possible in enumerate(results):
+            if True in possible:
+                out_ones[output] |= 1 << bit
+            if False in possible:
+                out_zeros[output] |= 1 << bit
+        bit += 1
+    return out_ones, out_zeros
+
+
+def generate_ternary_simulator(netlist: Netlist) -> Callable[[List[int], List[int], int], Tuple[Tuple[int, ...], Tuple[int, ...]]]:
+    """Generate a Python function evaluating the netlist on the two planes of whole
+    words of ternary patterns; o<wire> holds the one plane and z<wire> the zero plane
+    """
+    lines = ['def simulate(ones, zeros, m):', '    o0, z0 = 0, m', '    o1, z1 = m, 0']
+    if netlist.num_inputs:
+        lines.append(f'    {", ".join(f"o{wire}" for wire in netlist.inputs)}, = ones')
+        lines.append(f'    {", ".join(f"z{wire}" for wire in netlist.inputs)}, = zeros')
+
+    namespace = {'evaluate_gate_ternary': evaluate_gate_ternary}
+    for index, gate in enumerate(netlist.gates):
+        if gate.kind == 'NAND':
+            a, b = gate.inputs
+            out = gate.outputs[0]
+            lines.append(f'    o{out}, z{out} = z{a} | z{b}, o{a} & o{b}')
+        else:
+            namespace[f'g{index}'] = BlueprintRepository[gate.kind]
+            ones = ', '.join(f'o{wire}' for wire in gate.inputs)
+            zeros = ', '.join(f'z{wire}' for wire in gate.inputs)
+            lines.append(f'    gate_ones, gate_zeros = evaluate_gate_ternary(g{index}, [{ones}], [{zeros}], m)')
+            for port, wire in enumerate(gate.outputs):
+                lines.append(f'    o{wire}, z{wire} = gate_ones[{port}], gate_zeros[{port}]')
+
+    lines.append(f'    return ({"".join(f"o{wire}, " for wire in netlist.outputs)}), ({"".join(f"z{wire}, " for wire in netlist.outputs)})')
+    exec(compile('\n'.join(lines), f'<ternary {netlist.blueprint_id}>', 'exec'), namespace)
+    return namespace['simulate']
+
+
+class TernaryBlueprint:
+    """A compiled blueprint evaluating inputs that can be unknown (X)
+    """
+
+    def __init__(self, netlist: Netlist, simulate: Callable = None):
+        self.netlist = netlist
+        self._simulate = simulate if simulate is not None else generate_ternary_simulator(netlist)
+
+    @property
+    def blueprint_id(self) -> BlueprintID:
+        return self.netlist.blueprint_id
+
+    def evaluate_packed(self, ones: List[int], zeros: List[int], count: int) -> Tuple[List[int], List[int]]:
+        """Evaluate count ternary patterns given as their one and zero planes
+        """
+        if len(ones) != self.netlist.num_inputs or len(zeros) != self.netlist.num_inputs:
+            raise ValueError(f'Incorrect number of inputs provided for evaluation of blueprint {self.blueprint_id} (expected {self.netlist.num_inputs})')
+        mask = (1 << count) - 1
+        if any(~(one | zero) & mask for one, zero in zip(ones, zeros)):
+            raise ValueError('Invalid ternary value: neither 0 nor 1')
+        out_ones, out_zeros = self._simulate([one & mask for one in ones], [zero & mask for zero in zeros], mask)
+        return list(out_ones), list(out_zeros)
+
+    def evaluate(self, inputs: List[bool|None]) -> List[bool|None]:
+        """Evaluate one vector where any input can be X (None)
+        """
+        return self.evaluate_batch([inputs])[0]
+
+    def evaluate_batch(self, vectors: List[List[bool|None]]) -> List[List[bool|None]]:
+        if not vectors:
+            return []
+        ones, zeros = pack_ternary_vectors(vectors, self.netlist.num_inputs)
+        out_ones, out_zeros = self.evaluate_packed(ones, zeros, len(vectors))
+        return unpack_ternary_vectors(out_ones, out_zeros, len(vectors))
+
+
+_ternary_cache: Dict[BlueprintID, TernaryBlueprint] = BlueprintRepository.register_derived_cache({})
+_ternary_simulators: Dict[str, Callable] = StructuralCache() # keyed by structural hash
+
+
+def compile_ternary(blueprint_id: BlueprintID) -> TernaryBlueprint:
+    """Compile a blueprint for ternary evaluation, at gate level (cached per BlueprintID,
+    with the generated code shared by structurally identical blueprints)
+    """
+    def compile_once() -> TernaryBlueprint:
+        netlist = compile_blueprint(blueprint_id).netlist
+        return TernaryBlueprint(netlist, BlueprintRepository.cached_by_structure(_ternary_simulators, blueprint_id, lambda: generate_ternary_simulator(netlist)))
+    return BlueprintRepository.cached(_ternary_cache, blueprint_id, compile_once)
+
+
+def evaluate_ternary(blueprint_id: BlueprintID, inputs: List[bool|None]) -> List[bool|None]:
+    return compile_ternary(blueprint_id).evaluate(inputs)
@@ -0,0 +1,162 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import List, Dict, Iterable, Tuple
+from blueprint import BlueprintID, BlueprintRepository
+from compiler import Wire, CONST_TRUE, Netlist, flatten
+
+
+# Event-driven timing simulation.
+# Every gate of the flattened netlist has a propagation delay (an integer number of time
+# units, per kind of embedded blueprint). A value change on a wire is an event; only the
+# gates reading a wire that actually changed get evaluated, and any new output value is
+# scheduled delay units later (transport delay, so short pulses are kept and show up as
+# glitches). Pending events sit in a timing wheel: one bucket per time unit, reused
+# every revolution. The wheel has more buckets than the longest delay, so an event is
+# never scheduled more than one revolution ahead and the current bucket always holds
+# exactly the events of the current time.
+
+
+@dataclass
+class TransitionReport:
+    start_time: int
+    settling_time: int # time between the input change and the last change of an output
+    quiet_time: int # time between the input change and the last change of any wire
+    num_events: int # value changes
+    num_evaluations: int # gate evaluations
+    toggles: Dict[Wire, int] # number of changes of every wire that changed
+    outputs: List[bool]
+
+    @property
+    def glitches(self) -> Dict[Wire, int]:
+        """Wires that changed more than once during the transition
+        """
+        return {wire: count for wire, count in self.toggles.items() if count > 1}
+
+
+@dataclass
+class TimingRunReport:
+    blueprint_id: BlueprintID
+    num_transitions: int = 0
+    max_settling_time: int = 0
+    worst_transition: int|None = None # index of the transition with the longest settling time
+    num_events: int = 0
+    num_evaluations: int = 0
+    glitch_counts: Dict[Wire, int] = field(default_factory=dict) # number of transitions in which each wire glitched
+
+
+class TimingSimulator:
+    """Event-driven simulation of a blueprint with a propagation delay on every gate.
+    Blueprints with state (like RAMs) are not supported.
+    """
+
+    def __init__(self, blueprint_id: BlueprintID, delays: Dict[BlueprintID, int] = None, default_delay: int = 1):
+        self.netlist: Netlist = flatten(blueprint_id)
+        delays = delays or {}
+        self.gate_delays = [delays.get(gate.kind, default_delay) for gate in self.netlist.gates]
+        if any(delay < 1 for delay in self.gate_delays):
+            raise ValueError(f'Error in timing simulation of {blueprint_id}: gate delays must be at least 1')
+
+        self._readers: List[List[int]] = [[] for _ in range(self.netlist.num_wires)]
+        for index, gate in enumerate(self.netlist.gates):
+            for wire in set(gate.inputs):
+                self._readers[wire].append(index)
+        self._embedded = {gate.kind: BlueprintRepository[gate.kind] for gate in self.netlist.gates}
+        stateful = sorted(kind for kind, blueprint in self._embedded.items() if blueprint.is_stateful)
+        if stateful:
+            raise ValueError(f'Error in timing simulation of {blueprint_id}: stateful gates {stateful} would be clocked on every event')
+
+        wheel_size = 1
+        while wheel_size <= max(self.gate_delays, default=1):
+            wheel_size *= 2
+        self._wheel: List[List[Tuple[Wire, bool]]] = [[] for _ in range(wheel_size)]
+        self._wheel_mask = wheel_size - 1
+
+        self.time = 0
+        self.values: List[bool] = [False] * self.netlist.num_wires
+        self.reset([False] * self.netlist.num_inputs)
+
+    def _evaluate_gate(self, index: int) -> List[bool]:
+        gate = self.netlist.gates[index]
+        values = self.values
+        if gate.kind == 'NAND':
+            return [not (values[gate.inputs[0]] and values[gate.inputs[1]])]
+        return self._embedded[gate.kind].evaluate([values[wire] for wire in gate.inputs])
+
+    def reset(self, inputs: List[bool]):
+        """Put the circuit in the steady state for the given inputs, without timing
+        """
+        self.values = [False] * self.netlist.num_wires
+        self.values[CONST_TRUE] = True
+        for wire, value in zip(self.netlist.inputs, inputs):
+            self.values[wire] = bool(value)
+        for index, gate in enumerate(self.netlist.gates):
+            for wire, value in zip(gate.outputs, self._evaluate_gate(index)):
+                self.values[wire] = value
+        self._projected = list(self.values) # value each wire will have once its pending events are applied
+
+    def apply(self, inputs: List[bool]) -> TransitionReport:
+        """Change the inputs and simulate until the circuit is stable again
+        """
+        if len(inputs) != self.netlist.num_inputs:
+            raise ValueError(f'Incorrect number of inputs provided for evaluation of blueprint {self.netlist.blueprint_id} (expected {self.netlist.num_inputs}, got {len(inputs)})')
+        wheel, wheel_mask = self._wheel, self._wheel_mask
+        values, projected, readers, delays = self.values, self._projected, self._readers, self.gate_delays
+        outputs = set(self.netlist.outputs)
+
+        start = self.time
+        pending = 0
+        for wire, value in zip(self.netlist.inputs, inputs):
+            if bool(value) != projected[wire]:
+                projected[wire] = bool(value)
+                wheel[start & wheel_mask].append((wire, bool(value)))
+                pending += 1
+
+        toggles: Dict[Wire, int] = {}
+        last_output_change = last_change = start
+        num_events = num_evaluations = 0
+        time = start
+        while pending:
+            bucket = wheel[time & wheel_mask]
+            if bucket:
+                wheel[time & wheel_mask] = []
+                pending -= len(bucket)
+                touched = set()
+                for wire, value in bucket:
+                    if values[wire] == value:
+                        continue
+                    values[wire] = value
+                    toggles[wire] = toggles.get(wire, 0) + 1
+                    num_events += 1
+                    last_change = time
+                    if wire in outputs:
+                        last_output_change = time
+                    touched.update(readers[wire])
+                for index in touched:
+                    num_evaluations += 1
+                    for wire, value in zip(self.netlist.gates[index].outputs, self._evaluate_gate(index)):
+                        if value != projected[wire]:
+                            projected[wire] = value
+                            wheel[(time + delays[index]) & wheel_mask].append((wire, value))
+                            pending += 1
+            time += 1
+
+        self.time = max(time, start + 1)
+        return TransitionReport(start, last_output_change - start, last_change - start, num_events, num_evaluations, toggles,
+                                [values[wire] for wire in self.netlist.outputs])
+
+    def run(self, stimulus: Iterable[List[bool]]) -> TimingRunReport:
+        """Apply a sequence of input vectors, one transition after the other, and
+        summarize settling times and glitches
+        """
+        report = TimingRunReport(self.netlist.blueprint_id)
+        for inputs in stimulus:
+            transition = self.apply(inputs)
+            if report.worst_transition is None or transition.settling_time > report.max_settling_time:
+                report.max_settling_time = transition.settling_time
+                report.worst_transition = report.num_transitions
+            report.num_transitions += 1
+            report.num_events += transition.num_events
+            report.num_evaluations += transition.num_evaluations
+            for wire in transition.glitches:
+                report.glitch_counts[wire] = report.glitch_counts.get(wire, 0) + 1
+        return report
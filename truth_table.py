@@ -0,0 +1,223 @@
+from __future__ import annotations
+from typing import List, Dict, Callable
+from prettytable import PrettyTable
+import hashlib, json, struct, zlib
+from blueprint import BlueprintID, BlueprintRepository, StructuralCache
+from compiler import compile_blueprint
+
+
+# Packed truth tables.
+# Rows are numbered in itertools.product([False, True], repeat=num_inputs) order, so the
+# first input is the most significant bit of the row number. Every output is stored as
+# one column of 2^num_inputs bits (row r is bit r % 8 of byte r // 8), computed with the
+# compiled blueprint by feeding it all the rows at once: the word of input i is the
+# standard pattern alternating blocks of 2^(num_inputs - 1 - i) zeros and ones.
+
+INPUT_CHARS = ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z"]
+OUTPUT_CHARS = INPUT_CHARS[::-1]
+
+_MAGIC = b'LSTT'
+_MAX_CHUNK_INPUTS = 20 # rows evaluated per call of the compiled blueprint: 2^20
+
+
+def input_pattern(num_inputs: int, port: int) -> int:
+    """Word holding the value of input port in every row of a truth table
+    """
+    block = 1 << (num_inputs - 1 - port)
+    period = (1 << (2 * block)) - 1
+    return ((1 << (1 << num_inputs)) - 1) // period * (((1 << block) - 1) << block)
+
+
+class TruthTable:
+    """The outputs of a blueprint for every combination of inputs, one packed bit
+    column per output
+    """
+
+    def __init__(self, num_inputs: int, num_outputs: int, columns: List[bytes], blueprint_id: BlueprintID = None,
+                 input_labels: List[str] = None, output_labels: List[str] = None):
+        size = self.column_size(num_inputs)
+        if len(columns) != num_outputs or any(len(column) != size for column in columns):
+            raise ValueError(f'Error in truth table of {blueprint_id}: expected {num_outputs} columns of {size} bytes')
+        self.num_inputs = num_inputs
+        self.num_outputs = num_outputs
+        self.columns = columns
+        self.blueprint_id = blueprint_id
+        self.input_labels = input_labels if input_labels and len(input_labels) == num_inputs else INPUT_CHARS[:num_inputs]
+        self.output_labels = output_labels if output_labels and len(output_labels) == num_outputs else OUTPUT_CHARS[:num_outputs]
+        self._hash: str|None = None
+
+    @staticmethod
+    def column_size(num_inputs: int) -> int:
+        return ((1 << num_inputs) + 7) // 8
+
+    @property
+    def num_rows(self) -> int:
+        return 1 << self.num_inputs
+
+    @classmethod
+    def from_blueprint(cls, blueprint_id: BlueprintID) -> TruthTable:
+        blueprint = BlueprintRepository[blueprint_id]
+        compiled = compile_blueprint(blueprint_id)
+        num_inputs = blueprint.num_inputs
+
+        # the low inputs vary inside a chunk, the high ones are constant over it
+        chunk_inputs = min(num_inputs, _MAX_CHUNK_INPUTS)
+        width = 1 << chunk_inputs
+        mask = (1 << width) - 1
+        patterns = [input_pattern(chunk_inputs, port) for port in range(chunk_inputs)]
+        columns = [0] * blueprint.num_outputs
+        for chunk in range(1 << (num_inputs - chunk_inputs)):
+            high = [mask if (chunk >> (num_inputs - chunk_inputs - 1 - port)) & 1 else 0 for port in range(num_inputs - chunk_inputs)]
+            outputs = compiled.evaluate_packed(high + patterns, width)
+            for port, word in enumerate(outputs):
+                columns[port] |= word << (chunk * width)
+
+        size = cls.column_size(num_inputs)
+        return cls(num_inputs, blueprint.num_outputs, [word.to_bytes(size, 'little') for word in columns],
+                   blueprint_id, blueprint.input_labels, blueprint.output_labels)
+
+    @classmethod
+    def from_function(cls, function: Callable[[List[bool]], List[bool]], num_inputs: int, num_outputs: int,
+                      input_labels: List[str] = None, output_labels: List[str] = None) -> TruthTable:
+        """Tabulate a Python function taking and returning lists of bools, row by row
+        """
+        columns = [0] * num_outputs
+        for row in range(1 << num_inputs):
+            outputs = function([bool((row >> (num_inputs - 1 - port)) & 1) for port in range(num_inputs)])
+            if len(outputs) != num_outputs:
+                raise ValueError(f'Incorrect number of outputs returned by {function.__name__} (expected {num_outputs}, got {len(outputs)})')
+            for port, value in enumerate(outputs):
+                if value:
+                    columns[port] |= 1 << row
+        size = cls.column_size(num_inputs)
+        return cls(num_inputs, num_outputs, [word.to_bytes(size, 'little') for word in columns], None, input_labels, output_labels)
+
+    def row_index(self, inputs: List[bool]) -> int:
+        if len(inputs) != self.num_inputs:
+            raise ValueError(f'Incorrect number of inputs provided for truth table of {self.blueprint_id} (expected {self.num_inputs}, got {len(inputs)})')
+        row = 0
+        for value in inputs:
+            row = (row << 1) | bool(value)
+        return row
+
+    def row(self, row: int) -> List[bool]:
+        """Outputs of one row
+        """
+        byte, bit = row >> 3, row & 7
+        return [bool((column[byte] >> bit) & 1) for column in self.columns]
+
+    def lookup(self, inputs: List[bool]) -> List[bool]:
+        """Outputs for one combination of inputs, like Blueprint.evaluate
+        """
+        return self.row(self.row_index(inputs))
+
+    def inputs_of(self, row: int) -> List[bool]:
+        return [bool((row >> (self.num_inputs - 1 - port)) & 1) for port in range(self.num_inputs)]
+
+    def words(self) -> List[int]:
+        """The columns as integers (bit r is row r)
+        """
+        return [int.from_bytes(column, 'little') for column in self.columns]
+
+    def diff_words(self, other: TruthTable) -> List[int]:
+        """Per output, a word with the bits of the rows where the two tables differ set
+        """
+        if (self.num_inputs, self.num_outputs) != (other.num_inputs, other.num_outputs):
+            raise ValueError(f'Cannot compare truth tables of different shapes ({self.num_inputs}x{self.num_outputs} and {other.num_inputs}x{other.num_outputs})')
+        return [a ^ b for a, b in zip(self.words(), other.words())]
+
+    def diff(self, other: TruthTable, limit: int = None) -> List[int]:
+        """Indexes of the rows where the two tables differ, in increasing order
+        """
+        differing = 0
+        for word in self.diff_words(other):
+            differing |= word
+        rows = []
+        bits = format(differing, 'b')[::-1]
+        row = bits.find('1')
+        while row != -1 and (limit is None or len(rows) < limit):
+            rows.append(row)
+            row = bits.find('1', row + 1)
+        return rows
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, TruthTable):
+            return NotImplemented
+        return (self.num_inputs, self.num_outputs, self.columns) == (other.num_inputs, other.num_outputs, other.columns)
+
+    def __hash__(self) -> int:
+        return hash(self.content_hash())
+
+    def content_hash(self) -> str:
+        """SHA-256 of the behavior only (shape and columns, not the id or labels), stable
+        across runs and machines
+        """
+        if self._hash is None:
+            digest = hashlib.sha256(struct.pack('<II', self.num_inputs, self.num_outputs))
+            for column in self.columns:
+                digest.update(column)
+            self._hash = digest.hexdigest()
+        return self._hash
+
+    def save(self, path: str):
+        """Write the table as a small header followed by the compressed columns
+        """
+        header = json.dumps({'blueprint_id': self.blueprint_id, 'num_inputs': self.num_inputs, 'num_outputs': self.num_outputs,
+                             'input_labels': self.input_labels, 'output_labels': self.output_labels}).encode()
+        with open(path, 'wb') as f:
+            f.write(_MAGIC + struct.pack('<I', len(header)) + header)
+            f.write(zlib.compress(b''.join(self.columns)))
+
+    @classmethod
+    def load(cls, path: str) -> TruthTable:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:4] != _MAGIC:
+            raise ValueError(f'Error in truth table file {path}: not a truth table')
+        header_size, = struct.unpack('<I', data[4:8])
+        header = json.loads(data[8:8 + header_size])
+        packed = zlib.decompress(data[8 + header_size:])
+        size = cls.column_size(header['num_inputs'])
+        columns = [packed[port * size:(port + 1) * size] for port in range(header['num_outputs'])]
+        return cls(header['num_inputs'], header['num_outputs'], columns, header['blueprint_id'], header['input_labels'], header['output_labels'])
+
+    def to_pretty_table(self) -> PrettyTable:
+        table = PrettyTable()
+        table.field_names = self.input_labels + self.output_labels
+        for row in range(self.num_rows):
+            table.add_row([int(value) for value in self.inputs_of(row)] + [int(value) for value in self.row(row)])
+        return table
+
+
+_truth_table_cache: Dict[BlueprintID, TruthTable] = BlueprintRepository.register_derived_cache({})
+_shared_truth_tables: Dict[str, TruthTable] = StructuralCache() # keyed by structural hash
+
+
+def truth_table(blueprint_id: BlueprintID) -> TruthTable:
+    """Truth table of a blueprint (cached per BlueprintID; structurally identical
+    blueprints share the same columns)
+    """
+    def tabulate_once() -> TruthTable:
+        shared = BlueprintRepository.cached_by_structure(_shared_truth_tables, blueprint_id, lambda: TruthTable.from_blueprint(blueprint_id))
+        if shared.blueprint_id == blueprint_id:
+            return shared
+        blueprint = BlueprintRepository[blueprint_id]
+        return TruthTable(shared.num_inputs, shared.num_outputs, shared.columns, blueprint_id, blueprint.input_labels, blueprint.output_labels)
+    return BlueprintRepository.cached(_truth_table_cache, blueprint_id, tabulate_once)
+
+
+def golden_hashes(max_inputs: int = 17) -> Dict[BlueprintID, str]:
+    """Content hashes of the truth tables of every (stateless) library blueprint with at
+    most max_inputs inputs
+    """
+    return {blueprint_id: truth_table(blueprint_id).content_hash() for blueprint_id in BlueprintRepository.available()
+            if BlueprintRepository[blueprint_id].num_inputs <= max_inputs and not BlueprintRepository[blueprint_id].is_stateful}
+
+
+def check_golden_hashes(path: str) -> List[BlueprintID]:
+    """Compare the library with the hashes saved in a json file and return the
+    blueprints whose behavior changed
+    """
+    with open(path) as f:
+        golden = json.load(f)
+    return [blueprint_id for blueprint_id, digest in golden.items() if truth_table(blueprint_id).content_hash() != digest]
@@ -1,8 +1,8 @@
-from blueprint import Blueprint, BlueprintRepository, SinkPort, SourcePort, register_blueprint
+from blueprint import BlueprintRepository, SinkPort, SourcePort, define_blueprint
 
 # 8-bit ANDer 
 #takes two 8-bit inputs and produces an 8-bit output
-register_blueprint(Blueprint(
+define_blueprint(
     _id='8BIT_AND',
     _node_list=['AND', 'AND', 'AND', 'AND', 'AND', 'AND', 'AND', 'AND'],
     num_inputs=16,
@@ -42,11 +42,10 @@ register_blueprint(Blueprint(
 
         }
     )
-)
 
 #8-bit ORer
 #takes two 8-bit inputs and produces an 8-bit output
-register_blueprint(Blueprint(
+define_blueprint(
     _id='8BIT_OR',
     _node_list=['OR', 'OR', 'OR', 'OR', 'OR', 'OR', 'OR', 'OR'],
     num_inputs=16,
@@ -86,11 +85,10 @@ register_blueprint(Blueprint(
 
         }
     )
-)
 
 #8-bit NOTer
 #takes an 8-bit input and produces an 8-bit output
-register_blueprint(Blueprint(
+define_blueprint(
     _id='8BIT_NOT',
     _node_list=['NOT', 'NOT', 'NOT', 'NOT', 'NOT', 'NOT', 'NOT', 'NOT'],
     num_inputs=8,
@@ -120,11 +118,10 @@ register_blueprint(Blueprint(
 
         }
     )
-)
 
 #8-bit shift right
 #takes an 9-bit input (8-bit + carry bit) and produces an 8-bit output
-register_blueprint(Blueprint(
+define_blueprint(
     _id='8BIT_SHIFT_RIGHT',
     _node_list = [],
     num_inputs = 9,
@@ -148,11 +145,10 @@ register_blueprint(Blueprint(
 
     }
     )
-)
 
 #8-bit shift left
 #takes an 8-bit input and produces an 9-bit output (8-bit + carry bit)
-register_blueprint(Blueprint(
+define_blueprint(
     _id='8BIT_SHIFT_LEFT',
     _node_list = [],
     num_inputs = 9,
@@ -176,11 +172,10 @@ register_blueprint(Blueprint(
 
     }
     )
-)
 
 #2x4-bit decoder
 #takes a 2-bit input and produces an 4-bit output
-register_blueprint(Blueprint(
+define_blueprint(
     _id='2X4BIT_DECODER',
     _node_list = ['NOT', 'NOT', 'AND', 'AND', 'AND', 'AND', 'AND', 'AND', 'AND', 'AND'], #NOT A, NOT B, AND(A, B), AND(A, NOT B), AND(NOT A, B), AND(NOT A, NOT B)
     num_inputs = 3,
@@ -233,7 +228,6 @@ register_blueprint(Blueprint(
         
     }
     )
-)
 
 #3x8-bit decoder
 # #takes a 3-bit input and produces an 8-bit output
@@ -1,10 +1,29 @@
-from blueprint import BlueprintRepository
+from blueprint import Blueprint, BlueprintRepository, SinkPort, SourcePort, StructuralCache, define_blueprint, register_blueprint, make_truth_table, execution_tier
+import blueprint
 import embedded_blueprints
 import basic_blueprints
 import adder_blueprints
 import shift_left_blueprints
 import shift_right_blueprints
 import uncategorized_blueprints
+from analytics import stats
+from compiler import flatten, compile_blueprint, native_substitutions, generate_simulator, pack_vectors
+from fault_sim import collapse_faults, fault_coverage
+from waveform import WaveformRecorder
+from vectors import run_vectors, write_vector_file, read_vector_file
+import os, subprocess, sys, tempfile, threading
+from specialize import specialize
+from partition import PartitionedSimulator, partition_netlist
+from truth_table import TruthTable, truth_table, check_golden_hashes
+import itertools
+from synthesis import synthesize
+from timing import TimingSimulator
+from builder import BlueprintBuilder
+from ternary import X, compile_ternary, evaluate_ternary
+from activity import ActivityCounter, measure_activity
+from datapath import DatapathExecutor, assemble, run_reference, reference_alu, ALU_OPS, ALU_OP_CODES
+from native_blueprints import Native_Blueprint, define_native
+from memory_blueprints import define_ram, define_rom, bits_to_int, int_to_bits
 
 def test_nand():
     print("Running NAND unit test...", end="")
@@ -137,9 +156,660 @@ def test_8bit_full_adder_subtractor():
                     carry_out]
     print("Passed")
 
+def test_stats():
+    print("Running stats unit test...", end="")
+    assert stats('NAND').nand_count == 1
+    assert stats('XOR').nand_count == 9
+    assert stats('XOR').max_depth == 5
+    assert stats('FULL_ADDER').max_depth == 10
+    assert stats('8BIT_FULL_ADDER').nand_count == 200
+    assert stats('8BIT_FULL_ADDER').instance_counts['FULL_ADDER'] == 8
+    assert stats('8BIT_FULL_ADDER-SUBTRACTOR').instance_counts['XOR'] == 24
+    assert stats('8BIT_SHIFT_LEFT').gate_count == 0
+    assert stats('8BIT_SHIFT_LEFT').wire_count == 9
+    # carry in to carry out goes through 4 gate levels in each of the 8 full adders
+    assert stats('8BIT_FULL_ADDER').output_depths[8][16] == 32
+    print("Passed")
+
+def test_flatten():
+    print("Running flatten unit test...", end="")
+    netlist = flatten('8BIT_FULL_ADDER-SUBTRACTOR')
+    assert len(netlist.gates) == stats('8BIT_FULL_ADDER-SUBTRACTOR').nand_count
+    for a, b, c in [(0, 0, 0), (255, 1, 0), (100, 27, 1), (3, 200, 1)]:
+        inputs = [(a>>i)&1 for i in range(8)] + [(b>>i)&1 for i in range(8)] + [c]
+        assert netlist.evaluate(inputs) == BlueprintRepository['8BIT_FULL_ADDER-SUBTRACTOR'].evaluate(inputs)
+    print("Passed")
+
+def test_specialize():
+    print("Running specialize unit test...", end="")
+    adder = specialize('8BIT_FULL_ADDER-SUBTRACTOR', fixed_inputs={16: False})
+    subtractor_carry = specialize('8BIT_FULL_ADDER-SUBTRACTOR', fixed_inputs={16: True}, outputs=[8])
+    assert BlueprintRepository[adder.id] is adder
+    assert adder.num_inputs == 16 and subtractor_carry.num_outputs == 1
+    assert stats(adder.id).nand_count < stats('8BIT_FULL_ADDER').nand_count
+    assert stats(subtractor_carry.id).nand_count < stats(adder.id).nand_count
+    for a in range(0, 256, 15):
+        for b in range(0, 256, 17):
+            inputs = [(a>>i)&1 for i in range(8)] + [(b>>i)&1 for i in range(8)]
+            assert adder.evaluate(inputs) == BlueprintRepository['8BIT_FULL_ADDER'].evaluate(inputs + [0])
+            assert subtractor_carry.evaluate(inputs) == [a >= b]
+    print("Passed")
+
+def test_deep_ripple_adder():
+    print("Running deep ripple adder unit test...", end="")
+    # a flat chain of full adders, far deeper than the interpreter's recursion limit
+    bits = 2048
+    connections = {SinkPort(0, 2): SourcePort(None, 2 * bits), SinkPort(None, bits): SourcePort(bits - 1, 1)}
+    for i in range(bits):
+        connections[SinkPort(i, 0)] = SourcePort(None, i)
+        connections[SinkPort(i, 1)] = SourcePort(None, bits + i)
+        connections[SinkPort(None, i)] = SourcePort(i, 0)
+        if i > 0:
+            connections[SinkPort(i, 2)] = SourcePort(i - 1, 1)
+    adder = Blueprint(_id='TEST_DEEP_RIPPLE_ADDER', _node_list=['FULL_ADDER'] * bits, _connections=connections,
+                      num_inputs=2 * bits + 1, num_outputs=bits + 1, input_labels=[], output_labels=[])
+    a, b = 3**1290 % (1 << bits), 7**729 % (1 << bits)
+    outputs = adder.evaluate([(a>>i)&1 for i in range(bits)] + [(b>>i)&1 for i in range(bits)] + [1])
+    assert sum(int(bit) << i for i, bit in enumerate(outputs)) == a + b + 1
+    print("Passed")
+
+def test_cycle_detection():
+    print("Running cycle detection unit test...", end="")
+    try:
+        Blueprint(_id='TEST_CYCLE', _node_list=['NOT', 'NOT'], num_inputs=0, num_outputs=1, input_labels=[], output_labels=[],
+                  _connections={SinkPort(None, 0): SourcePort(1, 0), SinkPort(1, 0): SourcePort(0, 0), SinkPort(0, 0): SourcePort(1, 0)})
+    except ValueError as e:
+        assert 'Cycle detected' in str(e)
+    else:
+        assert False, 'cycle was not detected'
+    print("Passed")
+
+def test_compiled_blueprint():
+    print("Running compiled blueprint unit test...", end="")
+    compiled = compile_blueprint('8BIT_FULL_ADDER-SUBTRACTOR')
+    assert compile_blueprint('8BIT_FULL_ADDER-SUBTRACTOR') is compiled
+    vectors = [[(a>>i)&1 for i in range(8)] + [(b>>i)&1 for i in range(8)] + [c] for a in range(0, 256, 7) for b in range(0, 256, 11) for c in [0,1]]
+    outputs = compiled.evaluate_batch(vectors)
+    for vector, output in zip(vectors, outputs):
+        assert output == BlueprintRepository['8BIT_FULL_ADDER-SUBTRACTOR'].evaluate(vector)
+    assert compiled.evaluate([1, 1]*8 + [0]) == BlueprintRepository['8BIT_FULL_ADDER-SUBTRACTOR'].evaluate([1, 1]*8 + [0])
+    print("Passed")
+
+def test_fault_coverage():
+    print("Running fault coverage unit test...", end="")
+    exhaustive = [[a, b] for a in [False, True] for b in [False, True]]
+    assert fault_coverage('XOR', exhaustive).coverage == 1.0
+    # the vectors of test_8bit_full_adder never set the high bits of a and b
+    vectors = [[bool((a>>i)&1) for i in range(8)] + [bool((b>>i)&1) for i in range(8)] + [bool(c)] for a in range(16) for b in range(16) for c in [0,1]]
+    report = fault_coverage('8BIT_FULL_ADDER', vectors)
+    assert 0 < report.coverage < 1
+    assert (2 + 4, False) in report.undetected # input a4 (wire 6) stuck at 0
+    assert len(report.detected) + len(report.undetected) == len(report.faults)
+    # collapsed faults point at the fault kept for their class, even through chains of
+    # gates (AND is a NAND followed by an inverter: a stuck at 0 -> NAND stuck at 1 -> AND stuck at 0)
+    faults, equivalent = collapse_faults(compile_blueprint('AND').netlist)
+    assert equivalent[(2, False)] == (compile_blueprint('AND').netlist.outputs[0], False)
+    assert all(representative in faults for representative in equivalent.values())
+    assert all(representative in report.faults for representative in report.equivalent.values())
+    # re-evaluating faulty copies of a memory would change its contents
+    try:
+        fault_coverage('RAM_256X8', [[False] * 17])
+    except ValueError as e:
+        assert 'stateful' in str(e)
+    else:
+        assert False, 'stateful blueprint was fault simulated'
+    print("Passed")
+
+def test_waveform_recorder():
+    print("Running waveform recorder unit test...", end="")
+    carry_out = '8BIT_FULL_ADDER/1:4BIT_FULL_ADDER.Cout'
+    vcd_path = os.path.join(tempfile.mkdtemp(), 'adder.vcd')
+    with WaveformRecorder('8BIT_FULL_ADDER', ['8BIT_FULL_ADDER.in0', carry_out], vcd_path=vcd_path, buffer_size=4) as recorder:
+        for a in [0, 255, 255, 1, 0]:
+            recorder.step([(a>>i)&1 for i in range(8)] + [1] + [0]*7 + [0])
+        # only changes get recorded: in0 changes at steps 1 and 4, the carry at steps 1 and 3
+        assert recorder.changes()[-2:] == [(3, carry_out, False), (4, '8BIT_FULL_ADDER.in0', False)]
+    with open(vcd_path) as f:
+        vcd = f.read()
+    assert '$var wire 1 " Cout $end' in vcd
+    assert vcd.split('$enddefinitions $end')[1].split() == ['#0', '0!', '0"', '#1', '1!', '1"', '#3', '0"', '#4', '0!', '#5']
+    print("Passed")
+
+def test_run_vectors():
+    print("Running run_vectors unit test...", end="")
+    directory = tempfile.mkdtemp()
+    in_path, out_path = os.path.join(directory, 'in.bin'), os.path.join(directory, 'out.bin')
+    vectors = [[bool((a>>i)&1) for i in range(8)] + [bool((b>>i)&1) for i in range(8)] + [bool(c)] for a in range(0, 256, 9) for b in range(0, 256, 13) for c in [0,1]]
+    write_vector_file(in_path, vectors, 17)
+    # a chunk size that does not divide the number of vectors exercises the last partial chunk
+    report = run_vectors('8BIT_FULL_ADDER-SUBTRACTOR', in_path, out_path, chunk_size=100)
+    assert report.num_vectors == len(vectors)
+    outputs = read_vector_file(out_path, 9)
+    for vector, output in zip(vectors, outputs):
+        assert output == BlueprintRepository['8BIT_FULL_ADDER-SUBTRACTOR'].evaluate(vector)
+    assert run_vectors('8BIT_FULL_ADDER-SUBTRACTOR', in_path, expected_path=out_path).num_mismatches == 0
+    # the plain adder computes a + b + 1 instead of a - b whenever c = 1
+    report = run_vectors('8BIT_FULL_ADDER', in_path, expected_path=out_path)
+    assert report.num_mismatches == sum(1 for vector in vectors if vector[16])
+    assert report.mismatches[0] == 1
+    # a file that is not made of whole rows
+    with open(os.path.join(directory, 'odd.bin'), 'wb') as f:
+        f.write(bytes(4))
+    try:
+        run_vectors('8BIT_FULL_ADDER', os.path.join(directory, 'odd.bin'), out_path)
+    except ValueError as e:
+        assert 'row size' in str(e)
+    else:
+        assert False, 'truncated vector file was accepted'
+    # a failing writer is reported instead of blocking the evaluation
+    if os.path.exists('/dev/full'):
+        with open(in_path, 'wb') as f:
+            f.write(bytes(3 * 100000))
+        try:
+            run_vectors('8BIT_FULL_ADDER-SUBTRACTOR', in_path, '/dev/full', chunk_size=10000)
+        except OSError:
+            pass
+        else:
+            assert False, 'write error was lost'
+    print("Passed")
+
+def test_lazy_loading():
+    print("Running lazy loading unit test...", end="")
+    define_blueprint(_id='TEST_LAZY_INNER', _node_list=['NOT'], num_inputs=1, num_outputs=1, input_labels=[], output_labels=[],
+                     _connections={SinkPort(None, 0): SourcePort(0, 0), SinkPort(0, 0): SourcePort(None, 0)})
+    define_blueprint(_id='TEST_LAZY_OUTER', _node_list=['TEST_LAZY_INNER'], num_inputs=1, num_outputs=1, input_labels=[], output_labels=[],
+                     _connections={SinkPort(None, 0): SourcePort(0, 0), SinkPort(0, 0): SourcePort(None, 0)})
+    define_blueprint(_id='TEST_LAZY_UNUSED', _node_list=['TEST_LAZY_MISSING'], num_inputs=0, num_outputs=0, input_labels=[], output_labels=[],
+                     _connections={})
+    # defining does not build anything, not even the broken definition
+    assert not BlueprintRepository.is_loaded('TEST_LAZY_OUTER')
+    assert 'TEST_LAZY_UNUSED' in BlueprintRepository and 'TEST_LAZY_UNUSED' in BlueprintRepository.available()
+    assert BlueprintRepository['TEST_LAZY_OUTER'].evaluate([True]) == [False]
+    assert BlueprintRepository.is_loaded('TEST_LAZY_INNER')
+    assert not BlueprintRepository.is_loaded('TEST_LAZY_UNUSED')
+    assert BlueprintRepository.get('TEST_LAZY_NOT_DEFINED') is None
+    print("Passed")
+
+def test_reregistration_invalidation():
+    print("Running re-registration invalidation unit test...", end="")
+    original_and = BlueprintRepository['AND']
+    compiled_xor = compile_blueprint('XOR')
+    assert stats('XOR').instance_counts['NOT'] == 4
+    version = BlueprintRepository.version('AND')
+    BlueprintRepository['FULL_ADDER']
+    assert {'XOR', 'HALF_ADDER', 'FULL_ADDER'} <= BlueprintRepository.dependents('AND')
+    assert 'OR' not in BlueprintRepository.dependents('AND')
+    try:
+        # AND(a, b) = NOT(NAND(a, b)): the same NANDs, but now with a NOT node
+        register_blueprint(Blueprint(_id='AND', _node_list=['NAND', 'NOT'], num_inputs=2, num_outputs=1, input_labels=[], output_labels=[],
+                                     _connections={SinkPort(None, 0): SourcePort(1, 0), SinkPort(1, 0): SourcePort(0, 0),
+                                                   SinkPort(0, 0): SourcePort(None, 0), SinkPort(0, 1): SourcePort(None, 1)}))
+        assert BlueprintRepository.version('AND') == version + 1
+        assert stats('XOR').instance_counts['NOT'] == 6
+        assert compile_blueprint('XOR') is not compiled_xor
+        assert stats('OR').nand_count == 3
+        assert BlueprintRepository['FULL_ADDER'].evaluate([1, 1, 0]) == [False, True]
+        try:
+            register_blueprint(Blueprint(_id='AND', _node_list=[], num_inputs=3, num_outputs=1, input_labels=[], output_labels=[],
+                                         _connections={SinkPort(None, 0): False}))
+        except ValueError as e:
+            assert 'Cannot replace' in str(e)
+        else:
+            assert False, 'interface change was accepted'
+    finally:
+        register_blueprint(original_and)
+    assert stats('XOR').instance_counts['NOT'] == 4
+    print("Passed")
+
+def test_partitioned_simulation():
+    print("Running partitioned simulation unit test...", end="")
+    compiled = compile_blueprint('8BIT_FULL_ADDER')
+    partition = partition_netlist(compiled.netlist, 2)
+    assert sorted(partition.part_sizes) == [98, 102] and partition.num_bands == 2
+    # every wire read in another region is produced in an earlier band
+    for index, gate in enumerate(compiled.netlist.gates):
+        for wire in gate.inputs:
+            driver = compiled.netlist.driver(wire)
+            if driver is not None and partition.parts[driver] != partition.parts[index]:
+                assert wire in partition.cut_wires and partition.bands[driver] < partition.bands[index]
+    inputs = [int.from_bytes(bytes(range(port, port + 64, 3))[:8], 'little') * (port + 1) & (2**64 - 1) for port in range(17)]
+    with PartitionedSimulator('8BIT_FULL_ADDER', num_workers=2) as simulator:
+        assert simulator.evaluate_packed(inputs, 64) == compiled.evaluate_packed(inputs, 64)
+        vector = [True] * 8 + [False] * 7 + [True, True]
+        assert simulator.evaluate(vector) == BlueprintRepository['8BIT_FULL_ADDER'].evaluate(vector)
+    # an error in a worker is raised by the step instead of leaving it waiting forever
+    def failing_words(inputs, m):
+        if inputs[0]:
+            raise ArithmeticError('gate failure')
+        return [inputs[0]]
+    define_native('TEST_FAILING_GATE', 1, 1, failing_words)
+    with PartitionedSimulator('TEST_FAILING_GATE', num_workers=1) as simulator:
+        assert simulator.evaluate([False]) == [False]
+        try:
+            simulator.evaluate([True])
+        except RuntimeError as e:
+            assert 'gate failure' in str(e)
+        else:
+            assert False, 'worker error was lost'
+    try:
+        PartitionedSimulator('RAM_256X8', num_workers=1)
+    except ValueError as e:
+        assert 'stateful' in str(e)
+    else:
+        assert False, 'stateful blueprint was partitioned'
+    print("Passed")
+
+def test_truth_table():
+    print("Running truth table unit test...", end="")
+    table = make_truth_table('FULL_ADDER', print_table=False)
+    for row, inputs in enumerate(itertools.product([False, True], repeat=3)):
+        assert table.row(row) == table.lookup(list(inputs)) == BlueprintRepository['FULL_ADDER'].evaluate(list(inputs))
+    adder = truth_table('8BIT_FULL_ADDER')
+    assert sum(len(column) for column in adder.columns) == 9 * 2**17 // 8
+    for a, b, c in [(0, 0, 0), (255, 255, 1), (170, 85, 1), (3, 200, 0)]:
+        inputs = [bool((a >> i) & 1) for i in range(8)] + [bool((b >> i) & 1) for i in range(8)] + [bool(c)]
+        assert adder.lookup(inputs) == BlueprintRepository['8BIT_FULL_ADDER'].evaluate(inputs)
+    # the adder and the adder-subtractor only differ when the last input (the row's lowest bit) is set
+    rows = adder.diff(truth_table('8BIT_FULL_ADDER-SUBTRACTOR'))
+    assert len(rows) == 2**16 and all(row & 1 for row in rows)
+    path = os.path.join(tempfile.mkdtemp(), 'adder.tt')
+    adder.save(path)
+    loaded = TruthTable.load(path)
+    assert loaded == adder and loaded.content_hash() == adder.content_hash() and os.path.getsize(path) < 150000
+    assert check_golden_hashes(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden_truth_tables.json')) == []
+    print("Passed")
+
+def test_synthesis():
+    print("Running synthesis unit test...", end="")
+    for a in range(8):
+        for e in [0, 1]:
+            out = (1 << a) if e else 0
+            assert BlueprintRepository['3X8BIT_DECODER'].evaluate([a&1, (a>>1)&1, (a>>2)&1, e]) == [bool((out >> bit) & 1) for bit in range(8)]
+    for a in range(16):
+        for b in range(16):
+            inputs = [bool((a >> bit) & 1) for bit in range(4)] + [bool((b >> bit) & 1) for bit in range(4)]
+            assert BlueprintRepository['4BIT_COMPARATOR'].evaluate(inputs) == [a < b, a == b, a > b]
+    # re-synthesizing a hand-wired block from its truth table keeps the behavior
+    xor = synthesize(truth_table('XOR'), blueprint_id='TEST_SYNTHESIZED_XOR')
+    assert truth_table('TEST_SYNTHESIZED_XOR') == truth_table('XOR')
+    assert sorted(xor._node_list) == ['AND', 'AND', 'NOT', 'NOT', 'OR']
+    # constant outputs do not need any node
+    constant = synthesize(lambda inputs: [False, True], 2, 2, register=False)
+    assert constant._node_list == [] and constant.evaluate([True, False]) == [False, True]
+    print("Passed")
+
+def test_native_substitution():
+    print("Running native substitution unit test...", end="")
+    substitutions = native_substitutions()
+    assert substitutions['8BIT_FULL_ADDER'] == 'NATIVE_8BIT_FULL_ADDER' and substitutions['XOR'] == 'NATIVE_XOR'
+    assert BlueprintRepository['NATIVE_4BIT_FULL_ADDER'].evaluate([1, 1, 1, 1, 1, 0, 0, 0, 1]) == [True, False, False, False, True]
+    # a subtractor instance becomes one native gate, while debug mode keeps every NAND
+    fast, debug = compile_blueprint('8BIT_FULL_ADDER-SUBTRACTOR', 'fast'), compile_blueprint('8BIT_FULL_ADDER-SUBTRACTOR')
+    assert [gate.kind for gate in fast.netlist.gates] == ['NATIVE_8BIT_FULL_ADDER-SUBTRACTOR']
+    assert len(debug.netlist.gates) == 272
+    inputs = [int.from_bytes(bytes((port * 37 + byte * 11) % 256 for byte in range(32)), 'little') for port in range(17)]
+    assert fast.evaluate_packed(inputs, 256) == debug.evaluate_packed(inputs, 256)
+    # blocks without a native replacement are still expanded, around the native gates
+    comparator = compile_blueprint('4BIT_COMPARATOR', 'fast')
+    assert {gate.kind for gate in comparator.netlist.gates} == {'NATIVE_NOT', 'NATIVE_AND', 'NATIVE_OR'}
+    assert comparator.evaluate_batch([[True] * 4 + [False] * 4]) == [[False, False, True]]
+    # replacing a native primitive checks it again: a broken one is not substituted any more
+    original = BlueprintRepository['NATIVE_XOR']
+    fast_xor = compile_blueprint('XOR', 'fast')
+    try:
+        for words, inline in [(lambda inputs, m: [inputs[0] & inputs[1]], original.inline),
+                              (original.words, lambda inputs, outputs, prefix: [f'{outputs[0]} = {inputs[0]} | {inputs[1]}'])]:
+            register_blueprint(Native_Blueprint('NATIVE_XOR', 2, 1, words, 'XOR', inline))
+            assert 'XOR' not in native_substitutions()
+            assert compile_blueprint('XOR', 'fast') is not fast_xor
+            assert 'NATIVE_XOR' not in {gate.kind for gate in compile_blueprint('XOR', 'fast').netlist.gates}
+            assert compile_blueprint('XOR', 'fast').evaluate_batch([[True, True], [True, False]]) == [[False], [True]]
+    finally:
+        register_blueprint(original)
+    assert native_substitutions()['XOR'] == 'NATIVE_XOR'
+    print("Passed")
+
+def test_memory_blueprints():
+    print("Running memory blueprints unit test...", end="")
+    directory = tempfile.mkdtemp()
+    define_ram('TEST_RAM', 4, 8, path=os.path.join(directory, 'ram.bin'))
+    define_rom('TEST_ROM', 2, 12, image=bytes([0x23, 0x01, 0x56, 0x04, 0xff, 0x0f]))
+    ram, rom = BlueprintRepository['TEST_RAM'], BlueprintRepository['TEST_ROM']
+    assert ram.is_stateful and not rom.is_stateful
+    assert [bits_to_int(rom.evaluate(int_to_bits(address, 2))) for address in range(4)] == [0x123, 0x456, 0xfff, 0]
+    # loading a new image drops what was derived from the old contents of the ROM
+    register_blueprint(Blueprint(_id='TEST_ROM_USER', _node_list=['TEST_ROM'], num_inputs=2, num_outputs=1, input_labels=[], output_labels=[],
+                                 _connections={SinkPort(0, 0): SourcePort(None, 0), SinkPort(0, 1): SourcePort(None, 1), SinkPort(None, 0): SourcePort(0, 0)}))
+    assert truth_table('TEST_ROM_USER').row(0) == [True] and compile_blueprint('TEST_ROM_USER').evaluate([False, False]) == [True]
+    rom.load(bytes([0x22, 0x01]))
+    assert truth_table('TEST_ROM_USER').row(0) == [False] and bits_to_int(truth_table('TEST_ROM').row(0)) == 0x122
+    assert compile_blueprint('TEST_ROM_USER').evaluate([False, False]) == [False]
+    # a write returns the previous contents, a read afterwards sees the new ones
+    assert ram.evaluate(int_to_bits(5, 4) + int_to_bits(0xa7, 8) + [True]) == [False] * 8
+    assert bits_to_int(ram.evaluate(int_to_bits(5, 4) + [False] * 8 + [False])) == 0xa7
+    # the patterns of evaluate_words are consecutive cycles: write 3 to address 2, read it back
+    words = [0, 0b11, 0, 0] + [0b01, 0b01] + [0] * 6 + [0b01]
+    outputs = ram.evaluate_words(words, 3)
+    assert [bits_to_int([(word >> cycle) & 1 for word in outputs]) for cycle in range(2)] == [0, 3]
+    ram.flush()
+    with open(os.path.join(directory, 'ram.bin'), 'rb') as f:
+        assert f.read()[5] == 0xa7
+    # a memory whose outputs are unused is still evaluated inside a bigger blueprint
+    writer = Blueprint(_id='TEST_RAM_WRITER', _node_list=['TEST_RAM'], num_inputs=13, num_outputs=1, input_labels=[], output_labels=[],
+                       _connections={**{SinkPort(0, port): SourcePort(None, port) for port in range(13)}, SinkPort(None, 0): True})
+    assert writer.is_stateful
+    writer.evaluate(int_to_bits(9, 4) + int_to_bits(0x5c, 8) + [True])
+    assert ram.read(9) == 0x5c
+    # building a blueprint around a memory does not clock it, even with write enable tied high
+    ram.write(0, 0x5a)
+    Blueprint(_id='TEST_RAM_ALWAYS_WRITING', _node_list=['TEST_RAM'], num_inputs=12, num_outputs=1, input_labels=[], output_labels=[],
+              _connections={**{SinkPort(0, port): SourcePort(None, port) for port in range(12)}, SinkPort(0, 12): True, SinkPort(None, 0): SourcePort(0, 0)})
+    assert ram.read(0) == 0x5a
+    # closing a file-backed memory writes it back and releases the mapping
+    define_ram('TEST_CLOSED_RAM', 2, 8, path=os.path.join(directory, 'closed.bin'))
+    closed = BlueprintRepository['TEST_CLOSED_RAM']
+    closed.write(3, 0x99)
+    closed.close()
+    assert closed.storage.closed
+    with open(os.path.join(directory, 'closed.bin'), 'rb') as f:
+        assert f.read() == bytes([0, 0, 0, 0x99])
+    # register file: two read ports and one write port
+    registers = BlueprintRepository['REGISTER_FILE_8X8']
+    registers.evaluate(int_to_bits(0, 3) + int_to_bits(0, 3) + int_to_bits(6, 3) + int_to_bits(42, 8) + [True])
+    outputs = registers.evaluate(int_to_bits(6, 3) + int_to_bits(1, 3) + int_to_bits(0, 3) + int_to_bits(0, 8) + [False])
+    assert bits_to_int(outputs[:8]) == 42 and bits_to_int(outputs[8:]) == 0
+    print("Passed")
+
+def test_thread_safety():
+    print("Running thread safety unit test...", end="")
+    # many threads asking for the same blueprints at once get the same objects
+    results, errors = [], []
+    def worker():
+        try:
+            results.append((BlueprintRepository['8BIT_OR'], compile_blueprint('8BIT_OR'), Blueprint.next_id()))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len({id(blueprint) for blueprint, _, _ in results}) == 1 and len({id(compiled) for _, compiled, _ in results}) == 1
+    assert len({next_id for _, _, next_id in results}) == 16
+    compiled = compile_blueprint('8BIT_FULL_ADDER')
+    vectors = [[bool((a >> i) & 1) for i in range(8)] + [bool((b >> i) & 1) for i in range(8)] + [bool(a & b & 1)] for a in range(0, 256, 5) for b in range(0, 256, 7)]
+    assert compiled.evaluate_batch_parallel(vectors, max_workers=4, chunk_size=100) == compiled.evaluate_batch(vectors)
+    print("Passed")
+
+def test_timing_simulation():
+    print("Running timing simulation unit test...", end="")
+    # a carry entering the bottom of 255 + 0 ripples through all 8 full adders
+    simulator = TimingSimulator('8BIT_FULL_ADDER')
+    simulator.reset([True] * 8 + [False] * 9)
+    transition = simulator.apply([True] * 8 + [False] * 8 + [True])
+    assert transition.outputs == [False] * 8 + [True]
+    assert transition.settling_time == 33 and transition.start_time == 0
+    slow = TimingSimulator('8BIT_FULL_ADDER', delays={'NAND': 3})
+    slow.reset([True] * 8 + [False] * 9)
+    assert slow.apply([True] * 8 + [False] * 8 + [True]).settling_time == 99
+    # after every transition the outputs are the zero-delay ones
+    vectors = [[bool((a >> i) & 1) for i in range(8)] + [bool((b >> i) & 1) for i in range(8)] + [bool((a ^ b) & 4)] for a, b in zip(range(0, 256, 7), range(255, 0, -9))]
+    for vector in vectors:
+        assert simulator.apply(vector).outputs == BlueprintRepository['8BIT_FULL_ADDER'].evaluate(vector)
+    report = simulator.run(vectors)
+    assert report.num_transitions == len(vectors) and 0 < report.max_settling_time <= 33
+    assert report.glitch_counts and all(simulator.netlist.driver(wire) is not None for wire in report.glitch_counts)
+    # memories would be clocked on every event, so they are rejected (and left untouched)
+    ram = BlueprintRepository['RAM_256X8']
+    ram.write(0, 0x3c)
+    try:
+        TimingSimulator('RAM_256X8')
+    except ValueError as e:
+        assert 'stateful' in str(e)
+    else:
+        assert False, 'stateful gates were accepted'
+    assert ram.read(0) == 0x3c
+    print("Passed")
+
+def test_blueprint_builder():
+    print("Running blueprint builder unit test...", end="")
+    # an 8-bit ripple adder out of full adders behaves like the hand-wired one
+    builder = BlueprintBuilder(17, 9, 'TEST_BUILT_8BIT_ADDER')
+    carry = builder.input(16)
+    sums = []
+    for bit in range(8):
+        total, carry = builder.instantiate('FULL_ADDER', [builder.input(bit), builder.input(8 + bit), carry])
+        sums.append(total)
+    builder.connect_bus(sums + [carry], builder.output_bus(0, 9))
+    builder.build()
+    assert truth_table('TEST_BUILT_8BIT_ADDER') == truth_table('8BIT_FULL_ADDER')
+
+    # connections are checked as they are made
+    builder = BlueprintBuilder(1, 1)
+    first, second, third = builder.add_node('NOT'), builder.add_node('NOT'), builder.add_node('NOT')
+    builder.connect(SourcePort(third, 0), SinkPort(first, 0)) # goes backwards in the order, which gets fixed
+    builder.connect(SourcePort(first, 0), SinkPort(second, 0))
+    order = builder.node_order()
+    assert order.index(third) < order.index(first) < order.index(second)
+    for source, sink, message in [(SourcePort(second, 0), SinkPort(third, 0), 'Cycle detected'),
+                                  (SourcePort(None, 0), SinkPort(first, 0), 'already connected'),
+                                  (SourcePort(None, 1), SinkPort(third, 0), 'Invalid source port'),
+                                  (SourcePort(first, 0), SinkPort(first, 1), 'Invalid sink port')]:
+        try:
+            builder.connect(source, sink)
+        except ValueError as e:
+            assert message in str(e)
+        else:
+            assert False, f'{source} -> {sink} was accepted'
+    try:
+        builder.build(register=False)
+    except ValueError as e:
+        assert 'Unconnected sinks' in str(e)
+    else:
+        assert False, 'incomplete blueprint was built'
+    builder.connect(builder.input(0), SinkPort(third, 0))
+    builder.connect(SourcePort(second, 0), builder.output(0))
+    built = builder.build(register=False)
+    assert built.evaluate([True]) == [False]
+    # using the builder again leaves the blueprint it built alone
+    nodes, connections = list(built._node_list), dict(built._connections)
+    builder.connect(builder.input(0), SinkPort(builder.add_node('NOT'), 0))
+    assert built._node_list == nodes and built._connections == connections
+    print("Passed")
+
+def test_ternary_simulation():
+    print("Running ternary simulation unit test...", end="")
+    # the carry out is known as soon as both top bits are 1, whatever the other bits are
+    assert evaluate_ternary('8BIT_FULL_ADDER', [X] * 7 + [True] + [X] * 7 + [True] + [X]) == [X] * 8 + [True]
+    assert evaluate_ternary('8BIT_FULL_ADDER', [X] * 7 + [False] + [X] * 7 + [False] + [X])[8] == False
+    # a disabled decoder outputs 0 for any selection
+    assert evaluate_ternary('2X4BIT_DECODER', [X, X, False]) == [False] * 4
+    assert evaluate_ternary('NAND', [X, False]) == [True] and evaluate_ternary('NAND', [X, True]) == [X]
+    # never claims a known value that some completion of the X inputs contradicts
+    adder = compile_ternary('4BIT_FULL_ADDER')
+    vectors = [[[False, True, X][(index * 7 + port * 5) % 3 if (index >> (port % 4)) & 1 else port % 2] for port in range(9)] for index in range(64)]
+    for vector, outputs in zip(vectors, adder.evaluate_batch(vectors)):
+        unknown = [port for port, value in enumerate(vector) if value is X]
+        for completion in itertools.product([False, True], repeat=len(unknown)):
+            filled = list(vector)
+            for port, value in zip(unknown, completion):
+                filled[port] = value
+            expected = BlueprintRepository['4BIT_FULL_ADDER'].evaluate(filled)
+            assert all(output is X or output == value for output, value in zip(outputs, expected))
+        if not unknown:
+            assert outputs == BlueprintRepository['4BIT_FULL_ADDER'].evaluate(vector)
+    print("Passed")
+
+def test_switching_activity():
+    print("Running switching activity unit test...", end="")
+    # counting up through every pattern: bit k of the count toggles 2^(n-k) times
+    vectors = [int_to_bits(value, 9) for value in range(512)]
+    report = measure_activity('4BIT_FULL_ADDER', vectors)
+    assert report.num_transitions == 511
+    assert [report.wire_toggles[wire] for wire in report.netlist.inputs] == [511 >> bit for bit in range(9)]
+    # same counts wherever the stream is split, and against a wire-by-wire reference
+    counter = ActivityCounter('4BIT_FULL_ADDER')
+    for start, end in [(0, 1), (1, 100), (100, 300), (300, 512)]:
+        assert counter.evaluate_batch(vectors[start:end]) == [BlueprintRepository['4BIT_FULL_ADDER'].evaluate(vector) for vector in vectors[start:end]]
+    assert counter.report().wire_toggles == report.wire_toggles
+    netlist = report.netlist
+    _, words = generate_simulator(netlist, range(netlist.num_wires))(pack_vectors(vectors, 9), (1 << 512) - 1)
+    assert report.wire_toggles[2:] == [((word ^ (word >> 1)) & ((1 << 511) - 1)).bit_count() for word in words[2:]]
+    # totals per instance and per blueprint
+    assert report.instance_toggles[0] == sum(report.wire_toggles[wire] for gate in report.netlist.gates for wire in gate.outputs)
+    assert report.by_blueprint['4BIT_FULL_ADDER'].num_instances == 1
+    assert report.by_blueprint['FULL_ADDER'].num_instances == 4
+    assert report.by_blueprint['NAND'].toggles == report.instance_toggles[0]
+    assert 0 < report.activity_factor('FULL_ADDER') < 1
+    # a constant stream does not toggle anything
+    assert sum(measure_activity('8BIT_FULL_ADDER', [[True] * 17] * 50).wire_toggles) == 0
+    # streaming a vector file through a counter
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'in.bin')
+        write_vector_file(path, vectors, 9)
+        counter = ActivityCounter('4BIT_FULL_ADDER')
+        run_vectors('4BIT_FULL_ADDER', path, chunk_size=100, activity=counter)
+        assert counter.report().wire_toggles == report.wire_toggles
+    print("Passed")
+
+def test_structural_hash():
+    print("Running structural hash unit test...", end="")
+    original = BlueprintRepository['AND']
+    # the same wiring as AND under another id, with other labels and the connections in another order
+    copy = Blueprint(_id='AND_COPY', _node_list=list(original._node_list), num_inputs=2, num_outputs=1, input_labels=['x', 'y'], output_labels=['z'],
+                     _connections=dict(reversed(list(original._connections.items()))))
+    register_blueprint(copy)
+    assert BlueprintRepository.structural_hash('AND_COPY') == BlueprintRepository.structural_hash('AND')
+    assert BlueprintRepository.structural_hash('AND') != BlueprintRepository.structural_hash('OR')
+    assert BlueprintRepository.structural_hash('8BIT_SHIFT_LEFT') != BlueprintRepository.structural_hash('8BIT_SHIFT_RIGHT')
+    # parents built from identical sub-blueprints are identical too
+    register_blueprint(Blueprint(_id='NAND_OF_AND_COPY', _node_list=['AND_COPY', 'NOT'], num_inputs=2, num_outputs=1, input_labels=[], output_labels=[],
+                                 _connections={SinkPort(1, 0): SourcePort(0, 0), SinkPort(0, 1): SourcePort(None, 1), SinkPort(0, 0): SourcePort(None, 0), SinkPort(None, 0): SourcePort(1, 0)}))
+    register_blueprint(Blueprint(_id='NAND_OF_AND', _node_list=['AND', 'NOT'], num_inputs=2, num_outputs=1, input_labels=[], output_labels=[],
+                                 _connections={SinkPort(None, 0): SourcePort(1, 0), SinkPort(0, 0): SourcePort(None, 0), SinkPort(0, 1): SourcePort(None, 1), SinkPort(1, 0): SourcePort(0, 0)}))
+    assert BlueprintRepository.structural_hash('NAND_OF_AND_COPY') == BlueprintRepository.structural_hash('NAND_OF_AND')
+    # one compiled function and one truth table for both, each under its own name
+    compiled, compiled_copy = compile_blueprint('NAND_OF_AND'), compile_blueprint('NAND_OF_AND_COPY')
+    assert compiled._simulate is compiled_copy._simulate
+    assert compiled.blueprint_id == 'NAND_OF_AND' and compiled_copy.blueprint_id == 'NAND_OF_AND_COPY'
+    assert compile_ternary('AND_COPY')._simulate is compile_ternary('AND')._simulate
+    table = truth_table('AND_COPY')
+    assert table.columns is truth_table('AND').columns and table.input_labels == ['x', 'y'] and table.blueprint_id == 'AND_COPY'
+    # only the code is shared: each twin's netlist names its own sub-blueprints, whichever is compiled first
+    for order in (['NAND_OF_AND_COPY', 'NAND_OF_AND'], ['NAND_OF_AND', 'NAND_OF_AND_COPY']):
+        for blueprint_id in order:
+            register_blueprint(BlueprintRepository[blueprint_id])
+        for blueprint_id in order:
+            netlist = compile_blueprint(blueprint_id).netlist
+            inner = 'AND_COPY' if blueprint_id == 'NAND_OF_AND_COPY' else 'AND'
+            assert [instance.blueprint_id for instance in netlist.instances] == [blueprint_id, inner, 'NOT']
+            wire = netlist.wire_name(netlist.instances[1].outputs[0])
+            assert wire.startswith(f'{blueprint_id}/0:{inner}/')
+            assert WaveformRecorder(blueprint_id, [wire]).changes() == []
+    # changing the structure changes the hash and the compiled code
+    register_blueprint(Blueprint(_id='AND_COPY', _node_list=['NAND', 'NOT'], num_inputs=2, num_outputs=1, input_labels=[], output_labels=[],
+                                 _connections={SinkPort(None, 0): SourcePort(1, 0), SinkPort(1, 0): SourcePort(0, 0),
+                                               SinkPort(0, 0): SourcePort(None, 1), SinkPort(0, 1): SourcePort(None, 0)}))
+    assert BlueprintRepository.structural_hash('AND_COPY') != BlueprintRepository.structural_hash('AND')
+    assert BlueprintRepository.structural_hash('NAND_OF_AND_COPY') != BlueprintRepository.structural_hash('NAND_OF_AND')
+    assert compile_blueprint('NAND_OF_AND_COPY')._simulate is not compiled._simulate
+    assert compile_blueprint('NAND_OF_AND_COPY').evaluate([True, True]) == [False]
+    # the shared caches only keep the most recently used entries
+    cache = StructuralCache(max_entries=2)
+    for key in 'ab':
+        assert BlueprintRepository.cached(cache, key, lambda: key.upper()) == key.upper()
+    assert cache.get('a') == 'A'
+    cache['c'] = 'C'
+    assert list(cache) == ['a', 'c'] and cache.get('b') is None
+    print("Passed")
+
+def test_datapath():
+    print("Running datapath unit test...", end="")
+    # the ALU is found by name in a fresh interpreter, without loading the datapath harness
+    script = "import sys; from ternary import evaluate_ternary; from memory_blueprints import int_to_bits; " \
+             "print(evaluate_ternary('8BIT_ALU', int_to_bits(3, 8) + int_to_bits(4, 8) + [False] * 3), 'datapath' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == f'{int_to_bits(7, 8) + [False, False]} False'
+    # every ALU operation of the composed blueprint matches the reference model
+    alu = compile_blueprint('8BIT_ALU')
+    operands = [(a, b) for a in range(0, 256, 17) for b in (0, 1, 0x7f, 0x80, 0xff, a)]
+    for op in ALU_OPS:
+        vectors = [int_to_bits(a, 8) + int_to_bits(b, 8) + int_to_bits(ALU_OP_CODES[op], 3) for a, b in operands]
+        for (a, b), outputs in zip(operands, alu.evaluate_batch(vectors)):
+            assert (bits_to_int(outputs[:8]), outputs[8], outputs[9]) == reference_alu(op, a, b)
+    # Fibonacci numbers until the next one overflows 8 bits: 144 + 233 = 377 = 256 + 121
+    program = assemble('''
+        LI r1, 0
+        LI r2, 1
+    loop:
+        ADD r3, r1, r2
+        JC done
+        MOV r1, r2
+        MOV r2, r3
+        JMP loop
+    done:
+        HALT
+    ''')
+    for mode in ('debug', 'fast'):
+        report = DatapathExecutor(mode, check=True).execute(program)
+        assert report.mismatches == []
+        assert report.registers == run_reference(program).registers
+        assert report.registers[1:4] == [144, 233, 121]
+        assert report.num_instructions > report.num_alu_operations > 0 and report.instructions_per_second > 0
+    try:
+        assemble('ADD r1, r2')
+    except ValueError as e:
+        assert 'takes 3 operands' in str(e)
+    else:
+        assert False, 'missing operand was accepted'
+    print("Passed")
+
+def test_tiered_execution():
+    print("Running tiered execution unit test...", end="")
+    thresholds = blueprint.COMPILE_THRESHOLD, blueprint.LUT_THRESHOLD
+    blueprint.COMPILE_THRESHOLD, blueprint.LUT_THRESHOLD = 10, 30
+    try:
+        xor = BlueprintRepository['XOR']
+        register_blueprint(Blueprint(_id='TIERED_XOR', _node_list=list(xor._node_list), _connections=dict(xor._connections),
+                                     num_inputs=2, num_outputs=1, input_labels=[], output_labels=[]))
+        tiered = BlueprintRepository['TIERED_XOR']
+        assert execution_tier('TIERED_XOR') is None
+        seen = []
+        for call in range(40):
+            a, b = bool(call & 1), bool(call & 2)
+            assert tiered.evaluate([a, b]) == [a != b]
+            seen.append(execution_tier('TIERED_XOR').tier)
+        assert seen[8] == 'interpreted' and seen[9] == 'compiled' and seen[28] == 'compiled' and seen[29] == 'lut'
+        assert execution_tier('TIERED_XOR').transitions == [('compiled', 10), ('lut', 30)] and execution_tier('TIERED_XOR').calls == 40
+        # replacing a dependency starts over from the interpreted tier
+        register_blueprint(BlueprintRepository['NOT'])
+        assert execution_tier('TIERED_XOR') is None
+        tiered.evaluate([True, True])
+        assert execution_tier('TIERED_XOR').tier == 'interpreted'
+        # a blueprint that is not the one registered under its id always stays interpreted
+        copy = Blueprint(_id='TIERED_XOR', _node_list=list(xor._node_list), _connections=dict(xor._connections),
+                         num_inputs=2, num_outputs=1, input_labels=[], output_labels=[])
+        for _ in range(40):
+            copy.evaluate([True, False])
+        assert execution_tier('TIERED_XOR').calls == 1
+        # stateful blueprints get compiled but never replaced by a truth table
+        define_ram('TIERED_RAM', 2, 1)
+        register_blueprint(Blueprint(_id='TIERED_RAM_USER', _node_list=['TIERED_RAM'], num_inputs=4, num_outputs=1, input_labels=[], output_labels=[],
+                                     _connections={**{SinkPort(0, port): SourcePort(None, port) for port in range(4)}, SinkPort(None, 0): SourcePort(0, 0)}))
+        ram_user = BlueprintRepository['TIERED_RAM_USER']
+        for call in range(40):
+            address = call % 4
+            assert ram_user.evaluate(int_to_bits(address, 2) + [True, True]) == [call >= 4]
+        assert execution_tier('TIERED_RAM_USER').tier == 'compiled'
+    finally:
+        blueprint.COMPILE_THRESHOLD, blueprint.LUT_THRESHOLD = thresholds
+    print("Passed")
+
 def run_all_tests():
     print('Running unit tests...')
-    tests = [test_nand(), test_not(), test_and(), test_or(), test_xor(), test_half_adder(), test_full_adder(), test_2bit_full_adder(), test_4bit_full_adder(), test_8bit_full_adder()]
+    tests = [test_nand(), test_not(), test_and(), test_or(), test_xor(), test_half_adder(), test_full_adder(), test_2bit_full_adder(), test_4bit_full_adder(), test_8bit_full_adder(), test_stats(), test_flatten(), test_specialize(), test_deep_ripple_adder(), test_cycle_detection(), test_compiled_blueprint(), test_fault_coverage(), test_waveform_recorder(), test_run_vectors(), test_lazy_loading(), test_reregistration_invalidation(), test_partitioned_simulation(), test_truth_table(), test_synthesis(), test_native_substitution(), test_memory_blueprints(), test_thread_safety(), test_timing_simulation(), test_blueprint_builder(), test_ternary_simulation(), test_switching_activity(), test_structural_hash(), test_datapath(), test_tiered_execution()]
     for test in tests:
         test
     print('All tests passed')
\ No newline at end of file
@@ -0,0 +1,199 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import List, Iterable, Iterator, Tuple
+import mmap, os, queue, threading, time
+from blueprint import BlueprintID
+from compiler import compile_blueprint
+from activity import ActivityCounter
+
+
+# Streaming test vectors.
+# A vector file is a plain array of packed rows, one row per vector. A row holds one bit
+# per port, port i being bit i % 8 of byte i // 8 (unused bits of the last byte are 0),
+# so a blueprint with 17 inputs takes 3 bytes per vector. Input files are memory mapped
+# and processed a fixed number of vectors at a time: each chunk is transposed into one
+# word per input, evaluated in a single call of the compiled blueprint, transposed back
+# and handed to a writer thread, so memory use does not depend on the number of vectors
+# and disk writes overlap with evaluation.
+
+
+def row_size(num_ports: int) -> int:
+    return (num_ports + 7) // 8
+
+
+def write_vector_file(path: str, vectors: Iterable[List[bool]], num_ports: int):
+    """Write vectors as packed rows
+    """
+    with open(path, 'wb') as f:
+        for vector in vectors:
+            value = sum(1 << port for port in range(num_ports) if vector[port])
+            f.write(value.to_bytes(row_size(num_ports), 'little'))
+
+
+def read_vector_file(path: str, num_ports: int) -> List[List[bool]]:
+    """Read a whole vector file back into a list of vectors (only meant for small files)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    size = row_size(num_ports)
+    vectors = []
+    for offset in range(0, len(data), size):
+        value = int.from_bytes(data[offset:offset + size], 'little')
+        vectors.append([bool((value >> port) & 1) for port in range(num_ports)])
+    return vectors
+
+
+# Transposing between rows and words is done with whole-chunk integer and bytes
+# operations: the bytes at the same position of every row form a "column" integer where
+# byte v belongs to vector v. Masking one bit out of every byte and adding ord('0') turns
+# that bit into an ASCII string of '0'/'1' characters, which int() parses in one go.
+class _Transposer:
+    def __init__(self, count: int):
+        self.count = count
+        self.ones = int.from_bytes(b'\x01' * count, 'little')
+        self.zeros = int.from_bytes(b'0' * count, 'little')
+
+    def rows_to_words(self, rows: bytes, num_ports: int) -> List[int]:
+        size = row_size(num_ports)
+        words = []
+        for byte_index in range(size):
+            column = int.from_bytes(rows[byte_index::size], 'little')
+            for bit in range(min(8, num_ports - 8 * byte_index)):
+                digits = (((column >> bit) & self.ones) | self.zeros).to_bytes(self.count, 'little')
+                words.append(int(digits[::-1], 2))
+        return words
+
+    def words_to_rows(self, words: List[int], num_ports: int) -> bytes:
+        size = row_size(num_ports)
+        rows = bytearray(size * self.count)
+        for byte_index in range(size):
+            column = 0
+            for bit in range(min(8, num_ports - 8 * byte_index)):
+                digits = format(words[8 * byte_index + bit], f'0{self.count}b')[::-1].encode()
+                column |= (int.from_bytes(digits, 'little') & self.ones) << bit
+            rows[byte_index::size] = column.to_bytes(self.count, 'little')
+        return bytes(rows)
+
+
+@dataclass
+class VectorRunReport:
+    blueprint_id: BlueprintID
+    num_vectors: int = 0
+    num_mismatches: int = 0
+    mismatches: List[int] = field(default_factory=list) # indexes of the first mismatching vectors
+    seconds: float = 0.0
+
+    @property
+    def vectors_per_second(self) -> float:
+        return self.num_vectors / self.seconds if self.seconds else 0.0
+
+
+def _map_file(f) -> mmap.mmap|None:
+    if os.fstat(f.fileno()).st_size == 0:
+        return None # empty files cannot be memory mapped
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    return mapped
+
+
+def _chunks(mapped: mmap.mmap|None, size: int, chunk_size: int) -> Iterator[Tuple[int, bytes]]:
+    if mapped is None:
+        return
+    for offset in range(0, len(mapped), size * chunk_size):
+        yield offset // size, mapped[offset:offset + size * chunk_size]
+
+
+def run_vectors(blueprint_id: BlueprintID, in_path: str, out_path: str = None, expected_path: str = None,
+                chunk_size: int = 1 << 16, max_reported_mismatches: int = 100, activity: ActivityCounter = None) -> VectorRunReport:
+    """Evaluate every vector of a packed input file, streaming the packed outputs to
+    out_path and/or comparing them with the packed rows of expected_path. With an
+    activity counter (for the same blueprint), the file is evaluated through it, so its
+    report covers the toggles of the whole stream.
+    """
+    compiled = compile_blueprint(blueprint_id)
+    if activity is not None:
+        if activity.blueprint_id != blueprint_id:
+            raise ValueError(f'Activity counter of blueprint {activity.blueprint_id} cannot count the vectors of blueprint {blueprint_id}')
+        compiled = activity
+    in_size, out_size = row_size(compiled.num_inputs), row_size(compiled.num_outputs)
+    report = VectorRunReport(blueprint_id)
+    started = time.perf_counter()
+
+    # outputs are written by a separate thread (file writes release the GIL); the small
+    # queue bounds how far evaluation can run ahead of the disk. An error in the writer
+    # ends the thread and is raised again here.
+    writes: queue.Queue = queue.Queue(maxsize=4)
+    writer_errors: List[BaseException] = []
+    writer_thread = None
+
+    def writer():
+        try:
+            while True:
+                rows = writes.get()
+                if rows is None:
+                    return
+                out_file.write(rows)
+        except BaseException as e:
+            writer_errors.append(e)
+
+    def send(rows: bytes|None) -> bool:
+        # wait for room in the queue, but not for a writer that is gone
+        while writer_thread.is_alive():
+            try:
+                writes.put(rows, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    in_file = in_map = expected_file = expected_map = out_file = None
+    transposers = {}
+    try:
+        in_file = open(in_path, 'rb')
+        in_map = _map_file(in_file)
+        if in_map is not None and len(in_map) % in_size:
+            raise ValueError(f'Error in vector file {in_path}: size {len(in_map)} is not a multiple of the row size {in_size} of blueprint {blueprint_id}')
+        if expected_path is not None:
+            expected_file = open(expected_path, 'rb')
+            expected_map = _map_file(expected_file)
+        if out_path is not None:
+            out_file = open(out_path, 'wb')
+            writer_thread = threading.Thread(target=writer, daemon=True)
+            writer_thread.start()
+
+        for first, rows in _chunks(in_map, in_size, chunk_size):
+            count = len(rows) // in_size
+            if count not in transposers:
+                transposers[count] = _Transposer(count)
+            transposer = transposers[count]
+
+            outputs = compiled.evaluate_packed(transposer.rows_to_words(rows, compiled.num_inputs), count)
+            out_rows = transposer.words_to_rows(outputs, compiled.num_outputs)
+            if out_file is not None and not send(out_rows):
+                raise writer_errors[0]
+
+            if expected_file is not None:
+                expected = expected_map[first * out_size:(first + count) * out_size] if expected_map is not None else b''
+                if expected != out_rows:
+                    for index in range(count):
+                        if expected[index * out_size:(index + 1) * out_size] != out_rows[index * out_size:(index + 1) * out_size]:
+                            report.num_mismatches += 1
+                            if len(report.mismatches) < max_reported_mismatches:
+                                report.mismatches.append(first + index)
+            report.num_vectors += count
+    finally:
+        if writer_thread is not None:
+            send(None)
+            writer_thread.join()
+        for mapped in (in_map, expected_map):
+            if mapped is not None:
+                mapped.close()
+        for f in (in_file, expected_file, out_file):
+            if f is not None:
+                f.close()
+    if writer_errors:
+        raise writer_errors[0]
+
+    report.seconds = time.perf_counter() - started
+    return report
@@ -0,0 +1,186 @@
+from __future__ import annotations
+from typing import List, Tuple, Dict, Union, TextIO
+from array import array
+import re, datetime
+from blueprint import BlueprintID
+from compiler import Wire, CompiledBlueprint, compile_blueprint, generate_simulator
+
+
+# Waveform recording.
+# The recorder compiles a variant of the blueprint's simulation function that also
+# returns the traced wires, so untraced internal values are never materialized. Only
+# value changes are kept: they go into a preallocated ring buffer (step, signal, value)
+# which is written out to a VCD file in chunks whenever it fills up. Without a VCD file
+# the buffer simply keeps the most recent changes.
+
+
+def _set_bits(word: int) -> List[int]:
+    # positions of the 1 bits of a word
+    bits = format(word, 'b')
+    top = len(bits) - 1
+    return [top - match.start() for match in _ONE.finditer(bits)]
+
+
+_ONE = re.compile('1')
+
+
+def _vcd_identifier(index: int) -> str:
+    # VCD identifiers use the printable characters ! to ~
+    identifier = ''
+    while True:
+        identifier += chr(33 + index % 94)
+        index //= 94
+        if index == 0:
+            return identifier
+
+
+class WaveformRecorder:
+    """Simulate a compiled blueprint step by step while recording the value changes of
+    some of its wires (given by hierarchical name, see Netlist.wire_name and Netlist.resolve)
+    """
+
+    def __init__(self, blueprint: Union[BlueprintID, CompiledBlueprint], signals: List[Union[str, Wire]] = None,
+                 vcd_path: str = None, buffer_size: int = 1 << 16, timescale: str = '1ns'):
+        self.compiled = blueprint if isinstance(blueprint, CompiledBlueprint) else compile_blueprint(blueprint)
+        netlist = self.compiled.netlist
+        if signals is None: # by default trace the blueprint's own ports
+            signals = [f'{netlist.blueprint_id}.in{port}' for port in range(netlist.num_inputs)] + \
+                      [f'{netlist.blueprint_id}.out{port}' for port in range(netlist.num_outputs)]
+        self.wires = [netlist.resolve(signal) if isinstance(signal, str) else signal for signal in signals]
+        self.names = [signal if isinstance(signal, str) else netlist.wire_name(signal) for signal in signals]
+        self._simulate = generate_simulator(netlist, self.wires)
+
+        # ring buffer of value changes
+        self.buffer_size = buffer_size
+        self._times = array('Q', bytes(8 * buffer_size))
+        self._signals = array('I', bytes(4 * buffer_size))
+        self._values = bytearray(buffer_size)
+        self._start = 0
+        self._count = 0
+
+        self.time = 0 # number of steps simulated so far
+        self._last: List[int|None] = [None] * len(self.wires) # last recorded value of each signal
+
+        self.timescale = timescale
+        self._vcd: TextIO|None = None
+        if vcd_path is not None:
+            self._vcd = open(vcd_path, 'w')
+            self._write_vcd_header()
+        self._vcd_time = -1
+
+    def __enter__(self) -> WaveformRecorder:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def step(self, inputs: List[bool]) -> List[bool]:
+        """Simulate one step
+        """
+        return [bool(word) for word in self.run_words([1 if value else 0 for value in inputs], 1)]
+
+    def run_words(self, inputs: List[int], width: int) -> List[int]:
+        """Simulate width consecutive steps at once (bit k of each input word is the
+        input of step time + k) and record the changes in time order
+        """
+        if len(inputs) != self.compiled.num_inputs:
+            raise ValueError(f'Incorrect number of inputs provided for evaluation of blueprint {self.compiled.blueprint_id} (expected {self.compiled.num_inputs}, got {len(inputs)})')
+        mask = (1 << width) - 1
+        outputs, traced = self._simulate([word & mask for word in inputs], mask)
+
+        # bit k of a change word is set if the signal differs between step k-1 and k.
+        # The changes of all signals are merged in time order through one sort of
+        # (step * number of signals + signal) keys.
+        num_signals = len(traced)
+        keys = []
+        for signal, word in enumerate(traced):
+            last = self._last[signal]
+            previous = (word << 1) & mask | (last if last is not None else (~word & 1))
+            changed = word ^ previous
+            if changed:
+                keys.extend(step * num_signals + signal for step in _set_bits(changed))
+            self._last[signal] = (word >> (width - 1)) & 1
+        keys.sort()
+
+        self._record([self.time + key // num_signals for key in keys],
+                     [key % num_signals for key in keys],
+                     bytes((traced[key % num_signals] >> (key // num_signals)) & 1 for key in keys))
+        self.time += width
+        return list(outputs)
+
+    def _record(self, times: List[int], signals: List[int], values: bytes):
+        position = 0
+        while position < len(times):
+            if self._count == self.buffer_size:
+                if self._vcd is not None:
+                    self.flush()
+                else: # overwrite the oldest changes
+                    dropped = min(len(times) - position, self.buffer_size)
+                    self._start = (self._start + dropped) % self.buffer_size
+                    self._count -= dropped
+            # copy as much as fits before the end of the buffer in one go
+            index = (self._start + self._count) % self.buffer_size
+            count = min(len(times) - position, self.buffer_size - self._count, self.buffer_size - index)
+            self._times[index:index + count] = array('Q', times[position:position + count])
+            self._signals[index:index + count] = array('I', signals[position:position + count])
+            self._values[index:index + count] = values[position:position + count]
+            self._count += count
+            position += count
+
+    def changes(self) -> List[Tuple[int, str, bool]]:
+        """The changes currently held in the buffer, oldest first
+        """
+        result = []
+        for offset in range(self._count):
+            index = (self._start + offset) % self.buffer_size
+            result.append((self._times[index], self.names[self._signals[index]], bool(self._values[index])))
+        return result
+
+    def _write_vcd_header(self):
+        vcd = self._vcd
+        vcd.write(f'$date {datetime.datetime.now().isoformat()} $end\n')
+        vcd.write('$version LogicSimulator waveform recorder $end\n')
+        vcd.write(f'$timescale {self.timescale} $end\n')
+
+        # nest the signals in one scope per level of the hierarchy
+        scope: List[str] = []
+        for signal, name in sorted(enumerate(self.names), key=lambda item: item[1]):
+            path, _, port = name.rpartition('.')
+            segments = path.replace(' ', '_').split('/')
+            common = 0
+            while common < min(len(scope), len(segments)) and scope[common] == segments[common]:
+                common += 1
+            for _ in range(len(scope) - common):
+                vcd.write('$upscope $end\n')
+            for segment in segments[common:]:
+                vcd.write(f'$scope module {segment} $end\n')
+            scope = segments
+            vcd.write(f'$var wire 1 {_vcd_identifier(signal)} {port.replace(" ", "_")} $end\n')
+        for _ in scope:
+            vcd.write('$upscope $end\n')
+        vcd.write('$enddefinitions $end\n')
+
+    def flush(self):
+        """Write the buffered changes to the VCD file and empty the buffer
+        """
+        if self._vcd is None:
+            return
+        identifiers = [_vcd_identifier(signal) for signal in range(len(self.wires))]
+        chunk = []
+        for offset in range(self._count):
+            index = (self._start + offset) % self.buffer_size
+            time = self._times[index]
+            if time != self._vcd_time:
+                chunk.append(f'#{time}\n')
+                self._vcd_time = time
+            chunk.append(f'{self._values[index]}{identifiers[self._signals[index]]}\n')
+        self._vcd.write(''.join(chunk))
+        self._start = 0
+        self._count = 0
+
+    def close(self):
+        if self._vcd is not None:
+            self.flush()
+            self._vcd.write(f'#{self.time}\n')
+            self._vcd.close()
+            self._vcd = None